@@ -1,11 +1,78 @@
 # coding: utf-8
 
 from collections import OrderedDict
+from itertools import islice, izip
+from operator import itemgetter
 
-from openpyxl import load_workbook, Workbook
-from openpyxl import __version__
 
-openpyxl_version = int(__version__.split(".")[0])
+# openpyxl takes far longer to import than the rest of acrylic put together,
+# so it is only imported once an Excel file is actually read or written.
+def _openpyxl():
+    import openpyxl
+    return openpyxl
+
+
+class _OpenpyxlVersion(object):
+    """
+    openpyxl's major version, which compares, hashes and prints like the
+    int it stands for. openpyxl is only imported (and the version worked
+    out) the first time it is used.
+    """
+
+    def __init__(self):
+        self.__version = None
+
+    def __int__(self):
+        if self.__version is None:
+            self.__version = int(_openpyxl().__version__.split(".")[0])
+        return self.__version
+
+    __index__ = __int__
+
+    def __cmp__(self, other):
+        return cmp(int(self), other)
+
+    def __hash__(self):
+        return hash(int(self))
+
+    def __repr__(self):
+        return repr(int(self))
+
+    __str__ = __repr__
+
+
+openpyxl_version = _OpenpyxlVersion()
+
+_values_only = None
+
+
+def _has_values_only():
+    """
+    openpyxl 2.6 added `iter_rows(values_only=True)`, which yields cell
+    values directly instead of cell objects.
+    """
+    global _values_only
+    if _values_only is None:
+        version = _openpyxl().__version__.split(".")[:2]
+        _values_only = tuple(int(part) for part in version
+                             if part.isdigit()) >= (2, 6)
+    return _values_only
+
+
+def index_headers(header_row):
+    """
+    Maps each header to the index of its (first) column in one pass.
+    Returns the map and a sorted list of the headers that appear more
+    than once.
+    """
+    positions = {}
+    duplicates = set()
+    for i, header in enumerate(header_row):
+        if header in positions:
+            duplicates.add(header)
+        else:
+            positions[header] = i
+    return positions, sorted(duplicates)
 
 
 class UnicodeReader(object):
@@ -20,7 +87,8 @@ class UnicodeReader(object):
 
         ... and then access the intended row in the usual fashion.
         """
-        self.__wb = load_workbook(filename=filename, read_only=True)
+        self.__wb = _openpyxl().load_workbook(filename=filename,
+                                              read_only=True)
         self._sheet = None
         self.change_sheet(sheet_name_or_num)
 
@@ -51,8 +119,96 @@ class UnicodeReader(object):
         return self.__wb.sheetnames
 
     def __iter__(self):
-        for row in self._sheet.rows:
-            yield [cell.value for cell in row]
+        for row in self.iter_rows():
+            yield list(row)
+
+    def iter_rows(self, min_row=1, max_row=None, columns=None):
+        """
+        Iterates through the current sheet, yielding one tuple of cell
+        values per row. This is the fastest way to read a sheet.
+
+        `min_row` and `max_row` are 1-based and inclusive, like Excel's
+        row numbers. `columns` is a list of 0-based column indexes: only
+        those columns are yielded, in that order, and rows are padded with
+        None up to the rightmost one.
+        """
+        min_col = max_col = None
+        getter = None
+        if columns is not None:
+            columns = list(columns)
+            if not columns:
+                return iter(())
+            min_col, max_col = min(columns) + 1, max(columns) + 1
+            if columns != range(min_col - 1, max_col):
+                offsets = [column - min_col + 1 for column in columns]
+                if len(offsets) == 1:
+                    offset = offsets[0]
+                    getter = lambda row: (row[offset],)
+                else:
+                    getter = itemgetter(*offsets)
+
+        if _has_values_only():
+            rows = self._sheet.iter_rows(min_row=min_row, max_row=max_row,
+                                         min_col=min_col, max_col=max_col,
+                                         values_only=True)
+        else:
+            rows = (tuple([cell.value for cell in row])
+                    for row in self._sheet.iter_rows(min_row=min_row,
+                                                     max_row=max_row,
+                                                     min_col=min_col,
+                                                     max_col=max_col))
+        if getter is not None:
+            return (getter(row) for row in rows)
+        return rows
+
+    def read_headers(self):
+        """
+        Returns the first row of the current sheet as a list.
+        """
+        for row in self.iter_rows(max_row=1):
+            return list(row)
+        return []
+
+    def read_columns(self, headers=None, start=0, stop=None,
+                     chunksize=10000):
+        """
+        Reads the current sheet straight into columns and returns
+        `(fields, columns)`. The first row is taken as the headers.
+
+        Pass `headers` to only read that subset of the columns, and
+        `start`/`stop` to only read that range of data rows (0-based, not
+        counting the header row, like a slice).
+
+        Rows are transposed into columns a chunk at a time, so no
+        per-row dict or list is ever built.
+        """
+        header_row = self.read_headers()
+        positions, duplicates = index_headers(header_row)
+        if headers is None:
+            fields = header_row
+            if duplicates:
+                raise Exception("Duplicate headers in Excel sheet: %s" %
+                                duplicates)
+        else:
+            fields = list(headers)
+            missing = [field for field in fields if field not in positions]
+            if missing:
+                raise KeyError("Excel sheet does not have headers: %s" %
+                               missing)
+
+        columns = [[] for _ in fields]
+        if not fields or (stop is not None and stop <= start):
+            return fields, columns
+        max_row = None if stop is None else stop + 1
+        rows = self.iter_rows(min_row=start + 2, max_row=max_row,
+                              columns=[positions[field] for field in fields])
+        while True:
+            chunk = list(islice(rows, chunksize))
+            if not chunk:
+                break
+            for column, values in izip(columns, izip(*chunk)):
+                column.extend(values)
+        return fields, columns
 
 
 class UnicodeWriter(object):
@@ -64,9 +220,9 @@ class UnicodeWriter(object):
             raise Exception(reason)
 
         if openpyxl_version < 2:
-            self.__wb = Workbook()
+            self.__wb = _openpyxl().Workbook()
         else:
-            self.__wb = Workbook(write_only=True)
+            self.__wb = _openpyxl().Workbook(write_only=True)
         self.__active_sheet = None
         self.__active_sheet_name = None
         self.__sheets = {}
@@ -91,11 +247,37 @@ class UnicodeWriter(object):
 
         self.__active_sheet.append(row)
 
-    def writerows(self, rows):
+    def writerows(self, rows, number_formats=None):
+        """
+        Writes every row in `rows`, which may be any iterable, including
+        a generator. In write-only mode rows are streamed to disk, so
+        memory use doesn't grow with the number of rows.
+
+        `number_formats` is an optional list with one Excel number format
+        (like '0.00' or 'yyyy-mm-dd') or None per column. It is declared
+        once for all the rows instead of being inferred for each cell.
+        """
         if not self.__active_sheet:
             self.set_active_sheet("default")
+        append = self.__active_sheet.append
+        if not number_formats or not any(number_formats):
+            for row in rows:
+                append(row)
+            return
+
+        from openpyxl.cell.cell import WriteOnlyCell
+        sheet = self.__active_sheet
+        formatted = [(i, number_format)
+                     for i, number_format in enumerate(number_formats)
+                     if number_format]
         for row in rows:
-            self.__active_sheet.append(row)
+            row = list(row)
+            for i, number_format in formatted:
+                if row[i] is not None:
+                    cell = WriteOnlyCell(sheet, value=row[i])
+                    cell.number_format = number_format
+                    row[i] = cell
+            append(row)
 
     def save(self):
         self.__wb.save(self.filename)
@@ -110,30 +292,23 @@ class UnicodeDictReader(UnicodeReader):
         super(UnicodeDictReader, self).__init__(filename, sheet_name_or_num)
  
     def __set_headers(self):
-        self.__row_num = 0
-        headers = super(UnicodeDictReader, self).__iter__().next()
- 
-        self._index_to_header = OrderedDict()
-        for header in headers:
-            self._index_to_header[headers.index(header)] = header
- 
-        self._header_indexes = sorted(self._index_to_header.keys())
- 
-        if range(len(headers)) != self._header_indexes:
-            raise Exception("There appear to be hidden or 'extra'"
-                            "columns in your *.xls file. This is "
-                            "what ExcelRW sees:\n%s" % unicode(headers))
- 
+        self._headers = self.read_headers()
+
+        _, duplicates = index_headers(self._headers)
+        if duplicates:
+            raise Exception("Duplicate headers in your Excel file: %s. "
+                            "This is what ExcelRW sees:\n%s" %
+                            (duplicates, unicode(self._headers)))
+
     def change_sheet(self, sheet_name_or_num):
         super(UnicodeDictReader, self).change_sheet(sheet_name_or_num)
         self.__set_headers()
 
     def __iter__(self):
-        iterable = super(UnicodeDictReader, self).__iter__()
-        iterable.next()  # burn off the headers
-        for row in iterable:
-            yield OrderedDict([(self._index_to_header[i], cell)
-                               for i, cell in zip(self._header_indexes, row)])
+        headers = self._headers
+        for row in self.iter_rows(min_row=2,
+                                  columns=range(len(headers))):
+            yield OrderedDict(izip(headers, row))
 
 
 class UnicodeDictWriter(UnicodeWriter):
@@ -103,7 +103,9 @@ class UnicodeWriter(object):
         self.encoder = codecs.getincrementalencoder(encoding)()
 
     def writerow(self, row):
+        # Missing values (None) are written as empty cells.
         self.writer.writerow([s.encode("utf-8") if isinstance(s,str)
+                              else "" if s is None
                               else unicode(s).encode("utf-8")
                               for s in row])
         # Fetch UTF-8 output from the queue ...
@@ -1,6 +1,10 @@
 # coding: utf-8
 
+from .cache import ParseCache
 from .datatable import DataTable
+from .expr import col, lit
+from .lazy import LazyTable
+from .stats import describe
 from .utils import excel
 
 """
@@ -0,0 +1,90 @@
+# coding: utf-8
+
+"""
+Built-in aggregators for DataTable.pivot() and crosstab().
+
+Each aggregator takes a list of group keys and the matching list of
+values and returns a dict of key to aggregate, updating running results
+in one pass instead of first collecting every group's values into lists.
+"""
+
+from itertools import izip
+
+
+def _sum(keys, values):
+    totals = {}
+    get = totals.get
+    for key, value in izip(keys, values):
+        totals[key] = get(key, 0) + value
+    return totals
+
+
+def _count(keys, values):
+    counts = {}
+    get = counts.get
+    for key in keys:
+        counts[key] = get(key, 0) + 1
+    return counts
+
+
+def _mean(keys, values):
+    sums = {}
+    for key, value in izip(keys, values):
+        if key in sums:
+            running = sums[key]
+            running[0] += value
+            running[1] += 1
+        else:
+            sums[key] = [value, 1]
+    return dict((key, total / float(count))
+                for key, (total, count) in sums.iteritems())
+
+
+def _min(keys, values):
+    smallest = {}
+    for key, value in izip(keys, values):
+        if key not in smallest or value < smallest[key]:
+            smallest[key] = value
+    return smallest
+
+
+def _max(keys, values):
+    largest = {}
+    for key, value in izip(keys, values):
+        if key not in largest or value > largest[key]:
+            largest[key] = value
+    return largest
+
+
+def _first(keys, values):
+    # Building a dict keeps the last value stored for each key.
+    return dict(izip(reversed(keys), reversed(values)))
+
+
+def _last(keys, values):
+    return dict(izip(keys, values))
+
+
+AGGREGATORS = {'sum': _sum, 'count': _count, 'mean': _mean, 'min': _min,
+               'max': _max, 'first': _first, 'last': _last}
+
+
+def aggregate(aggfunc, keys, values):
+    """
+    Aggregates `values` by `keys`. `aggfunc` is the name of a built-in
+    aggregator, or a function that is passed the list of each group's
+    values.
+    """
+    if isinstance(aggfunc, basestring):
+        if aggfunc not in AGGREGATORS:
+            raise ValueError("Unknown aggregator `%s`. Use one of: %s, or "
+                             "pass a function." %
+                             (aggfunc, ", ".join(sorted(AGGREGATORS))))
+        return AGGREGATORS[aggfunc](keys, values)
+    groups = {}
+    for key, value in izip(keys, values):
+        if key in groups:
+            groups[key].append(value)
+        else:
+            groups[key] = [value]
+    return dict((key, aggfunc(group)) for key, group in groups.iteritems())
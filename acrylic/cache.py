@@ -0,0 +1,217 @@
+# coding: utf-8
+
+"""
+An on-disk cache of parsed files, for DataTable.fromcsv(cache=...) and
+DataTable.fromexcel(cache=...).
+
+A table is cached under the SHA-1 of the file's absolute path, size,
+modification time and inode, and the arguments it was read with, so
+changing the file (or reading it differently) misses the cache. Tables are
+stored pickled, which writes their columns in the compact binary layout of
+`columnar.py`; loading one is many times quicker than parsing the file.
+
+Several processes can share a cache directory:
+
+- entries are written to a temporary file and renamed into place, so a
+  reader never sees half an entry;
+- storing and evicting happen under an exclusive `flock` on the
+  directory's lock file (where `fcntl` exists);
+- an entry evicted while another process is reading it stays readable
+  until that process closes it.
+
+Once the entries add up to more than `max_bytes`, the least recently used
+are removed. Loading an entry marks it as used by touching its mtime.
+"""
+
+import cPickle
+import hashlib
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'acrylic')
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# Bump when the format of cached tables changes, to miss old entries.
+_FORMAT_VERSION = 2
+
+_SUFFIX = '.table'
+
+
+class ParseCache(object):
+    """
+    A directory of cached, parsed tables, holding at most `max_bytes`.
+    `hits` and `misses` count the lookups made through this instance.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, path, args):
+        """
+        The cache key of reading the file at `path` with `args`, a tuple
+        of the reader's arguments.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        identity = (_FORMAT_VERSION, path, stat.st_size, stat.st_mtime,
+                    stat.st_ino, args)
+        return hashlib.sha1(repr(identity)).hexdigest()
+
+    def fetch(self, path, args, parse):
+        """
+        Returns the table cached for reading `path` with `args`, or calls
+        `parse()` and caches what it returns.
+        """
+        key = self.key(path, args)
+        table = self.load(key)
+        if table is not None:
+            self.hits += 1
+            return table
+        self.misses += 1
+        table = parse()
+        self.store(key, table)
+        return table
+
+    def __entry(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def load(self, key):
+        """
+        Returns the table cached under `key`, or None.
+        """
+        entry = self.__entry(key)
+        try:
+            with open(entry, 'rb') as f:
+                table = cPickle.load(f)
+        except IOError:
+            return None
+        except Exception:
+            # Written by an incompatible version; parse the file again.
+            _remove(entry)
+            return None
+        try:
+            os.utime(entry, None)
+        except OSError:  # evicted meanwhile
+            pass
+        return table
+
+    def store(self, key, table):
+        """
+        Caches `table` under `key`, then evicts the least recently used
+        entries until the cache fits in `max_bytes`.
+        """
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:  # made by another process meanwhile
+                if not os.path.isdir(self.directory):
+                    raise
+        data = cPickle.dumps(table, cPickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        handle, temporary = tempfile.mkstemp(dir=self.directory,
+                                             prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            with self.__lock():
+                os.rename(temporary, self.__entry(key))
+                self.__evict()
+        except BaseException:
+            _remove(temporary)
+            raise
+
+    def __lock(self):
+        return _DirectoryLock(os.path.join(self.directory, '.lock'))
+
+    def __entries(self):
+        """
+        (mtime, size, path) of every entry, least recently used first.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def __evict(self):
+        entries = self.__entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def size(self):
+        """
+        The total bytes of the cached entries.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(size for _, size, _ in self.__entries())
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        with self.__lock():
+            for _, _, path in self.__entries():
+                _remove(path)
+
+
+def as_cache(cache):
+    """
+    Turns the `cache` argument of a reader into a ParseCache, or None:
+    True for the default cache, a directory, or a ParseCache.
+    """
+    if not cache:
+        return None
+    if cache is True:
+        return ParseCache()
+    if isinstance(cache, basestring):
+        return ParseCache(cache)
+    return cache
+
+
+class _DirectoryLock(object):
+
+    def __init__(self, path):
+        self.__path = path
+        self.__file = None
+
+    def __enter__(self):
+        self.__file = open(self.__path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        # Closing the file releases the lock.
+        self.__file.close()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
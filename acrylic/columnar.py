@@ -0,0 +1,263 @@
+# coding: utf-8
+
+"""
+A compact binary layout for DataTable columns, shared by pickling and by
+DataTable.share().
+
+`encode_column` returns `(kind, format, num_rows, validity, buffers)`.
+A column whose values are all of one type is encoded as flat buffers:
+
+kind          buffers
+'number'      the bytes of the values, in `format`: the narrowest integer
+              width that holds every value, or 'f8' for floats
+'unicode'     the values joined into one UTF-8 (or raw) blob, preceded by
+'bytes'       the byte offset of every value (n + 1 integers in
+              `format`). Without `offsets`, if no value contains a NUL
+              character the values are joined with NULs instead and
+              `format` is None: smaller and quicker to split, but with
+              no random access
+'dictionary'  for strings with many repeats: one code per row (integers
+              in `format`) and the list of distinct values
+'array'       for columns that already are an `array`: its items
+
+Numbers are stored little-endian, at the width given by their format, so
+encoded columns (and pickled tables) can be read on any machine: 'i1',
+'i2', 'i4' and 'i8' are signed integers of 1 to 8 bytes, and 'f8' a
+double. An 'array' column's format is its typecode followed by its item
+size, like 'l8' or 'H2'. Plain typecodes, like 'l', are read as native
+`array` bytes, as tables were pickled before formats existed.
+
+Missing values (None) are allowed in all of them. In 'number', 'unicode'
+and 'bytes' columns they are stored as 0 or an empty string and recorded
+in `validity`, the column's validity bitmap as a byte string. Any other
+column (mixed types, longs, tuples, ...) is kind 'object' and kept as a
+plain list.
+"""
+
+from array import array
+from itertools import compress, islice, izip
+
+from .nulls import validity_bitmap, validity_mask
+
+import struct
+import sys
+
+_NONE_TYPE = type(None)
+
+_KINDS = {int: 'number', float: 'number', unicode: 'unicode', str: 'bytes'}
+
+_PLACEHOLDERS = {int: 0, float: 0.0, unicode: u"", str: ""}
+
+
+_SWAP_BYTES = sys.byteorder == 'big'
+
+# The `array` typecode for signed integers of each width on this machine.
+_INT_TYPECODES = dict((array(typecode).itemsize, typecode)
+                      for typecode in 'lihb')
+
+_FLOAT_TYPECODES = {4: 'f', 8: 'd'}
+
+_STRUCT_INTS = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+
+
+def narrowest_format(low, high):
+    """
+    The format of the narrowest signed integers that hold every value from
+    `low` to `high`, or None if none does.
+    """
+    for width in sorted(_INT_TYPECODES):
+        limit = 1 << (width * 8 - 1)
+        if -limit <= low and high < limit:
+            return 'i%d' % width
+    return None
+
+
+def itemsize(format):
+    """
+    The number of bytes each value takes in `format`.
+    """
+    if len(format) == 1:
+        return array(format).itemsize
+    return int(format[1:])
+
+
+def _typecode(format):
+    """
+    The `array` typecode that reads `format` on this machine, or None if
+    no type here has its width.
+    """
+    if len(format) == 1:
+        return format
+    code, width = format[0], int(format[1:])
+    if code == 'i':
+        return _INT_TYPECODES.get(width)
+    if code == 'f':
+        return _FLOAT_TYPECODES.get(width)
+    return code if array(code).itemsize == width else None
+
+
+def pack(format, values):
+    """
+    The bytes of `values` (a list or an array) in `format`.
+    """
+    if not isinstance(values, array) or _SWAP_BYTES:
+        values = array(_typecode(format), values)
+        if _SWAP_BYTES:
+            values.byteswap()
+    return values.tostring()
+
+
+def unpack(format, data):
+    """
+    The values in `data`, bytes in `format`: an array, or a list if this
+    machine has no `array` type of their width.
+    """
+    typecode = _typecode(format)
+    if typecode is None:
+        return _unpack_foreign(format, data)
+    values = array(typecode)
+    values.fromstring(data)
+    if _SWAP_BYTES and len(format) > 1:
+        values.byteswap()
+    return values
+
+
+def _unpack_foreign(format, data):
+    code, width = format[0], int(format[1:])
+    if code == 'u':
+        return list(data.decode('utf-32-le' if width == 4 else 'utf-16-le'))
+    struct_code = _STRUCT_INTS[width]
+    if code in 'BHIL':
+        struct_code = struct_code.upper()
+    return list(struct.unpack('<%d%s' % (len(data) // width, struct_code),
+                              data))
+
+
+def _tolist(values):
+    return values.tolist() if isinstance(values, array) else values
+
+
+def _object(column):
+    return 'object', None, len(column), None, (list(column),)
+
+
+def encode_column(column, offsets=True):
+    """
+    Returns `(kind, format, num_rows, validity, buffers)` for `column`.
+    Pass `offsets=False` if the values won't need to be read one at a
+    time.
+    """
+    if isinstance(column, array):
+        format = '%s%d' % (column.typecode, column.itemsize)
+        return 'array', format, len(column), None, (pack(format, column),)
+    types = set(map(type, column))
+    has_nulls = _NONE_TYPE in types
+    types.discard(_NONE_TYPE)
+    if len(types) != 1 or not types.issubset(_KINDS):
+        return _object(column)
+    value_type = types.pop()
+    kind = _KINDS[value_type]
+    num_rows = len(column)
+
+    if kind != 'number':
+        distinct = set(column)
+        if len(distinct) <= num_rows // 2:
+            dictionary = list(distinct)
+            codes = map(dict(izip(dictionary, xrange(len(dictionary))))
+                        .__getitem__, column)
+            format = narrowest_format(0, len(dictionary))
+            return ('dictionary', format, num_rows, None,
+                    (pack(format, codes), dictionary))
+
+    validity = None
+    if has_nulls:
+        validity = str(validity_bitmap(column))
+        placeholder = _PLACEHOLDERS[value_type]
+        column = [placeholder if value is None else value
+                  for value in column]
+
+    if value_type is float:
+        return kind, 'f8', num_rows, validity, (pack('f8', column),)
+    if value_type is int:
+        format = narrowest_format(min(column), max(column)) \
+            if column else 'i1'
+        if format is None:
+            return _object(column)
+        return kind, format, num_rows, validity, (pack(format, column),)
+
+    separator = u"\0" if value_type is unicode else "\0"
+    if not offsets and not any(separator in value for value in column):
+        blob = separator.join(column)
+        if value_type is unicode:
+            blob = blob.encode('utf-8')
+        return kind, None, num_rows, validity, (blob,)
+
+    encoded = ([value.encode('utf-8') for value in column]
+               if value_type is unicode else column)
+    lengths = map(len, encoded)
+    format = narrowest_format(0, sum(lengths))
+    offsets = [0] * (num_rows + 1)
+    position = 0
+    for i, length in enumerate(lengths, 1):
+        position += length
+        offsets[i] = position
+    return kind, format, num_rows, validity, (pack(format, offsets),
+                                              "".join(encoded))
+
+
+def split_blob(blob, offsets, decode):
+    """
+    Cuts `blob` into values at `offsets` (relative to the start of the
+    blob), decoding them from UTF-8 if `decode`.
+    """
+    if decode:
+        text = blob.decode('utf-8')
+        if len(text) == len(blob):
+            # Only ASCII, so byte offsets are character offsets too.
+            blob, decode = text, False
+    values = [blob[start:end]
+              for start, end in izip(offsets, islice(offsets, 1, None))]
+    if decode:
+        values = [value.decode('utf-8') for value in values]
+    return values
+
+
+def apply_validity(values, validity, num_rows):
+    """
+    Sets the values that `validity` marks as missing to None, in place.
+    """
+    missing = [not valid for valid in validity_mask(validity, num_rows)]
+    for i in compress(xrange(num_rows), missing):
+        values[i] = None
+    return values
+
+
+def decode_column(kind, format, num_rows, validity, buffers):
+    """
+    Rebuilds the list that `encode_column` encoded.
+    """
+    if kind == 'object':
+        return buffers[0]
+    if format is None:
+        blob = buffers[0]
+        column = (blob.decode('utf-8') if kind == 'unicode' else blob) \
+            .split("\0")
+        if validity is not None:
+            apply_validity(column, bytearray(validity), num_rows)
+        return column
+
+    values = unpack(format, buffers[0])
+    if kind == 'array':
+        if isinstance(values, array):
+            return values
+        return array(format[0], u"".join(values) if format[0] == 'u'
+                     else values)
+    if kind == 'dictionary':
+        return map(buffers[1].__getitem__, values)
+    if kind == 'number':
+        column = _tolist(values)
+    else:
+        column = split_blob(buffers[1], values, kind == 'unicode')
+    if validity is not None:
+        apply_validity(column, bytearray(validity), num_rows)
+    return column
@@ -10,12 +10,38 @@ create an object with:
 
 This concept was borrowed from the Python standard library's `namedtuple`
 implementation.
+
+Constructors are cached by their fields, so rows with the same fields
+usually share one class, and rows pickle as their field tuple and values.
 """
 
+from collections import OrderedDict
 from itertools import izip
 
+# How many constructors, for the most recently used sets of fields, are
+# kept. Rows made by an evicted constructor keep working; new rows with
+# those fields just get a new class.
+CONSTRUCTOR_CACHE_SIZE = 256
+
+_constructors = OrderedDict()
+
 
 def datarow_constructor(fields):
+    fields = tuple(fields)
+    constructor = _constructors.pop(fields, None)
+    if constructor is None:
+        constructor = _make_constructor(fields)
+    _constructors[fields] = constructor
+    while len(_constructors) > CONSTRUCTOR_CACHE_SIZE:
+        _constructors.popitem(last=False)
+    return constructor
+
+
+def _restore_datarow(fields, values):
+    return datarow_constructor(fields)(values)
+
+
+def _make_constructor(fields):
 
     class DataRow(tuple):
 
@@ -26,6 +52,9 @@ def datarow_constructor(fields):
         def __new__(cls, values):
             return tuple.__new__(cls, tuple(values))
 
+        def __reduce__(self):
+            return _restore_datarow, (self._fields, tuple(self))
+
         def __repr__(self):
             return 'DataRow(%s)' % ', '.join([unicode(item) for item in self])
 
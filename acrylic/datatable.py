@@ -4,18 +4,44 @@ from __future__ import division, print_function
 from array import array
 from collections import OrderedDict
 from cStringIO import StringIO
-from itertools import chain, compress, izip
-from random import random, randrange, shuffle
+from itertools import chain, compress, imap, izip
+from random import Random
 from types import GeneratorType
 
+from .aggregates import aggregate
+from .cache import as_cache
+from .columnar import decode_column, encode_column
+from .compare import (TableDiff, changed_pairs, columns_equal, fingerprint,
+                      unique_index)
 from .datarow import datarow_constructor
+from .expr import Expr
 from .groupby import GroupbyTable
-from .utils import unique_everseen
+from .keysets import as_membership, key_set, row_keys
+from .lazy import LazyTable
+from .memory import measure_column
+from .nulls import (CSV_NULL_VALUES, append_validity, null_count,
+                    mask_nulls, replace_nulls, split_nulls, validity_bitmap,
+                    validity_mask)
+from .parallel import parallel_apply, pool_map
+from .profiling import traced
+from .render import REPR_MAX_ROWS, render, render_string
+from .shared import SharedColumn, SharedTable, indexable, take
+from .stats import DEFAULT_QUANTILES, describe
+from .utils import excel, reservoir_sample, unique_everseen
+from .window import Window
 
 from . import ExcelRW
 from . import UnicodeRW
 
 import csv
+import multiprocessing
+import sys
+import traceback
+import warnings
+
+# How many derived results (distinct values, groups, sort orders, join
+# indexes) each DataTable remembers until it next changes.
+MEMO_MAX_ENTRIES = 32
 
 
 class DataTable(object):
@@ -36,6 +62,10 @@ class DataTable(object):
         acts as a filter and selects the subset of headers you want included.
         If you pass in a header that isn't in the data, there will be an error.
 
+        Values of `None` are missing values (nulls). Each column keeps a
+        validity bitmap of which of its rows are null, which `where*`,
+        `sort`, `groupby` and `join` respect.
+
         ---
 
         If your data is CSV, TSV, or similar format, you can even copy-paste
@@ -43,6 +73,17 @@ class DataTable(object):
         the DataTable.fromcsvstring() method for details.
         """
         self.__data = OrderedDict()
+        # field -> (column, length, validity bitmap), where the bitmap is
+        # None if the column has no nulls. It only holds while the field
+        # still has that column at that length; columns that aren't in
+        # here haven't been checked yet.
+        self.__nulls = {}
+        # Bumped on every change, which also drops the memoized results.
+        self.__version = 0
+        self.__memo = OrderedDict()
+        # The row count and column identities the memoized results were
+        # computed for, to notice changes made behind the table's back.
+        self.__memo_shape = None
 
         if iterable is None:
             # TODO: this exists so that we can create a DataTable
@@ -148,8 +189,20 @@ class DataTable(object):
         for old_name, new_name in izip(self.fields, new_fieldnames):
             # use pop instead of `del` in case old_name == new_name
             self.__data[new_name] = self.__data.pop(old_name)
+            if old_name in self.__nulls:
+                self.__nulls[new_name] = self.__nulls.pop(old_name)
+        self.__changed()
+
+    @property
+    def version(self):
+        """
+        A counter that goes up every time the table is changed through its
+        methods.
+        """
+        return self.__version
 
     @classmethod
+    @traced
     def fromcolumns(cls, fields, columns):
         if len(fields) != len(columns):
             raise Exception("When constructing .fromcolumns, the number of "
@@ -161,16 +214,38 @@ class DataTable(object):
         return new_table
 
     @classmethod
-    def fromcsv(cls, path, delimiter=",", headers=None):
+    @traced
+    def fromcsv(cls, path, delimiter=",", headers=None,
+                null_values=CSV_NULL_VALUES, cache=None):
+        """
+        Constructs a new DataTable from a CSV file.
+
+        Cells matching one of `null_values` (by default, empty cells) are
+        read as missing values. Pass `null_values=()` to keep them as
+        empty strings.
+
+        Pass `cache=True` (or a cache directory, or a ParseCache) to keep
+        the parsed table on disk and load it from there the next time the
+        same, unchanged file is read with the same arguments.
+        """
+        cache = as_cache(cache)
+        if cache is not None:
+            return cache.fetch(
+                path, ('csv', cls.__name__, delimiter, headers, null_values),
+                lambda: cls.fromcsv(path, delimiter, headers, null_values))
+
         f = open(path, 'r')
         reader = UnicodeRW.UnicodeDictReader(f,
                                              delimiter=delimiter)
         new_table = cls(reader, headers=headers)
         f.close()
+        new_table.__replace_nulls(null_values)
         return new_table
 
     @classmethod
-    def fromcsvstring(cls, csvstring, delimiter=",", quotechar="\""):
+    @traced
+    def fromcsvstring(cls, csvstring, delimiter=",", quotechar="\"",
+                      null_values=CSV_NULL_VALUES):
         """
         Takes one string that represents the entire contents of the CSV
         file, or similar delimited file.
@@ -207,6 +282,9 @@ class DataTable(object):
         csv.QUOTE_NONE (as well as the r-prefix on r'''string''') are vital
         since we're copy-pasting directly from Excel. The string should be
         treated as "literally" ("raw") as possible.
+
+        `null_values` works as it does in `fromcsv`. Missing values don't
+        stop a column from being parsed as numbers.
         """
         if not isinstance(csvstring, basestring):
             raise Exception("If trying to construct a DataTable with "
@@ -221,11 +299,13 @@ class DataTable(object):
                               quoting=csv.QUOTE_NONE)
         new_datatable = cls((s.decode('utf-8') for s in row)
                             for row in csv_data)
+        new_datatable.__replace_nulls(null_values)
         for field in new_datatable.fields:
             new_datatable[field] = parse_column(new_datatable[field])
         return new_datatable
 
     @classmethod
+    @traced
     def fromdict(cls, datadict):
         """
         Constructs a new DataTable using a dictionary of the format:
@@ -244,7 +324,9 @@ class DataTable(object):
         return new_datatable
 
     @classmethod
-    def fromexcel(cls, path, sheet_name_or_num=0, headers=None):
+    @traced
+    def fromexcel(cls, path, sheet_name_or_num=0, headers=None,
+                  start=0, stop=None, cache=None):
         """
         Constructs a new DataTable from an Excel file.
 
@@ -252,7 +334,12 @@ class DataTable(object):
 
         Headers will be inferred automatically, but if you'd prefer
         to load only a subset of all the headers, pass in a list of the
-        headers you'd like as `headers`.
+        headers you'd like as `headers`. Only those columns are read.
+
+        Pass `start` and `stop` to load only that range of data rows
+        (0-based, not counting the header row, like a slice).
+
+        `cache` works as it does in `fromcsv`.
 
         ---
 
@@ -262,8 +349,176 @@ class DataTable(object):
             reader.change_sheet('default')
             data = DataTable(reader)
         """
-        reader = ExcelRW.UnicodeDictReader(path, sheet_name_or_num)
-        return cls(reader, headers=headers)
+        cache = as_cache(cache)
+        if cache is not None:
+            return cache.fetch(
+                path, ('excel', cls.__name__, sheet_name_or_num, headers,
+                       start, stop),
+                lambda: cls.fromexcel(path, sheet_name_or_num, headers,
+                                      start, stop))
+
+        reader = ExcelRW.UnicodeReader(path, sheet_name_or_num)
+        fields, columns = reader.read_columns(headers, start, stop)
+        validate_fields(fields)
+        return cls.fromcolumns(fields, columns)
+
+    @classmethod
+    @traced
+    def fromexcel_all(cls, path, workers=None, errors=None):
+        """
+        Loads every sheet of an Excel file and returns an OrderedDict of
+        sheet name to DataTable, in the workbook's sheet order.
+
+        Sheets are parsed in parallel in a pool of `workers` processes
+        (by default, one per CPU). With `workers=1` the workbook is opened
+        once and read in this process.
+
+        A sheet that can't be loaded doesn't stop the others. It is left
+        out of the result and reported: pass a dict as `errors` to collect
+        sheet name -> traceback, or else a warning is issued per sheet.
+        """
+        reader = ExcelRW.UnicodeReader(path)
+        sheetnames = reader.sheetnames
+        if workers == 1:
+            outcomes = []
+            for sheetname in sheetnames:
+                try:
+                    reader.change_sheet(sheetname)
+                    outcomes.append((False, reader.read_columns()))
+                except Exception:
+                    outcomes.append((True, traceback.format_exc()))
+        else:
+            outcomes = pool_map(_read_excel_sheet,
+                                [(path, sheetname)
+                                 for sheetname in sheetnames], workers)
+        return cls.__collect_sheets(sheetnames, outcomes, errors)
+
+    @classmethod
+    @traced
+    def fromexcel_many(cls, paths, sheet_name_or_num=0, workers=None,
+                       errors=None):
+        """
+        Loads the same sheet from many Excel files and returns an
+        OrderedDict of path to DataTable, in the order of `paths`.
+
+        `workers` and `errors` work as they do in `fromexcel_all`.
+        """
+        paths = list(paths)
+        outcomes = pool_map(_read_excel_sheet,
+                            [(path, sheet_name_or_num) for path in paths],
+                            workers)
+        return cls.__collect_sheets(paths, outcomes, errors)
+
+    @classmethod
+    def __collect_sheets(cls, names, outcomes, errors):
+        tables = OrderedDict()
+        for name, (failed, outcome) in izip(names, outcomes):
+            if not failed:
+                try:
+                    validate_fields(outcome[0])
+                except Exception:
+                    failed, outcome = True, traceback.format_exc()
+            if failed:
+                if errors is not None:
+                    errors[name] = outcome
+                else:
+                    warnings.warn("Could not load `%s`: %s" %
+                                  (name, outcome.strip().splitlines()[-1]))
+                continue
+            tables[name] = cls.fromcolumns(*outcome)
+        return tables
+
+    def __replace_nulls(self, null_values):
+        if not null_values:
+            return
+        for field in self.fields:
+            self[field] = replace_nulls(self.__data[field], null_values)
+
+    def __known_bitmap(self, field):
+        """
+        The `(bitmap,)` known for `field`, or None if it hasn't been worked
+        out for the column `field` has now, at its current length.
+        """
+        known = self.__nulls.get(field)
+        if known is None:
+            return None
+        column, num_rows, bitmap = known
+        if column is not self.__data[field] or num_rows != len(column):
+            return None
+        return (bitmap,)
+
+    def __bitmap(self, field):
+        """
+        The validity bitmap of `field`, worked out the first time it's
+        needed, and again if the column is replaced or changes length
+        (say, through another table sharing it).
+        """
+        known = self.__known_bitmap(field)
+        if known is not None:
+            return known[0]
+        column = self.__data[field]
+        bitmap = validity_bitmap(column)
+        self.__nulls[field] = (column, len(column), bitmap)
+        return bitmap
+
+    def __has_no_nulls(self, field):
+        """
+        True if `field` is known not to have any nulls.
+        """
+        return self.__known_bitmap(field) == (None,)
+
+    def __put(self, field, column, has_no_nulls=False):
+        """
+        Stores `column` without checks. Pass `has_no_nulls` if it is known
+        to have no nulls, e.g. when it was gathered from a column without
+        nulls; otherwise its bitmap is worked out when it's first needed.
+        """
+        self.__data[field] = column
+        if has_no_nulls:
+            self.__nulls[field] = (column, len(column), None)
+        else:
+            self.__nulls.pop(field, None)
+        self.__changed()
+
+    def __changed(self):
+        self.__version += 1
+        self.__memo.clear()
+
+    def __make_writable(self):
+        """
+        Replaces any read-only SharedColumns with lists of their values,
+        before the columns are changed in place.
+        """
+        for field, column in self.__data.items():
+            if isinstance(column, SharedColumn):
+                self.__data[field] = column.tolist()
+                self.__nulls.pop(field, None)
+
+    def __memoized(self, key, compute):
+        """
+        Returns `compute()`, remembered under `key` until the table next
+        changes. Only the `MEMO_MAX_ENTRIES` most recently used results
+        are kept. Memoized results are shared, so callers must not mutate
+        them.
+
+        Results are also dropped if the number of rows or any column
+        object has changed since they were computed, which catches columns
+        shared with another table that was changed. Values changed in
+        place can't be noticed; see `invalidate_cache`.
+        """
+        memo = self.__memo
+        shape = (len(self), map(id, self.__data.itervalues()))
+        if shape != self.__memo_shape:
+            memo.clear()
+            self.__memo_shape = shape
+        if key in memo:
+            result = memo.pop(key)
+        else:
+            result = compute()
+        memo[key] = result
+        while len(memo) > MEMO_MAX_ENTRIES:
+            memo.popitem(last=False)
+        return result
 
     def __add__(self, other_datatable):
         return self.concat(other_datatable)
@@ -273,25 +528,30 @@ class DataTable(object):
 
     def __delitem__(self, key):
         del self.__data[key]
+        self.__nulls.pop(key, None)
+        self.__changed()
 
     def __eq__(self, other):
         """
-        Note that there is a bug (in my opinion) where two OrderedDicts
-        are considered equal even if one dict has more key-value pairs
-        after the initial matching set.
+        Two DataTables are equal if they have the same number of rows and
+        of fields, and their columns, in order, hold equal values. Field
+        names aren't compared.
 
-        The line where we compare the length of the two DataTables and
-        the number of keys is meant to protect against this bug.
+        The columns are compared one at a time rather than row by row, and
+        the comparison stops at the first column that differs.
         """
         if not isinstance(other, DataTable):
             raise TypeError("Cannot compare DataTables with `%s` "
                             "for equality" % type(other))
         if len(self) != len(other) or len(self.fields) != len(other.fields):
             return False
-        for selfrow, otherrow in izip(self, other):
-            if selfrow != otherrow:
-                return False
-        return True
+        return all(columns_equal(column, other_column)
+                   for column, other_column
+                   in izip(self.__data.itervalues(),
+                           other.__data.itervalues()))
+
+    def __ne__(self, other):
+        return not self == other
 
     def __getitem__(self, item):
         """
@@ -305,7 +565,8 @@ class DataTable(object):
             start, stop, step = item.indices(len(self))
             sliced_table = DataTable()
             for field in self.fields:
-                sliced_table[field] = self.__data[field][start:stop:step]
+                sliced_table.__put(field, self.__data[field][start:stop:step],
+                                   self.__has_no_nulls(field))
             return sliced_table
         elif isinstance(item, (list, tuple)):
             return [self.__getitem__(colname) for colname in item]
@@ -325,8 +586,19 @@ class DataTable(object):
         else:
             return len(self.__data.viewvalues().__iter__().next())
 
+    def __reduce__(self):
+        """
+        Pickles the table column by column in the compact layout of
+        `columnar.py`: typed arrays for numbers, one blob for strings, and
+        codes into a list of distinct values for repetitive strings.
+        """
+        return _restore_table, (self.__class__, self.fields,
+                                [encode_column(self.__data[field],
+                                               offsets=False)
+                                 for field in self.fields])
+
     def __repr__(self):
-        return str(self)
+        return render_string(self, max_rows=REPR_MAX_ROWS).encode('utf-8')
 
     def __setitem__(self, fieldname, column):
         """
@@ -336,16 +608,17 @@ class DataTable(object):
 
         1. If the column name doesn't exist, it will be created.
         2. If the column value provided is a tuple, it will be cast to a list.
-        3. If the column value isn't a list, tuple, or array, it will
-           be assumed that you're trying to set a whole column to some scalar
-           value. For example:
+        3. If the column value isn't a list, tuple, array, or SharedColumn,
+           it will be assumed that you're trying to set a whole column to
+           some scalar value. For example:
 
            dt['another_column'] = True
 
            ... will set the entire column, for the length of the table, equal
            to `True`.
+        4. `None` values in the column are missing values.
         """
-        if not isinstance(column, (list, array)):
+        if not isinstance(column, (list, array, SharedColumn)):
             if isinstance(column, tuple):
                 column = list(column)
             else:
@@ -353,7 +626,7 @@ class DataTable(object):
         if self.__data and len(column) != len(self):
             raise Exception("New column length (%s) must match length "
                             "of table (%s)" % (len(column), len(self)))
-        self.__data[fieldname] = column
+        self.__put(fieldname, column)
 
     def __str__(self):
         return unicode(self).encode('utf-8')
@@ -361,45 +634,13 @@ class DataTable(object):
     def __unicode__(self):
         return self.pretty
 
-    def __print_table(self, row_delim, header_delim=None,
-                      header_pad=u"", pad=u""):
-        """
-        row_delim         default delimiter inserted between columns of every
-                          row in the table.
-        header_delim      delimiter inserted within the headers. by default
-                          takes the value of `row_delim`
-        header_pad        put on the sides of the row of headers.
-        pad               put on the sides of every row.
-        """
-        if header_delim is None:
-            header_delim = row_delim
-        num_cols = len(self.fields)
-        accumulator = ((u"%s" + header_delim) * num_cols)[:-len(header_delim)]
-        accumulator = ((header_pad + accumulator + header_pad + u"\n") %
-                       tuple(self.fields))
-        for datarow in self:
-            rowstring = ((u"%s" + row_delim) * num_cols)[:-len(row_delim)]
-            rowstring = (pad + rowstring + pad + u"\n") % tuple(datarow)
-            accumulator += rowstring
-        return accumulator[:-1]
-
     @property
     def html(self):
-        accumulator = u"<table>"
-        accumulator += u"<tr>" + u"".join([u"<th>"+field+u"</th>"
-                                           for field in self.fields]) + u"</tr>"
-        for datarow in self:
-            accumulator += u"<tr>" + u"".join([u"<td>"+unicode(row)+u"</td>"
-                                               for row in datarow]) + u"</tr>"
-        return accumulator + u"</table>"
+        return render_string(self, 'html')
 
     @property
     def jira(self):
-        header, row = u"||", u"|"
-        return self.__print_table(row_delim=row,
-                                  header_delim=header,
-                                  header_pad=header,
-                                  pad=row)
+        return render_string(self, 'jira')
 
     # TODO: print a "prettytable" style table
     @property
@@ -408,7 +649,21 @@ class DataTable(object):
 
     @property
     def t(self):
-        return self.__print_table(u"\t")
+        return render_string(self, 't')
+
+    def render(self, out, format='t', max_rows=None):
+        """
+        Writes the table to `out`, a file-like object, a chunk of rows at a
+        time: tab-separated, or in 'jira' or 'html' `format`. Pass
+        `max_rows` to only write the first and last rows, followed by the
+        size of the table. `repr()` shows the table this way, with at
+        most REPR_MAX_ROWS rows.
+        ---
+        with open('table.txt', 'w') as f:
+            data.render(f)
+        data.render(sys.stdout, max_rows=10)
+        """
+        render(self, out, format, max_rows)
 
     def append(self, row):
         """
@@ -426,7 +681,11 @@ class DataTable(object):
         DataRows and namedtuples' `_fields` protected class attribute is
         checked for the field names. Those are checked against the DataTable
         and then appended to the relevant columns using those field names.
+
+        Columns read from shared memory (see `share`) are first copied into
+        lists, as they are read-only.
         """
+        self.__make_writable()
         if isinstance(row, dict):
             if self.fields and not set(row.keys()) == set(self.fields):
                 raise Exception("Cannot append a dict to DataTable without "
@@ -474,28 +733,68 @@ class DataTable(object):
             raise Exception("Unable to append type `%s` to DataTable" %
                             type(row))
 
-    def apply(self, func, *fields):
+        for field, column in self.__data.iteritems():
+            # Extend bitmaps that were worked out just before this row.
+            known = self.__nulls.pop(field, None)
+            if (known is not None and known[0] is column and
+                    known[1] == len(column) - 1):
+                self.__nulls[field] = (column, len(column), append_validity(
+                    known[2], len(column) - 1, column[-1] is not None))
+        self.__changed()
+
+    @traced
+    def apply(self, func, *fields, **kwargs):
         """
         Applies the function, `func`, to every row in the DataTable.
 
         If no fields are supplied, the entire row is passed to `func`.
         If fields are supplied, the values at all of those fields
         are passed into func in that order.
+
+        `func` may also be an expression built with `acrylic.col`, which
+        is compiled once and evaluated directly over the columns.
+
+        Pass `workers=N` to split the rows into chunks of `chunksize` rows
+        and run `func` on them in N processes. `func` must be picklable
+        (defined at the top level of a module). Results keep the row order,
+        and a failure in a worker is raised as a ParallelApplyError naming
+        the failing row. Small tables are always run serially, and raise
+        `func`'s own exceptions.
         ---
         data['diff'] = data.apply(short_diff, 'old_count', 'new_count')
-        """
-        results = []
-        for row in self:
-            if not fields:
-                results.append(func(row))
-            else:
-                if any(field not in self for field in fields):
-                    for field in fields:
-                        if field not in self:
-                            raise Exception("Column `%s` does not exist "
-                                            "in DataTable" % field)
-                results.append(func(*[row[field] for field in fields]))
-        return results
+        data['total'] = data.apply(col('price') * col('quantity'))
+        data['geo'] = data.apply(geocode, 'address', workers=8)
+        """
+        workers = kwargs.pop('workers', None)
+        chunksize = kwargs.pop('chunksize', None)
+        if kwargs:
+            raise TypeError("Unknown keyword args passed into `apply`: %s\n"
+                            % kwargs)
+
+        if isinstance(func, Expr):
+            if fields:
+                raise Exception("Expressions name their own columns; "
+                                "don't pass fields to `apply`.")
+            return func.evaluate(self)
+        for field in fields:
+            if field not in self:
+                raise Exception("Column `%s` does not exist "
+                                "in DataTable" % field)
+
+        if workers is not None and workers > 1:
+            if fields:
+                return parallel_apply(func, self[list(fields)],
+                                      workers=workers, chunksize=chunksize)
+            return parallel_apply(func, self[self.fields],
+                                  rowfields=self.fields, workers=workers,
+                                  chunksize=chunksize)
+
+        if not fields:
+            return [func(row) for row in self]
+        if len(fields) == 1:
+            return [func(value) for value in self.__data[fields[0]]]
+        return [func(*values)
+                for values in izip(*[self.__data[field] for field in fields])]
 
     def col(self, col_name_or_num):
         """
@@ -509,6 +808,7 @@ class DataTable(object):
                                  col_name_or_num)
             return self.__data[self.fields[col_name_or_num]]
 
+    @traced
     def concat(self, other_datatable, inplace=False):
         """
         Concatenates two DataTables together, as long as column names
@@ -536,42 +836,246 @@ class DataTable(object):
                             (self.fields, other_datatable.fields))
 
         if inplace:
-            for field in self.fields:
-                self.__data[field] = self[field] + other_datatable[field]
-            return self
+            target_table = self
         else:
-            new_table = DataTable()
-            for field in self.fields:
-                new_table[field] = self[field] + other_datatable[field]
-            return new_table
+            target_table = DataTable()
+        for field in self.fields:
+            target_table.__put(field, self[field] + other_datatable[field],
+                               self.__has_no_nulls(field) and
+                               other_datatable.__has_no_nulls(field))
+        return target_table
 
+    @traced
     def copy(self):
-        return self.fromdict(self.__data)
+        """
+        Returns a new DataTable with copies of this table's columns, so
+        changing one table leaves the other alone.
+        """
+        new_table = type(self)()
+        for field, column in self.__data.iteritems():
+            new_table.__put(field, column[:], self.__has_no_nulls(field))
+        return new_table
 
-    def distinct(self, fieldname, key=None):
+    @traced
+    def crosstab(self, index, columns):
+        """
+        Counts the rows with each combination of values at `index` and
+        `columns`: a `pivot` with one row per `index` value, one column per
+        `columns` value, and a count in every cell (0 if none).
         """
-        Returns the unique values seen at `fieldname`.
+        return self.pivot(index, columns, aggfunc='count', fill=0)
+
+    @traced
+    def describe(self, fields=None, quantiles=DEFAULT_QUANTILES):
         """
-        return tuple(unique_everseen(self[fieldname], key=key))
+        Returns a DataTable with one row of summary statistics per field
+        (or just `fields`), computed in a single pass over each column:
+        count, nulls, distinct, min, max, mean, std, and the estimated
+        quantiles in `quantiles` (as columns `q25`, `q50`, `q75`, ...).
 
-    def groupby(self, *groupfields):
+        Mean, std and quantiles are None for columns that aren't entirely
+        numbers.
+
+        To describe a table too big to load at once, pass an iterable of
+        DataTable chunks to `acrylic.describe`. Only one chunk is held at a
+        time; beyond 10,000 distinct values, distinct counts are then
+        estimated.
+        ---
+        print data.describe(['price', 'quantity'])
+        """
+        return describe([self], fields, quantiles)
+
+    @traced
+    def diff(self, other, key):
+        """
+        Compares this table with `other`, a newer version of it, matching
+        rows by their value at `key` (a field, or a list of fields). Both
+        tables must have the same fields, in any order, and each key may
+        appear only once in each; a missing key value counts as a key like
+        any other.
+
+        Returns a TableDiff of three DataTables, with rows in table order:
+        `added` (rows of `other` whose key isn't in this table), `removed`
+        (rows of this table whose key isn't in `other`) and `changed` (rows
+        of `other` whose key is in this table, but whose values differ).
+        ---
+        diff = yesterday.diff(today, 'orderid')
+        print len(diff.added), len(diff.removed), len(diff.changed)
+        previous = yesterday.semijoin(diff.changed, 'orderid')
+        """
+        if not isinstance(other, DataTable):
+            raise TypeError("Can only diff with a DataTable, not a %s" %
+                            type(other))
+        if set(self.fields) != set(other.fields):
+            raise ValueError("Can only diff tables with the same fields; "
+                             "only one has: %s" %
+                             sorted(set(self.fields) ^ set(other.fields)))
+        fields = [key] if isinstance(key, basestring) else list(key)
+        missing = [field for field in fields if field not in self]
+        if missing:
+            raise KeyError("DataTable does not have fields: %s" % missing)
+
+        keys = list(row_keys(self[fields]))
+        other_keys = list(row_keys(other[fields]))
+        index = unique_index(keys, "this table")
+        other_index = unique_index(other_keys, "the other table")
+
+        removed = [i for i, row_key in enumerate(keys)
+                   if row_key not in other_index]
+        added = []
+        paired, other_paired = [], []
+        for j, row_key in enumerate(other_keys):
+            if row_key in index:
+                paired.append(index[row_key])
+                other_paired.append(j)
+            else:
+                added.append(j)
+
+        values = [field for field in self.fields if field not in fields]
+        changed = compress(other_paired,
+                           changed_pairs(self[values], other[values],
+                                         paired, other_paired))
+        return TableDiff(other.take(added), self.take(removed),
+                         other.take(list(changed)))
+
+    def __dedupe(self, fields, keep, count):
+        """
+        Returns the positions of the rows to keep, one per distinct
+        combination of values at `fields`, in row order. If `count`, also
+        returns how many rows had each combination.
+        """
+        if keep not in ('first', 'last'):
+            raise ValueError("`keep` must be 'first' or 'last', not `%s`" %
+                             keep)
+        return self.__memoized(
+            ('dedupe', tuple(fields), keep, bool(count)),
+            lambda: self.__dedupe_positions(fields, keep, count))
+
+    def __dedupe_positions(self, fields, keep, count):
+        columns = self[list(fields)]
+        keys = columns[0] if len(columns) == 1 else zip(*columns)
+        num_rows = len(keys)
+        # Building a dict keeps the last position stored for each key.
+        if keep == 'last':
+            kept = dict(izip(keys, xrange(num_rows)))
+        else:
+            kept = dict(izip(reversed(keys), xrange(num_rows - 1, -1, -1)))
+        positions = sorted(kept.itervalues())
+        if not count:
+            return positions, None
+        counts = dict.fromkeys(kept, 0)
+        for key in keys:
+            counts[key] += 1
+        return positions, [counts[keys[i]] for i in positions]
+
+    @traced
+    def distinct(self, *fields, **kwargs):
+        """
+        Returns the unique values seen at one field, as a tuple, in the
+        order they were first seen. Pass `key` to compare values by
+        `key(value)` instead.
+
+        With more than one field, returns a DataTable of the unique
+        combinations of values at those fields, in the order they were
+        first seen. Pass `count='column_name'` to add a column counting
+        the rows with each value or combination (this also returns a
+        DataTable for a single field).
+        ---
+        data.distinct('color')
+        data.distinct('color', 'size', count='num_orders')
+        """
+        key = kwargs.pop('key', None)
+        count = kwargs.pop('count', None)
+        if kwargs:
+            raise TypeError("Unknown keyword args passed into `distinct`: %s\n"
+                            % kwargs)
+        if not fields:
+            raise Exception("Must pass in at least one field.")
+
+        if len(fields) == 1 and count is None:
+            column = self[fields[0]]
+            return self.__memoized(
+                ('distinct', fields[0], key),
+                lambda: tuple(unique_everseen(column, key=key)))
+        if key is not None:
+            raise Exception("`key` can only be used with a single field.")
+        positions, counts = self.__dedupe(fields, 'first', count)
+        distinct_table = DataTable.fromcolumns(
+            fields, [take(column, positions)
+                     for column in self[list(fields)]])
+        if count is not None:
+            distinct_table[count] = list(counts)
+        return distinct_table
+
+    @traced
+    def drop_duplicates(self, fields=None, keep='first', count=None):
+        """
+        Returns a new DataTable without duplicate rows. Rows are
+        duplicates if they have the same values at `fields` (by default,
+        at every field). Of each set of duplicates, the `first` or `last`
+        row is kept, per `keep`. Kept rows stay in their original order.
+
+        Pass `count='column_name'` to add a column counting how many rows
+        each kept row stands for.
+        """
+        if fields is None:
+            fields = self.fields
+        elif isinstance(fields, basestring):
+            fields = [fields]
+        positions, counts = self.__dedupe(fields, keep, count)
+        deduped = self.take(positions)
+        if count is not None:
+            deduped[count] = list(counts)
+        return deduped
+
+    def fingerprint(self):
+        """
+        A SHA-1 hex digest of the fields and the contents of the columns,
+        to cheaply tell whether a table reloaded from a file, or received
+        from elsewhere, has changed. It is the same across processes and
+        machines for tables of the same fields and values, of the same
+        types; see `acrylic.compare.fingerprint`. It is remembered until
+        the table changes.
+        """
+        return self.__memoized(
+            ('fingerprint',),
+            lambda: fingerprint(self.fields, self.__data.values()))
+
+    @traced
+    def groupby(self, *groupfields, **kwargs):
         """
         Groups rows in this table according to the unique combinations of
         `groupfields` combined.
-        """
-        return GroupbyTable(self, groupfields)
+
+        Pass `memory_budget` (in bytes) to spill the groups to temporary
+        files rather than hold them all in memory; see GroupbyTable.
+        ---
+        data.groupby('customerid', memory_budget=512 * 1024 ** 2)
+        """
+        memory_budget = kwargs.pop('memory_budget', None)
+        if kwargs:
+            raise TypeError("Unknown keyword args passed into `groupby`: %s\n"
+                            % kwargs)
+        if memory_budget is not None:
+            return GroupbyTable(self, groupfields, memory_budget)
+        # The groups are memoized, but not a GroupbyTable, which collects
+        # its own aggregations.
+        groups = self.__memoized(
+            ('groups', groupfields),
+            lambda: GroupbyTable(self, groupfields).groups)
+        return GroupbyTable(self, groupfields, groups=groups)
 
     # TODO: this is a placeholder and only does a very simple left join.
+    @traced
     def join(self, right_table, on):
-        keymap = {}
-        for row in right_table:
-            if row[on] in keymap:
-                keymap[row[on]].append(row)
-            else:
-                keymap[row[on]] = [row]
+        """
+        Rows whose `on` value is missing never match.
+        """
+        keymap = right_table.__memoized(('join index', on),
+                                        lambda: right_table.__index(on))
         new_table = []
         for row in self:
-            if row[on] in keymap:
+            if row[on] is not None and row[on] in keymap:
                 left_dict = dict(row.items())
                 for item in keymap[row[on]]:
                     left_dict_copy = left_dict.copy()
@@ -579,6 +1083,141 @@ class DataTable(object):
                     new_table.append(left_dict_copy)
         return DataTable(new_table)
 
+    def __key_set(self, fields):
+        return self.__memoized(('key set', tuple(fields)),
+                               lambda: key_set(self[fields]))
+
+    def __keyjoin(self, other, on, negate):
+        if not isinstance(other, DataTable):
+            raise TypeError("Can only join with a DataTable, not a %s" %
+                            type(other))
+        fields = [on] if isinstance(on, basestring) else list(on)
+        for table in (self, other):
+            missing = [field for field in fields if field not in table]
+            if missing:
+                raise KeyError("DataTable does not have fields: %s" % missing)
+        found = map(other.__key_set(fields).__contains__,
+                    row_keys(self[fields]))
+        if negate:
+            found = [not key_found for key_found in found]
+        return self.mask(found)
+
+    @traced
+    def semijoin(self, other, on):
+        """
+        Returns the rows of this table whose value at `on` (a field, or a
+        list of fields for a composite key) also appears in `other`, at
+        the same fields. Unlike `join`, no columns are added and every
+        row is kept at most once. Rows missing a key value never match.
+        ---
+        active_orders = orders.semijoin(active_customers, 'customerid')
+        """
+        return self.__keyjoin(other, on, negate=False)
+
+    @traced
+    def antijoin(self, other, on):
+        """
+        Returns the rows of this table whose value at `on` does not appear
+        in `other`: the opposite of `semijoin`. Rows missing a key value
+        never match, so they are always kept.
+        """
+        return self.__keyjoin(other, on, negate=True)
+
+    def __index(self, on):
+        """
+        Maps each value at `on` to the rows that have it.
+        """
+        keymap = {}
+        for row in self:
+            if row[on] is None:
+                continue
+            if row[on] in keymap:
+                keymap[row[on]].append(row)
+            else:
+                keymap[row[on]] = [row]
+        return keymap
+
+    def invalidate_cache(self):
+        """
+        Drops the results memoized for this table (distinct values, groups,
+        sort orders, join indexes and fingerprint) and which of its values
+        are missing. Changes made through the table's methods, and
+        replacing or resizing a column, are noticed automatically; call
+        this after changing a column's values in place, like
+        `data['price'][3] = 10`.
+        """
+        self.__nulls.clear()
+        self.__changed()
+
+    def isnull(self, fieldname):
+        """
+        Returns a list of bools, True where the value at `fieldname`
+        is missing.
+        """
+        column = self[fieldname]
+        return [not valid for valid in
+                validity_mask(self.__bitmap(fieldname), len(column))]
+
+    @traced
+    def lazy(self):
+        """
+        Returns a LazyTable that records `where*`, `select` and `sort`
+        calls and only runs them, fused into as few passes as possible,
+        when `.collect()` is called.
+        ---
+        reds = data.lazy().where('color', 'red').sort('price').collect()
+        """
+        return LazyTable(self)
+
+    @traced
+    def map_partitions(self, func, fields, n=None, workers=None):
+        """
+        Splits the table into `n` partitions by the hash of the values at
+        `fields` (see `partition`), runs `func` on each partition in a pool
+        of `workers` processes, and concatenates the DataTables it returns.
+
+        Rows with the same key always land in the same partition, so any
+        operation keyed on (a superset of) `fields`, like a groupby or a
+        join, can run on each partition independently. `n` defaults to the
+        number of workers, which defaults to the number of CPUs. `func`
+        must be defined at the top level of a module, so it can be sent to
+        the workers; each partition is pickled to its worker once.
+        ---
+        def totals(orders):
+            return (orders.groupby('customerid')
+                          .agg(sum, 'price', name='total')
+                          .collect())
+
+        per_customer = orders.map_partitions(totals, 'customerid')
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if n is None:
+            n = workers
+        results = pool_map(func, self.partition(fields, n), workers)
+        for result in results:
+            if not isinstance(result, DataTable):
+                raise TypeError("`map_partitions` requires `func` to return "
+                                "a DataTable, not a %s" % type(result))
+        tables = [result for result in results if result.fields]
+        if not tables:
+            return DataTable()
+
+        fields = tables[0].fields
+        for table in tables[1:]:
+            if set(table.fields) != set(fields):
+                raise Exception("Columns do not match:\nfirst: %s\n"
+                                "other: %s" % (fields, table.fields))
+        combined = DataTable()
+        for field in fields:
+            combined.__put(field,
+                           list(chain.from_iterable(table[field]
+                                                    for table in tables)),
+                           all(table.__has_no_nulls(field)
+                               for table in tables))
+        return combined
+
+    @traced
     def mask(self, masklist):
         """
         `masklist` is an array of Bools or equivalent.
@@ -595,18 +1234,95 @@ class DataTable(object):
 
         new_datatable = DataTable()
         for field in self.fields:
-            new_datatable[field] = list(compress(self[field], masklist))
+            new_datatable.__put(field, list(compress(self[field], masklist)),
+                                self.__has_no_nulls(field))
         return new_datatable
 
-    def mutapply(self, function, fieldname):
+    @traced
+    def memory_usage(self, deep=True, sample=None):
+        """
+        Returns an OrderedDict of field to the number of bytes that column
+        holds.
+
+        With `deep=False` only the column lists themselves are counted.
+        With `deep=True` (the default) the values are counted too,
+        including string payloads and the contents of tuples/lists/dicts.
+        Objects shared between cells or columns, like repeated or interned
+        strings, are only counted once, in the first column they appear.
+
+        For huge tables, pass `sample=N` to estimate from N random values
+        per column instead of inspecting every one.
+        """
+        if not deep:
+            return OrderedDict((field, sys.getsizeof(column))
+                               for field, column in self.__data.items())
+        seen = set()
+        usage = OrderedDict()
+        for field, column in self.__data.items():
+            measured = measure_column(column, seen, sample)
+            usage[field] = measured['container'] + measured['values']
+        return usage
+
+    def memory_report(self, sample=None):
+        """
+        Returns a DataTable describing the memory held by each column,
+        followed by a `(total)` row for the whole table:
+
+        field             the column
+        container_bytes   the column list itself
+        value_bytes       the values, counting shared objects once
+        total_bytes       container_bytes + value_bytes
+        distinct_objects  distinct objects (by identity) in the column
+        typed_bytes       estimated size as a typed array, if the values
+                          are all ints or all floats
+        dictionary_bytes  estimated size dictionary-encoded: a small
+                          integer code per row plus each distinct value once
+
+        Compare `typed_bytes` and `dictionary_bytes` to `total_bytes` to
+        see which columns are worth storing differently. `sample` works as
+        it does in `memory_usage`.
+        """
+        seen = set()
+        report = DataTable(headers=['field', 'container_bytes',
+                                    'value_bytes', 'total_bytes',
+                                    'distinct_objects', 'typed_bytes',
+                                    'dictionary_bytes'])
+        for field, column in self.__data.items():
+            measured = measure_column(column, seen, sample)
+            report.append([field, measured['container'], measured['values'],
+                           measured['container'] + measured['values'],
+                           measured['distinct'], measured['typed'],
+                           measured['dictionary']])
+        container = sys.getsizeof(self) + sys.getsizeof(self.__data) + \
+            sum(report['container_bytes'])
+        values = sum(report['value_bytes'])
+        report.append([u'(total)', container, values, container + values,
+                       sum(report['distinct_objects']), None, None])
+        return report
+
+    def nullcounts(self):
+        """
+        Returns an OrderedDict of field to the number of missing values
+        in that column.
+        """
+        num_rows = len(self)
+        return OrderedDict((field, null_count(self.__bitmap(field),
+                                              num_rows))
+                           for field in self.fields)
+
+    def mutapply(self, function, fieldname, workers=None, chunksize=None):
         """
         Applies `function` in-place to the field name specified.
 
         In other words, `mutapply` overwrites column `fieldname`
         ith the results of applying `function` to each element of that column.
+
+        `workers` and `chunksize` work as they do in `apply`.
         """
-        self[fieldname] = self.apply(function, fieldname)
+        self[fieldname] = self.apply(function, fieldname, workers=workers,
+                                     chunksize=chunksize)
 
+    @traced
     def rename(self, old_fieldname, new_fieldname):
         """
         Renames a specific field, and preserves the underlying order.
@@ -628,6 +1344,91 @@ class DataTable(object):
         new_names.insert(location, new_fieldname)
         self.fields = new_names
 
+    @traced
+    def partition(self, fields, n):
+        """
+        Splits the table into a list of `n` DataTables in one pass, by the
+        hash of each row's value at `fields` (a field name or a list of
+        them). Every row with the same key goes to the same partition, and
+        rows keep their order within each partition. Partitions may be
+        empty.
+        ---
+        shards = data.partition('customerid', 8)
+        """
+        if n < 1:
+            raise ValueError("Cannot split a table into %s partitions." % n)
+        if isinstance(fields, basestring):
+            fields = [fields]
+        columns = self[list(fields)]
+        keys = columns[0] if len(columns) == 1 else izip(*columns)
+        buckets = [[] for _ in xrange(n)]
+        appends = [bucket.append for bucket in buckets]
+        for i, key_hash in enumerate(imap(hash, keys)):
+            appends[key_hash % n](i)
+        return [self.take(positions) for positions in buckets]
+
+    @traced
+    def pivot(self, index, columns, values=None, aggfunc='sum', fill=None):
+        """
+        Returns a wide DataTable with one row per distinct value of `index`
+        (a field, or a list of fields), in the order they were first seen,
+        followed by one column per distinct value of `columns`, in sorted
+        order. Each cell aggregates the `values` of the rows with that
+        index and column value.
+
+        `aggfunc` is one of 'sum', 'count', 'mean', 'min', 'max', 'first'
+        or 'last', which are computed as the rows go by, or a function
+        that is passed the list of a cell's values. Without `values`,
+        'count' counts rows. Cells without any rows are `fill`.
+
+        Rows with a missing value at `index`, `columns` or `values` are
+        left out.
+        ---
+        sales.pivot('region', 'year', 'revenue', 'sum', fill=0)
+        """
+        index = [index] if isinstance(index, basestring) else list(index)
+        if values is None and aggfunc != 'count':
+            raise Exception("Pass `values` to aggregate with `%s`." %
+                            aggfunc)
+        fields = index + [columns] + ([] if values is None else [values])
+        present = None
+        for field in fields:
+            if field not in self:
+                raise KeyError("DataTable does not have column `%s`" % field)
+            bitmap = self.__bitmap(field)
+            if bitmap is not None:
+                present = mask_nulls(present or [True] * len(self), bitmap)
+
+        gathered = [self[field] if present is None
+                    else list(compress(self[field], present))
+                    for field in fields]
+        column_keys = gathered[len(index)]
+        if len(index) == 1:
+            row_keys = gathered[0]
+        else:
+            row_keys = zip(*gathered[:len(index)])
+        cell_values = column_keys if values is None else gathered[-1]
+        cells = aggregate(aggfunc, zip(row_keys, column_keys), cell_values)
+
+        row_order = list(unique_everseen(row_keys))
+        column_order = sorted(set(column_keys))
+        names = [unicode(key) for key in column_order]
+        clashes = set(index) & set(names)
+        if clashes or len(set(names)) != len(names):
+            raise Exception("Cannot name the pivoted columns uniquely: %s" %
+                            names)
+
+        pivoted = [[cells.get((row_key, column_key), fill)
+                    for row_key in row_order]
+                   for column_key in column_order]
+        if len(index) == 1:
+            index_columns = [row_order]
+        else:
+            index_columns = [[row_key[i] for row_key in row_order]
+                             for i in range(len(index))]
+        return DataTable.fromcolumns(index + names, index_columns + pivoted)
+
+    @traced
     def reorder(self, fields_in_new_order):
         """
         Pass in field names in the order you wish them to be swapped.
@@ -643,6 +1444,7 @@ class DataTable(object):
         for field in fields_in_new_order:
             new[field] = self.__data[field]
         self.__data = new
+        self.__changed()
 
     def row(self, rownum):
         """
@@ -657,34 +1459,107 @@ class DataTable(object):
         return datarow_constructor(self.fields)([self[field][rownum]
                                                  for field in self.fields])
 
-    def sample(self, num):
+    @traced
+    def sample(self, num, seed=None, by=None):
         """
-        Returns a new table with rows randomly sampled.
+        Returns a new table with `num` rows randomly sampled, in random
+        order. Pass a `seed` to make the sample reproducible.
+
+        If `by` is a fieldname, up to `num` rows are sampled from each
+        distinct value of that field (a stratified sample). Groups appear
+        in the order their values are first seen.
 
-        We create a mask with `num` True bools, and fill it with False bools
-        until it is the length of the table. We shuffle it, and apply that
-        mask to the table.
+        Row positions are drawn directly and gathered once, so the cost
+        depends on `num` rather than on the length of the table.
         """
-        if num > len(self):
-            return self.copy()
-        elif num < 0:
+        if num < 0:
             raise IndexError("Cannot sample a negative number of rows "
                              "from a DataTable")
+        rng = Random(seed)
+        if by is None:
+            return self.take(rng.sample(xrange(len(self)),
+                                        min(num, len(self))))
+
+        strata = OrderedDict()
+        for i, value in enumerate(self[by]):
+            if value in strata:
+                strata[value].append(i)
+            else:
+                strata[value] = [i]
+        positions = []
+        for stratum in strata.itervalues():
+            if num >= len(stratum):
+                rng.shuffle(stratum)
+                positions.extend(stratum)
+            else:
+                positions.extend(rng.sample(stratum, num))
+        return self.take(positions)
 
-        random_row_mask = ([True] * num) + ([False] * (len(self) - num))
-        shuffle(random_row_mask)
+    @classmethod
+    @traced
+    def samplecsv(cls, path, num, delimiter=",", headers=None, seed=None,
+                  null_values=CSV_NULL_VALUES):
+        """
+        Samples `num` rows from a CSV file while streaming through it, so
+        only the sampled rows are ever held in memory. Rows are returned
+        in file order.
 
-        sampled_table = self.mask(random_row_mask)
-        random_col_name = 'random_sorting_column'
-        while random_col_name in sampled_table:
-            random_col_name = '%030x' % randrange(16**30)
-        sampled_table[random_col_name] = [random()
-                                          for _ in xrange(len(sampled_table))]
-        sampled_table.sort(random_col_name, inplace=True)
-        del sampled_table[random_col_name]
-        return sampled_table
+        `null_values` works as it does in `fromcsv`.
+        """
+        with open(path, 'r') as f:
+            reader = UnicodeRW.UnicodeReader(f, delimiter=delimiter)
+            sampled = cls.__fromreservoir(reader, num, headers, seed)
+        sampled.__replace_nulls(null_values)
+        return sampled
 
-    def sort(self, fieldname, key=lambda x: x, desc=False, inplace=False):
+    @classmethod
+    @traced
+    def sampleexcel(cls, path, num, sheet_name_or_num=0, headers=None,
+                    seed=None):
+        """
+        Samples `num` rows from an Excel sheet while streaming through it.
+        See `samplecsv`.
+        """
+        reader = ExcelRW.UnicodeReader(path, sheet_name_or_num)
+        header_row = reader.read_headers()
+        rows = chain([header_row],
+                     reader.iter_rows(min_row=2,
+                                      columns=range(len(header_row))))
+        return cls.__fromreservoir(rows, num, headers, seed)
+
+    @classmethod
+    def __fromreservoir(cls, reader, num, headers, seed):
+        header_row = reader.next()
+        sampled = cls([header_row] + reservoir_sample(reader, num, seed))
+        if headers is None:
+            return sampled
+        return cls.fromcolumns(headers, sampled[list(headers)])
+
+    @traced
+    def share(self):
+        """
+        Copies this table into shared memory and returns a SharedTable
+        handle. Pass the handle to worker processes (it pickles to a few
+        hundred bytes) and call `handle.attach()` there to get a read-only
+        DataTable that reads the shared columns in place, instead of each
+        worker unpickling its own copy of the data.
+
+        Ints, floats and strings (with or without missing values) are
+        shared as flat buffers; columns of mixed or other types are
+        pickled once and unpickled by each worker that attaches.
+
+        The shared memory is released when the handle is closed, when its
+        `with` block ends, or when this process exits.
+        ---
+        with data.share() as handle:
+            totals = pool_map(total_for_region, [(handle, region)
+                                                 for region in regions])
+        """
+        return SharedTable.create(self)
+
+    @traced
+    def sort(self, fieldname, key=lambda x: x, desc=False, inplace=False,
+             nulls='last'):
         """
         This matches Python's built-in sorting signature closely.
 
@@ -692,93 +1567,204 @@ class DataTable(object):
         not be mutated. If preferred, specify `inplace=True` in order to
         mutate the original table. Either way, a reference to the relevant
         table will be returned.
+
+        Rows with a missing value at `fieldname` are put at the end, or at
+        the start with `nulls='first'`, in their original order. `key` is
+        never called on a missing value.
         """
-        try:
-            field_index = tuple(self.fields).index(fieldname)
-        except ValueError:
+        if fieldname not in self:
             raise ValueError("Sorting on a field that doesn't exist: `%s`" %
                              fieldname)
+        if nulls not in ('first', 'last'):
+            raise ValueError("`nulls` must be 'first' or 'last', not `%s`" %
+                             nulls)
 
-        data_cols = izip(*sorted(izip(*[self.__data[field]
-                                        for field in self.fields]),
-                                 key=lambda row: key(row[field_index]),
-                                 reverse=desc))
-
-        target_table = self if inplace else DataTable()
-
-        for field, data_col in izip(self.fields, data_cols):
-            target_table[field] = list(data_col)
+        sorted_table = self.take(self.__memoized(
+            ('sort', fieldname, key, desc, nulls),
+            lambda: self.__sort_positions(fieldname, key, desc, nulls)))
+        if not inplace:
+            return sorted_table
 
         # Note that sorting in-place still returns a reference
         # to the table being sorted, for convenience.
-        return target_table
+        self.__data = sorted_table.__data
+        self.__nulls = sorted_table.__nulls
+        self.__changed()
+        return self
+
+    def __sort_positions(self, fieldname, key, desc, nulls):
+        column = indexable(self.__data[fieldname])
+        present, missing = split_nulls(range(len(self)),
+                                       self.__bitmap(fieldname),
+                                       len(self))
+        present.sort(key=lambda i: key(column[i]), reverse=desc)
+        if nulls == 'first':
+            return missing + present
+        return present + missing
+
+    @traced
+    def take(self, positions):
+        """
+        Returns a new DataTable with the rows at `positions` (an iterable
+        of row indexes), in that order. Positions may repeat.
+        """
+        if not isinstance(positions, (list, tuple)):
+            positions = list(positions)
+        new_datatable = DataTable()
+        for field in self.fields:
+            new_datatable.__put(field, take(self.__data[field], positions),
+                                self.__has_no_nulls(field))
+        return new_datatable
+
+    def __wheremask(self, fieldname, masklist):
+        return self.mask(mask_nulls(masklist, self.__bitmap(fieldname)))
 
+    @traced
     def where(self, fieldname, value, negate=False):
         """
         Returns a new DataTable with rows only where the value at
         `fieldname` == `value`.
+
+        Like the other `where*` methods, rows with a missing value at
+        `fieldname` never match, whether negated or not. `where(field,
+        None)` is the same as `wherenull(field)`.
         """
+        if value is None:
+            return self.wherenotnull(fieldname) if negate \
+                else self.wherenull(fieldname)
         if negate:
-            return self.mask([elem != value
-                              for elem in self[fieldname]])
+            return self.__wheremask(fieldname, [elem != value
+                                                for elem in self[fieldname]])
         else:
-            return self.mask([elem == value
-                              for elem in self[fieldname]])
+            return self.__wheremask(fieldname, [elem == value
+                                                for elem in self[fieldname]])
 
+    @traced
     def wherefunc(self, func, negate=False):
         """
         Applies a function to an entire row and filters the rows based on the
         boolean output of that function.
+
+        `func` may also be an expression built with `acrylic.col`, which
+        is compiled once and evaluated directly over the columns:
+
+        data.wherefunc((col('colors') == 'red') & (col('randnum2') > .5))
         """
+        if isinstance(func, Expr):
+            results = func.evaluate(self)
+        else:
+            results = (func(item) for item in self)
         if negate:
-            return self.mask([not func(item) for item in self])
+            return self.mask([not result for result in results])
         else:
-            return self.mask([func(item) for item in self])
+            return self.mask([bool(result) for result in results])
 
+    @traced
     def wherein(self, fieldname, collection, negate=False):
         """
         Returns a new DataTable with rows only where the value at
         `fieldname` is contained within `collection`.
-        """
-        if negate:
-            return self.mask([elem not in collection
-                              for elem in self[fieldname]])
+
+        `collection` may be any iterable of values, like a list or another
+        column, or a DataTable, whose column `fieldname` (or only column)
+        is used. It is turned into a set once, so long collections are as
+        quick as short ones. A string `collection` is searched for
+        substrings, as with `in`: `wherein(field, u"redblue")` keeps
+        u"red" and u"dbl".
+        """
+        if isinstance(collection, DataTable):
+            if fieldname in collection:
+                collection = collection[fieldname]
+            elif len(collection.fields) == 1:
+                collection = collection[collection.fields[0]]
+            else:
+                raise KeyError("DataTable passed to `wherein` does not have "
+                               "column `%s`" % fieldname)
+        membership = as_membership(collection)
+        if isinstance(membership, basestring):
+            # Substring tests, which can't take a missing value.
+            found = [elem is not None and elem in membership
+                     for elem in self[fieldname]]
         else:
-            return self.mask([elem in collection
-                              for elem in self[fieldname]])
+            found = map(membership.__contains__, self[fieldname])
+        if negate:
+            found = [not elem_found for elem_found in found]
+        return self.__wheremask(fieldname, found)
 
+    @traced
     def wheregreater(self, fieldname, value):
         """
         Returns a new DataTable with rows only where the value at
         `fieldname` > `value`.
         """
-        return self.mask([elem > value for elem in self[fieldname]])
+        return self.__wheremask(fieldname, [elem > value
+                                            for elem in self[fieldname]])
 
+    @traced
     def whereless(self, fieldname, value):
         """
         Returns a new DataTable with rows only where the value at
         `fieldname` < `value`.
         """
-        return self.mask([elem < value for elem in self[fieldname]])
+        return self.__wheremask(fieldname, [elem < value
+                                            for elem in self[fieldname]])
 
+    @traced
     def wherenot(self, fieldname, value):
         """
         Logical opposite of `where`.
         """
         return self.where(fieldname, value, negate=True)
 
+    @traced
+    def wherenotnull(self, fieldname):
+        """
+        Returns a new DataTable with rows only where the value at
+        `fieldname` is not missing.
+        """
+        column = self[fieldname]
+        return self.mask(validity_mask(self.__bitmap(fieldname),
+                                       len(column)))
+
+    @traced
     def wherenotfunc(self, func):
         """
         Logical opposite of `wherefunc`.
         """
         return self.wherefunc(func, negate=True)
 
+    @traced
     def wherenotin(self, fieldname, value):
         """
         Logical opposite of `wherein`.
         """
         return self.wherein(fieldname, value, negate=True)
 
+    @traced
+    def wherenull(self, fieldname):
+        """
+        Returns a new DataTable with rows only where the value at
+        `fieldname` is missing.
+        """
+        return self.mask(self.isnull(fieldname))
+
+    @traced
+    def window(self, partition_by=None, order_by=None, desc=False):
+        """
+        Returns a Window over this table's rows, partitioned by
+        `partition_by` and ordered within each partition by `order_by`
+        (each a field or a list of fields). Its window functions return
+        new columns for this table: cumulative, rolling, lag/lead and
+        ranking columns. The partitions and their order are worked out
+        once and shared by every function called on the same Window.
+        ---
+        w = data.window('department', order_by='salary', desc=True)
+        data['salary_rank'] = w.rank()
+        data['running_payroll'] = w.cumsum('salary')
+        """
+        return Window(self, partition_by, order_by, desc)
+
+    @traced
     def writecsv(self, path, delimiter=","):
         writer = UnicodeRW.UnicodeWriter(open(path, 'wb'),
                                          self.fields,
@@ -788,12 +1774,16 @@ class DataTable(object):
         writer.writerows(self)
         writer.close()
 
-    def writexlsx(self, path, sheetname="default"):
+    @traced
+    def writexlsx(self, path, sheetname="default", number_formats=None):
         """
         Writes this table to an .xlsx file at the specified path.
 
         If you'd like to specify a sheetname, you may do so.
 
+        `number_formats` maps field names to Excel number formats, like
+        {'price': '0.00'}, which are applied to the whole column.
+
         If you'd like to write one workbook with different DataTables
         for each sheet, import the `excel` function from acrylic. You
         can see that code in `utils.py`.
@@ -801,11 +1791,7 @@ class DataTable(object):
         Note that the outgoing file is an .xlsx file, so it'd make sense to
         name that way.
         """
-        writer = ExcelRW.UnicodeWriter(path)
-        writer.set_active_sheet(sheetname)
-        writer.writerow(self.fields)
-        writer.writerows(self)
-        writer.save()
+        excel(path, [self], [sheetname], number_formats)
 
     def __iter__(self):
         datarow = datarow_constructor(self.fields)
@@ -813,22 +1799,44 @@ class DataTable(object):
             yield datarow(values)
 
 
+def _read_excel_sheet(job):
+    """
+    Helper method for DataTable.fromexcel_all() and fromexcel_many(),
+    run in a worker process.
+
+    Returns `(False, (fields, columns))`, or `(True, traceback)` if the
+    sheet can't be read.
+    """
+    path, sheet_name_or_num = job
+    try:
+        reader = ExcelRW.UnicodeReader(path, sheet_name_or_num)
+        return False, reader.read_columns()
+    except Exception:
+        return True, traceback.format_exc()
+
+
+def _restore_table(cls, fields, encoded_columns):
+    return cls.fromcolumns(fields, [decode_column(*encoded)
+                                    for encoded in encoded_columns])
+
+
 def parse_column(column):
     """
     Helper method for DataTable.fromcsvstring()
 
     Given a list, parse_column tries to see if it should cast
     everything in that list to a float, an int, or leave it as is.
+    Missing values (None) are left alone.
 
     Always returns a list.
     """
     try:
-        float_attempt = [float(i) for i in column]
+        float_attempt = [i if i is None else float(i) for i in column]
     except ValueError:
         return column
     else:
         try:
-            int_attempt = [int(j) for j in column]
+            int_attempt = [j if j is None else int(j) for j in column]
         except ValueError:
             return float_attempt
         else:
@@ -0,0 +1,295 @@
+# coding: utf-8
+
+"""
+A small expression language for filtering and deriving columns.
+
+Expressions are built from column references with ordinary Python
+operators, and are compiled once into a generated function that walks the
+referenced columns directly, instead of calling a Python function on a
+freshly built DataRow for every row:
+
+    from acrylic import col
+
+    big_reds = data.wherefunc((col('colors') == 'red') &
+                              (col('randnum2') > .5))
+    data['total'] = data.apply(col('price') * col('quantity'))
+
+Because Python does not allow `and`, `or`, `not` and `in` to be
+overloaded, use `&`, `|`, `~` and `.isin()` instead. They compile to
+`and`, `or`, `not` and `in`, so results are identical to the equivalent
+lambda. Division is true division, as in the rest of acrylic.
+"""
+
+from __future__ import division
+
+from itertools import izip
+
+import __future__
+
+
+def col(fieldname):
+    """
+    Returns an expression referring to the column `fieldname`.
+    """
+    if not isinstance(fieldname, basestring):
+        raise ValueError("DataTable fields must be strings, not `%s`" %
+                         type(fieldname))
+    return Expr('col', fieldname)
+
+
+def lit(value):
+    """
+    Returns an expression for a constant value. Plain values used with
+    operators are wrapped automatically, so this is rarely needed.
+    """
+    return Expr('lit', value)
+
+
+def _wrap(value):
+    return value if isinstance(value, Expr) else lit(value)
+
+
+_BINARY_OPS = {'eq': '==', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>',
+               'ge': '>=', 'add': '+', 'sub': '-', 'mul': '*', 'div': '/',
+               'floordiv': '//', 'mod': '%', 'pow': '**',
+               'and': 'and', 'or': 'or'}
+
+
+class Expr(object):
+
+    __hash__ = None
+
+    def __init__(self, kind, *args):
+        self.kind = kind
+        self.args = args
+        self.__compiled = None
+
+    # comparisons
+    def __eq__(self, other):
+        return Expr('eq', self, _wrap(other))
+
+    def __ne__(self, other):
+        return Expr('ne', self, _wrap(other))
+
+    def __lt__(self, other):
+        return Expr('lt', self, _wrap(other))
+
+    def __le__(self, other):
+        return Expr('le', self, _wrap(other))
+
+    def __gt__(self, other):
+        return Expr('gt', self, _wrap(other))
+
+    def __ge__(self, other):
+        return Expr('ge', self, _wrap(other))
+
+    # arithmetic
+    def __add__(self, other):
+        return Expr('add', self, _wrap(other))
+
+    def __radd__(self, other):
+        return Expr('add', _wrap(other), self)
+
+    def __sub__(self, other):
+        return Expr('sub', self, _wrap(other))
+
+    def __rsub__(self, other):
+        return Expr('sub', _wrap(other), self)
+
+    def __mul__(self, other):
+        return Expr('mul', self, _wrap(other))
+
+    def __rmul__(self, other):
+        return Expr('mul', _wrap(other), self)
+
+    def __div__(self, other):
+        return Expr('div', self, _wrap(other))
+
+    def __rdiv__(self, other):
+        return Expr('div', _wrap(other), self)
+
+    __truediv__, __rtruediv__ = __div__, __rdiv__
+
+    def __floordiv__(self, other):
+        return Expr('floordiv', self, _wrap(other))
+
+    def __rfloordiv__(self, other):
+        return Expr('floordiv', _wrap(other), self)
+
+    def __mod__(self, other):
+        return Expr('mod', self, _wrap(other))
+
+    def __rmod__(self, other):
+        return Expr('mod', _wrap(other), self)
+
+    def __pow__(self, other):
+        return Expr('pow', self, _wrap(other))
+
+    def __rpow__(self, other):
+        return Expr('pow', _wrap(other), self)
+
+    def __neg__(self):
+        return Expr('neg', self)
+
+    # boolean logic
+    def __and__(self, other):
+        return Expr('and', self, _wrap(other))
+
+    def __rand__(self, other):
+        return Expr('and', _wrap(other), self)
+
+    def __or__(self, other):
+        return Expr('or', self, _wrap(other))
+
+    def __ror__(self, other):
+        return Expr('or', _wrap(other), self)
+
+    def __invert__(self):
+        return Expr('not', self)
+
+    def __nonzero__(self):
+        raise TypeError("Expressions cannot be used as booleans. Use `&`, "
+                        "`|` and `~` instead of `and`, `or` and `not`.")
+
+    def isin(self, collection):
+        """
+        True where the value is in `collection`. Lists and tuples of
+        hashable values are turned into a set once, at build time.
+        """
+        return Expr('in', self, lit(_as_set(collection)))
+
+    def notin(self, collection):
+        """
+        Logical opposite of `isin`.
+        """
+        return Expr('notin', self, lit(_as_set(collection)))
+
+    def isnull(self):
+        """
+        True where the value is missing (None).
+        """
+        return Expr('isnull', self)
+
+    def notnull(self):
+        """
+        True where the value is present (not None).
+        """
+        return Expr('notnull', self)
+
+    @property
+    def fields(self):
+        """
+        The fields referenced by this expression, in order of appearance.
+        """
+        fields = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.kind == 'col':
+                if node.args[0] not in fields:
+                    fields.append(node.args[0])
+            elif node.kind != 'lit':
+                stack.extend(reversed(node.args))
+        return fields
+
+    def __render(self, reference, constant):
+        """
+        Renders this expression as Python source. `reference` and
+        `constant` return the source for a column and a constant value.
+        """
+        if self.kind == 'col':
+            return reference(self.args[0])
+        elif self.kind == 'lit':
+            return constant(self.args[0])
+        elif self.kind == 'neg':
+            return '(-%s)' % self.args[0].__render(reference, constant)
+        elif self.kind == 'not':
+            return '(not %s)' % self.args[0].__render(reference, constant)
+        elif self.kind == 'isnull':
+            return '(%s is None)' % self.args[0].__render(reference, constant)
+        elif self.kind == 'notnull':
+            return ('(%s is not None)' %
+                    self.args[0].__render(reference, constant))
+        if self.kind == 'in':
+            operator = 'in'
+        elif self.kind == 'notin':
+            operator = 'not in'
+        else:
+            operator = _BINARY_OPS[self.kind]
+        return '(%s %s %s)' % (self.args[0].__render(reference, constant),
+                               operator,
+                               self.args[1].__render(reference, constant))
+
+    def __repr__(self):
+        return 'Expr%s' % self.__render(lambda field: 'col(%r)' % field,
+                                        repr)
+
+    def __source(self, reference):
+        constants = []
+
+        def constant(value):
+            constants.append(value)
+            return 'k%d' % (len(constants) - 1)
+
+        return self.__render(reference, constant), constants
+
+    def __build(self, source, constants):
+        namespace = {'izip': izip}
+        for i, constant in enumerate(constants):
+            namespace['k%d' % i] = constant
+        code = compile(source, '<acrylic expression>', 'exec',
+                       __future__.division.compiler_flag, True)
+        exec code in namespace
+        return namespace['_compiled']
+
+    def compile(self):
+        """
+        Returns a function `f(num_rows, *columns)` that evaluates this
+        expression over the columns named by `.fields` (in that order),
+        returning a list with one result per row.
+        """
+        if self.__compiled is None:
+            fields = self.fields
+            names = ['v%d' % i for i in range(len(fields))]
+            columns = ['c%d' % i for i in range(len(fields))]
+            body, constants = self.__source(
+                dict(izip(fields, names)).__getitem__)
+            if not fields:
+                loop = 'for _ in xrange(num_rows)'
+            elif len(fields) == 1:
+                loop = 'for v0 in c0'
+            else:
+                loop = 'for %s in izip(%s)' % (', '.join(names),
+                                               ', '.join(columns))
+            source = ('def _compiled(%s):\n'
+                      '    return [%s %s]\n' %
+                      (', '.join(['num_rows'] + columns), body, loop))
+            self.__compiled = self.__build(source, constants)
+        return self.__compiled
+
+    def compile_row(self, index_of):
+        """
+        Returns a function that evaluates this expression on a single row
+        tuple, where `index_of` maps a field to its position in the tuple.
+        """
+        body, constants = self.__source(
+            lambda field: 'row[%d]' % index_of[field])
+        source = 'def _compiled(row):\n    return %s\n' % body
+        return self.__build(source, constants)
+
+    def evaluate(self, datatable):
+        """
+        Evaluates this expression against every row of `datatable`.
+        """
+        return self.compile()(len(datatable),
+                              *[datatable[field] for field in self.fields])
+
+
+def _as_set(collection):
+    if isinstance(collection, (list, tuple)):
+        try:
+            return frozenset(collection)
+        except TypeError:
+            pass
+    return collection
+
@@ -1,9 +1,32 @@
 # coding: utf-8
 
+from array import array
 from collections import OrderedDict
-from itertools import izip
+from itertools import imap, islice, izip
 
+from .datarow import datarow_constructor
+from .profiling import traced
+from .shared import indexable
+
+import cPickle
 import datatable
+import heapq
+import math
+import os
+import tempfile
+
+# Rough bytes that grouping holds on to for every group and for every row,
+# used to keep it within a `memory_budget`.
+GROUP_BYTES = 256
+ROW_BYTES = 32
+
+# With a `memory_budget`, the size of the groups is checked every this many
+# rows.
+_BUDGET_CHECK_ROWS = 65536
+
+# When spilling, row positions are buffered up to this many per partition
+# before they are written out.
+_SPILL_BUFFER_ROWS = 65536
 
 
 class GroupbyTable(object):
@@ -38,38 +61,164 @@ class GroupbyTable(object):
                    .agg(most_recent_price, 'sale_price', 'timestamp')
                    .collect())
 
+    Rows with a missing value in any of the fields passed to `.agg` are
+    left out of what the aggregation function receives, so `.agg(len,
+    'price')` counts the prices that are present. Missing group keys form
+    a group of their own.
+
+    Pass `memory_budget` (in bytes) to `.groupby` to bound how much memory
+    grouping may use. If the groups outgrow it, the positions of the rows
+    are split by the hash of their key into partitions, written to
+    temporary files, and each partition is grouped and aggregated
+    separately when `collect` is called. Each partition's aggregated rows
+    go to another temporary file, and the files are merged into the
+    result, so only one partition's groups are held at a time besides the
+    table and the result. The result is the same as without a budget, in
+    the same order.
     """
 
-    def __init__(self, datatable_instance, groupfields):
+    def __init__(self, datatable_instance, groupfields, memory_budget=None,
+                 groups=None):
         if not isinstance(datatable_instance, datatable.DataTable):
             raise Exception("Must group a DataTable instance.")
         if len(groupfields) == 0:
             raise Exception("Must pass in at least one groupfield.")
         self.__key_to_group_map = OrderedDict()
+        self.__table = datatable_instance
         self.__groupfields = groupfields
         self.__grouptable = datatable.DataTable()
         self.__lambda_num = 0
+        self.__memory_budget = memory_budget
+        # Set once the groups have been spilled to disk: the temporary
+        # file and number of row positions of each partition, and the
+        # aggregations to run on every partition at `collect`.
+        self.__partitions = None
+        self.__aggs = []
+        self.__num_groups = None
+        # Which rows have none of the aggregated fields missing, by fields.
+        self.__present_rows = {}
 
-        self.__initialize_groupings(datatable_instance, groupfields)
+        if groups is None:
+            self.__initialize_groupings(datatable_instance, groupfields)
+        else:
+            self.__key_to_group_map = groups
+            self.__grouptable['groupkey'] = groups.keys()
 
     def __len__(self):
-        return len(self.__key_to_group_map)
+        if self.__partitions is None:
+            return len(self.__key_to_group_map)
+        if self.__num_groups is None:
+            columns = map(indexable, self.__table[list(self.__groupfields)])
+            self.__num_groups = sum(
+                len(set(izip(*[[column[i] for i in positions]
+                               for column in columns])))
+                for positions in self.__spilled_positions())
+        return self.__num_groups
 
-    def __initialize_groupings(self, root_data, groupfields):
+    @property
+    def groups(self):
+        """
+        An OrderedDict of each group's key to the positions of its rows in
+        the table, in the order the keys were first seen; None if the
+        groups were spilled to disk. Don't modify it.
+        """
+        return self.__key_to_group_map
+
+    @staticmethod
+    def __keys(root_data, groupfields):
         if len(groupfields) > 1:
-            get_key = lambda datarow: tuple([datarow[groupfield]
-                                             for groupfield in groupfields])
-        else:
-            get_key = lambda datarow: datarow[groupfields[0]]
+            return izip(*root_data[list(groupfields)])
+        return root_data[groupfields[0]]
 
-        for row in root_data:
-            key = get_key(row)
-            if key in self.__key_to_group_map:
-                self.__key_to_group_map[key].append(row)
+    def __group(self, keys, start=0):
+        key_to_group_map = self.__key_to_group_map
+        for i, key in enumerate(keys, start):
+            if key in key_to_group_map:
+                key_to_group_map[key].append(i)
             else:
-                self.__key_to_group_map[key] = [row]
+                key_to_group_map[key] = [i]
+
+    def __initialize_groupings(self, root_data, groupfields):
+        # Groups hold the positions of their rows in `root_data`.
+        keys = self.__keys(root_data, groupfields)
+        budget = self.__memory_budget
+        if budget is None:
+            self.__group(keys)
+        else:
+            keys = iter(keys)
+            num_rows = 0
+            while True:
+                chunk = list(islice(keys, _BUDGET_CHECK_ROWS))
+                if not chunk:
+                    break
+                self.__group(chunk, num_rows)
+                num_rows += len(chunk)
+                used = (len(self.__key_to_group_map) * GROUP_BYTES +
+                        num_rows * ROW_BYTES)
+                if used > budget:
+                    expected = used * len(root_data) / float(num_rows)
+                    self.__spill(root_data, groupfields,
+                                 int(math.ceil(expected / budget)) + 1)
+                    return
         self.__grouptable['groupkey'] = self.__key_to_group_map.keys()
 
+    def __spill(self, root_data, groupfields, num_partitions):
+        """
+        Drops the groups built so far and instead writes the position of
+        every row to one of `num_partitions` temporary files, by the hash
+        of its key.
+        """
+        self.__key_to_group_map = None
+        files = [tempfile.TemporaryFile() for _ in xrange(num_partitions)]
+        buffers = [array('l') for _ in xrange(num_partitions)]
+        sizes = [0] * num_partitions
+        keys = self.__keys(root_data, groupfields)
+        for i, key_hash in enumerate(imap(hash, keys)):
+            partition = key_hash % num_partitions
+            buffer = buffers[partition]
+            buffer.append(i)
+            if len(buffer) == _SPILL_BUFFER_ROWS:
+                buffer.tofile(files[partition])
+                sizes[partition] += len(buffer)
+                del buffer[:]
+        for partition, buffer in enumerate(buffers):
+            buffer.tofile(files[partition])
+            sizes[partition] += len(buffer)
+        self.__partitions = zip(files, sizes)
+
+    def __spilled_positions(self):
+        """
+        Yields the row positions of each non-empty spilled partition, in
+        row order.
+        """
+        for spill_file, size in self.__partitions:
+            if not size:
+                continue
+            spill_file.seek(0, os.SEEK_SET)
+            positions = array('l')
+            positions.fromfile(spill_file, size)
+            yield positions.tolist()
+
+    def __present(self, fields):
+        """
+        Returns a list of bools, True where none of `fields` are missing,
+        or None if they have no missing values at all.
+        """
+        if fields not in self.__present_rows:
+            missing = [self.__table.isnull(field) for field in fields]
+            missing = [column for column in missing if any(column)]
+            self.__present_rows[fields] = (
+                [not any(row) for row in izip(*missing)] if missing
+                else None)
+        return self.__present_rows[fields]
+
+    def __positions(self, groupkey, present):
+        positions = self.__key_to_group_map[groupkey]
+        if present is None:
+            return positions
+        return [i for i in positions if present[i]]
+
+    @traced
     def agg(self, func, *fields, **name):
         """
         Calls the aggregation function `func` on each group in the GroubyTable,
@@ -83,7 +232,7 @@ class GroupbyTable(object):
             if len(name) > 1 or 'name' not in name:
                 raise TypeError("Unknown keyword args passed into `agg`: %s\n"
                                 % name)
-            name = name.get('name', None)
+        name = name.get('name', None)
 
         if name is not None:
             name = name
@@ -93,25 +242,38 @@ class GroupbyTable(object):
         else:
             name = func.__name__
 
+        if self.__partitions is not None:
+            self.__table[list(fields)]  # raises for unknown fields
+            self.__aggs.append((func, fields, name))
+            return self
+
         aggregated_column = []
 
         if len(fields) > 1:
             name += "(%s)" % ','.join(fields)
+            columns = map(indexable, self.__table[list(fields)])
+            present = self.__present(fields)
             for groupkey in self.__grouptable['groupkey']:
-                agg_data = [tuple([row[field] for field in fields])
-                            for row in self.__key_to_group_map[groupkey]]
+                positions = self.__positions(groupkey, present)
+                agg_data = zip(*[[column[i] for i in positions]
+                                 for column in columns])
                 aggregated_column.append(func(agg_data))
         elif len(fields) == 1:
             field = fields[0]
             name += "(%s)" % field
+            column = indexable(self.__table[field])
+            present = self.__present(fields)
             for groupkey in self.__grouptable['groupkey']:
-                agg_data = [row[field]
-                            for row in self.__key_to_group_map[groupkey]]
+                agg_data = [column[i]
+                            for i in self.__positions(groupkey, present)]
                 aggregated_column.append(func(agg_data))
         else:
             name += "()"
+            datarow = datarow_constructor(self.__table.fields)
+            columns = map(indexable, self.__table[self.__table.fields])
             for groupkey in self.__grouptable['groupkey']:
-                agg_data = self.__key_to_group_map[groupkey]
+                agg_data = [datarow([column[i] for column in columns])
+                            for i in self.__key_to_group_map[groupkey]]
                 aggregated_column.append(func(agg_data))
 
         self.__grouptable[name] = aggregated_column
@@ -122,6 +284,7 @@ class GroupbyTable(object):
 
     aggregate.__doc__ = agg.__doc__
 
+    @traced
     def collect(self):
         """
         After adding the desired aggregation columns, `collect`
@@ -132,12 +295,19 @@ class GroupbyTable(object):
         followed by the aggregation columns specified in preceeding
         `agg` calls.
         """
+        if self.__partitions is not None:
+            return self.__collect_spilled()
+
         # The final order of columns is determined by the
         # group keys and the aggregation columns
         final_field_order = list(self.__groupfields) + self.__grouptable.fields
 
-        # Tansform the group key rows into columns
-        col_values = izip(*self.__grouptable['groupkey'])
+        # Tansform the group key rows into columns. A single groupfield's
+        # keys are plain values rather than tuples.
+        if len(self.__groupfields) > 1:
+            col_values = izip(*self.__grouptable['groupkey'])
+        else:
+            col_values = [self.__grouptable['groupkey']]
 
         # Assign the columns to the table with the relevant name
         for groupfield, column in izip(self.__groupfields, col_values):
@@ -148,3 +318,70 @@ class GroupbyTable(object):
 
         del self.__grouptable['groupkey']
         return self.__grouptable
+
+    def __collect_spilled(self):
+        """
+        Groups and aggregates each spilled partition on its own, writing
+        its rows to a temporary file in the order their keys were first
+        seen, then merges the files into the result in that order.
+        """
+        key_columns = map(indexable, self.__table[list(self.__groupfields)])
+        runs = []
+        fields = None
+        num_groups = 0
+        for positions in self.__spilled_positions():
+            # Groups hold positions in the table itself, so the partition's
+            # rows are never copied out of it.
+            groups = OrderedDict()
+            if len(key_columns) > 1:
+                keys = izip(*[[column[i] for i in positions]
+                              for column in key_columns])
+            else:
+                keys = [key_columns[0][i] for i in positions]
+            for i, key in izip(positions, keys):
+                if key in groups:
+                    groups[key].append(i)
+                else:
+                    groups[key] = [i]
+            grouped = GroupbyTable(self.__table, self.__groupfields,
+                                   groups=groups)
+            grouped.__present_rows = self.__present_rows
+            for func, agg_fields, name in self.__aggs:
+                grouped.agg(func, *agg_fields, name=name)
+            aggregated = grouped.collect()
+            fields = aggregated.fields
+            num_groups += len(groups)
+
+            run = tempfile.TemporaryFile()
+            firsts = [group[0] for group in groups.itervalues()]
+            del groups, grouped
+            rows = izip(firsts, izip(*aggregated[fields]))
+            while True:
+                chunk = list(islice(rows, _SPILL_BUFFER_ROWS))
+                if not chunk:
+                    break
+                cPickle.dump(chunk, run, cPickle.HIGHEST_PROTOCOL)
+            runs.append(run)
+        self.__num_groups = num_groups
+
+        columns = [[] for _ in fields]
+        appends = [column.append for column in columns]
+        for _, row in heapq.merge(*map(_read_run, runs)):
+            for append, value in izip(appends, row):
+                append(value)
+        return datatable.DataTable.fromcolumns(fields, columns)
+
+
+def _read_run(run):
+    """
+    Yields the `(first position, row)` pairs written to the temporary file
+    `run`, a chunk at a time.
+    """
+    run.seek(0, os.SEEK_SET)
+    while True:
+        try:
+            chunk = cPickle.load(run)
+        except EOFError:
+            return
+        for pair in chunk:
+            yield pair
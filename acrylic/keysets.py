@@ -0,0 +1,139 @@
+# coding: utf-8
+
+"""
+Key sets for `wherein`, `semijoin` and `antijoin`.
+
+A key is the value at one field, or the tuple of values at several. Keys
+with a missing value never match anything.
+"""
+
+from array import array
+from itertools import izip
+from random import Random
+
+import math
+
+
+def row_keys(columns):
+    """
+    The key of every row, given the columns of the key fields.
+    """
+    if len(columns) == 1:
+        return columns[0]
+    return izip(*columns)
+
+
+def present_keys(columns):
+    """
+    The keys of the rows that aren't missing any key value, given the
+    columns of the key fields.
+    """
+    if len(columns) == 1:
+        return (key for key in columns[0] if key is not None)
+    return (key for key in izip(*columns) if None not in key)
+
+
+def key_set(columns):
+    """
+    The set of keys without missing values, given the columns of the key
+    fields.
+    """
+    if len(columns) == 1:
+        keys = set(columns[0])
+        keys.discard(None)
+        return keys
+    return set(present_keys(columns))
+
+
+def as_membership(collection):
+    """
+    Returns something cheap to test membership in: `collection` itself if
+    it is a set or dict, otherwise a set of its values. Falls back to the
+    collection (as a list, if it isn't a list or tuple) if its values
+    can't be hashed. A string is returned as it is, so testing membership
+    in it still looks for substrings rather than single characters.
+    """
+    if isinstance(collection, (set, frozenset, dict, basestring)):
+        return collection
+    try:
+        return set(collection)
+    except TypeError:
+        if isinstance(collection, (list, tuple)):
+            return collection
+        return list(collection)
+
+
+class BloomFilter(object):
+    """
+    A set that can only be added to, answering `key in bloom` with no false
+    negatives and false positives at about `error_rate`, once `capacity`
+    keys have been added. It takes about 14 bits per key for 1%, however
+    large the keys are.
+
+    This is a blocked Bloom filter: each key sets its bits within a single
+    word (an unsigned long: 64 bits on most platforms, 32 on Windows and
+    32-bit builds), by OR-ing in one of a fixed table of masks, which is one
+    Python operation per key instead of one per bit. Crowding the bits
+    into one word costs false positives, so it gets half again as many
+    bits as a classic Bloom filter, and sets a few less per key; with
+    32-bit words, twice as many bits, and fewer still.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        classic_bits_per_key = -math.log(error_rate) / math.log(2) ** 2
+        bits_factor, hashes_factor = ((1.5, 0.85) if _BLOCK_BITS >= 64
+                                      else (2.0, 0.6))
+        bits_per_key = bits_factor * classic_bits_per_key
+        num_hashes = min(16, max(1, int(round(
+            hashes_factor * classic_bits_per_key * math.log(2)))))
+        num_blocks = int(math.ceil(max(1, capacity) * bits_per_key /
+                                   _BLOCK_BITS))
+        self.__blocks = array('L', [0]) * num_blocks
+        self.__masks = _masks(num_hashes)
+
+    @property
+    def nbytes(self):
+        return self.__blocks.itemsize * len(self.__blocks)
+
+    def add(self, key):
+        h = (hash(key) * _GOLDEN) & _MASK64
+        self.__blocks[h % len(self.__blocks)] |= self.__masks[h >> 54]
+
+    def update(self, keys):
+        blocks, masks = self.__blocks, self.__masks
+        num_blocks = len(blocks)
+        for key in keys:
+            h = (hash(key) * _GOLDEN) & _MASK64
+            blocks[h % num_blocks] |= masks[h >> 54]
+
+    def __contains__(self, key):
+        h = (hash(key) * _GOLDEN) & _MASK64
+        mask = self.__masks[h >> 54]
+        return self.__blocks[h % len(self.__blocks)] & mask == mask
+
+
+# Python's hashes of small ints are the ints themselves; multiplying by
+# 2 ** 64 / golden ratio spreads them over all 64 bits.
+_GOLDEN = 0x9e3779b97f4a7c15
+
+_MASK64 = (1 << 64) - 1
+
+# Bits per block, and so per mask: the width of an unsigned long here.
+_BLOCK_BITS = array('L').itemsize * 8
+
+_mask_tables = {}
+
+
+def _masks(num_hashes):
+    """
+    1024 masks of `_BLOCK_BITS` bits, each with `num_hashes` bits set,
+    chosen from the top 10 bits of a key's hash. They are the same in every
+    process on the same platform.
+    """
+    if num_hashes not in _mask_tables:
+        rng = Random(num_hashes)
+        _mask_tables[num_hashes] = [
+            sum(1 << bit for bit in rng.sample(xrange(_BLOCK_BITS),
+                                               num_hashes))
+            for _ in xrange(1024)]
+    return _mask_tables[num_hashes]
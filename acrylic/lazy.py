@@ -0,0 +1,546 @@
+# coding: utf-8
+
+from itertools import compress, izip
+
+from .datarow import datarow_constructor
+from .expr import Expr, col
+from .keysets import (BloomFilter, as_membership, key_set, present_keys,
+                      row_keys)
+from .nulls import CSV_NULL_VALUES
+from .profiling import traced
+from .shared import indexable, take
+
+from . import ExcelRW
+from . import UnicodeRW
+
+import datatable
+
+
+class LazyTable(object):
+    """
+    A LazyTable is returned as a result of calling `.lazy` on a DataTable
+    object, or by opening a file with `LazyTable.fromcsv` or
+    `LazyTable.fromexcel`. Nothing is computed until `collect` is called:
+    every `where*`, `select` and `sort` call just records an operation
+    in a query plan.
+
+    This returns the same DataTable as the equivalent eager chain, but
+    without building a full intermediate table at every step:
+
+    big_red_orders = (orders.lazy()
+                            .where('color', 'red')
+                            .wheregreater('price', 20)
+                            .select('orderid', 'price')
+                            .sort('price', desc=True)
+                            .collect())
+
+    When the plan is collected:
+
+    1. All filters are evaluated before any sort: filters only decide which
+       rows survive and sorts only decide their order. Over a DataTable,
+       each filter is compiled into a loop over its column (as
+       `acrylic.col` expressions are) and only tests the rows that passed
+       the filters before it, which produces one list of row positions.
+    2. Only the columns that are needed downstream (by a filter, a sort,
+       or the final `select`) are read.
+    3. If the plan starts from a CSV or Excel file, the filters and the
+       projection are pushed into the file scan, so rejected rows and
+       unused columns are never stored at all.
+
+    Filter functions are assumed not to have side effects. Call `explain`
+    to see how a plan will be executed.
+
+    Missing values are treated as they are by DataTable: they never match
+    a `where*` filter on their field, and sort last unless `nulls='first'`.
+    """
+
+    def __init__(self, source, operations=()):
+        if isinstance(source, datatable.DataTable):
+            source = _TableSource(source)
+        elif not isinstance(source, (_TableSource, _FileSource)):
+            raise Exception("A LazyTable must start from a DataTable "
+                            "or a file.")
+        self.__source = source
+        self.__operations = tuple(operations)
+
+    @classmethod
+    def fromcsv(cls, path, delimiter=",", headers=None,
+                null_values=CSV_NULL_VALUES):
+        """
+        Starts a query plan that reads from a CSV file when collected.
+
+        Headers and `null_values` act as they do in `DataTable.fromcsv`:
+        pass in a list of headers to only make that subset of the columns
+        available.
+        """
+        return cls(_CSVSource(path, delimiter, headers, null_values))
+
+    @classmethod
+    def fromexcel(cls, path, sheet_name_or_num=0, headers=None):
+        """
+        Starts a query plan that reads from an Excel sheet when collected.
+
+        Headers act as they do in `DataTable.fromexcel`.
+        """
+        return cls(_ExcelSource(path, sheet_name_or_num, headers))
+
+    def __chain(self, operation):
+        return LazyTable(self.__source, self.__operations + (operation,))
+
+    def select(self, *fields):
+        """
+        Keeps only `fields`, in that order. Columns that are not selected
+        (and not needed by an earlier filter or sort) are never read.
+        """
+        if not fields:
+            raise Exception("Must select at least one field.")
+        datatable.validate_fields(fields)
+        return self.__chain(_Select(fields))
+
+    def sort(self, fieldname, key=lambda x: x, desc=False, nulls='last'):
+        """
+        Records a sort on `fieldname`. See `DataTable.sort`.
+        """
+        if nulls not in ('first', 'last'):
+            raise ValueError("`nulls` must be 'first' or 'last', not `%s`" %
+                             nulls)
+        return self.__chain(_Sort(fieldname, key, desc, nulls))
+
+    def where(self, fieldname, value, negate=False):
+        column = col(fieldname)
+        if value is None:
+            test = column.notnull() if negate else column.isnull()
+        elif negate:
+            test = column.notnull() & (column != value)
+        else:
+            test = column == value
+        return self.__chain(_Filter(fieldname, test, "where"))
+
+    def wherefunc(self, func, negate=False):
+        if isinstance(func, Expr):
+            return self.__chain(_Filter(None, ~func if negate else func,
+                                        "wherefunc"))
+        if negate:
+            test = lambda row: not func(row)
+        else:
+            test = func
+        return self.__chain(_Filter(None, test, "wherefunc"))
+
+    def wherein(self, fieldname, collection, negate=False):
+        column = col(fieldname)
+        collection = as_membership(collection)
+        test = column.notnull() & (column.notin(collection) if negate
+                                   else column.isin(collection))
+        return self.__chain(_Filter(fieldname, test, "wherein"))
+
+    def semijoin(self, other, on, bloom=False):
+        """
+        Keeps the rows whose value at `on` (a field, or a list of fields)
+        also appears in `other`, a DataTable, at the same fields. See
+        `DataTable.semijoin`. Like the `where*` filters, it is pushed
+        into file scans.
+
+        Pass `bloom=True` when `other` has a great many keys. Rather than
+        a set of every key, the scan then checks a Bloom filter (about 2
+        bytes per key), which rejects all but about 1% of the non-matching
+        rows; the rows that got through by mistake are removed after the
+        scan, checking only the keys that are left.
+        """
+        return self.__chain(_KeyFilter(other, on, "semijoin", bloom=bloom))
+
+    def antijoin(self, other, on):
+        """
+        Keeps the rows whose value at `on` does not appear in `other`. See
+        `DataTable.antijoin`.
+        """
+        return self.__chain(_KeyFilter(other, on, "antijoin", negate=True))
+
+    def wheregreater(self, fieldname, value):
+        column = col(fieldname)
+        return self.__chain(_Filter(fieldname,
+                                    column.notnull() & (column > value),
+                                    "wheregreater"))
+
+    def whereless(self, fieldname, value):
+        column = col(fieldname)
+        return self.__chain(_Filter(fieldname,
+                                    column.notnull() & (column < value),
+                                    "whereless"))
+
+    def wherenot(self, fieldname, value):
+        return self.where(fieldname, value, negate=True)
+
+    def wherenotfunc(self, func):
+        return self.wherefunc(func, negate=True)
+
+    def wherenotin(self, fieldname, value):
+        return self.wherein(fieldname, value, negate=True)
+
+    def __plan(self):
+        """
+        Validates the operations against the fields available at each step
+        and works out which source fields the plan needs.
+        """
+        available = list(self.__source.fields)
+        filters, sorts = [], []
+        for operation in self.__operations:
+            if isinstance(operation, _Select):
+                missing = [f for f in operation.fields if f not in available]
+                if missing:
+                    raise KeyError("Cannot select missing fields: %s" %
+                                   missing)
+                available = list(operation.fields)
+                continue
+            field = operation.field
+            if field is not None and field not in available:
+                raise KeyError("LazyTable does not have column `%s` at "
+                               "`%s`" % (operation.field, operation.name))
+            if isinstance(operation, _Filter):
+                filters.append((operation, tuple(available)))
+            else:
+                sorts.append(operation)
+
+        needed = list(available)
+        for operation, fields_at in filters:
+            referenced = operation.referenced(fields_at)
+            missing = [field for field in referenced if field not in fields_at]
+            if missing:
+                raise KeyError("LazyTable does not have columns %s at "
+                               "`%s`" % (missing, operation.name))
+            needed.extend(f for f in referenced if f not in needed)
+        for operation in sorts:
+            if operation.field not in needed:
+                needed.append(operation.field)
+        return available, needed, filters, sorts
+
+    def explain(self):
+        """
+        Returns a description of how `collect` will execute this plan.
+        """
+        output, needed, filters, sorts = self.__plan()
+        lines = [u"scan %s" % self.__source.describe(),
+                 u"  read columns: %s" % u", ".join(needed)]
+        if filters:
+            where = (u"pushed into scan" if isinstance(self.__source,
+                                                       _FileSource)
+                     else u"a column at a time")
+            lines.append(u"fused filter (%s):" % where)
+            lines.extend(u"  %s" % operation.describe()
+                         for operation, _ in filters)
+        lines.extend(operation.describe() for operation in sorts)
+        lines.append(u"gather columns: %s" % u", ".join(output))
+        return u"\n".join(lines)
+
+    @traced
+    def collect(self):
+        """
+        Executes the query plan and returns a new DataTable.
+        """
+        output, needed, filters, sorts = self.__plan()
+        columns, positions = self.__source.scan(needed, filters)
+        for operation, _ in filters:
+            if isinstance(operation, _KeyFilter):
+                positions = operation.confirm(columns, positions)
+        for operation in sorts:
+            column = indexable(columns[operation.field])
+            key = operation.key
+            missing = [i for i in positions if column[i] is None]
+            if missing:
+                positions = [i for i in positions if column[i] is not None]
+            positions.sort(key=lambda i: key(column[i]),
+                           reverse=operation.desc)
+            if operation.nulls == 'first':
+                positions = missing + positions
+            else:
+                positions.extend(missing)
+        return datatable.DataTable.fromcolumns(
+            output, [take(columns[field], positions) for field in output])
+
+
+class _Filter(object):
+    """
+    `test` is an Expr, or a function of a DataRow if `field` is None.
+    """
+
+    def __init__(self, field, test, name):
+        self.field = field
+        self.test = test
+        self.name = name
+
+    def describe(self):
+        if self.field is not None:
+            return u"%s(%s)" % (self.name, self.field)
+        if isinstance(self.test, Expr):
+            return u"%s(%r)" % (self.name, self.test)
+        return u"%s(<row>)" % self.name
+
+    def referenced(self, fields_at):
+        """
+        The fields this filter reads, given the fields available to it.
+        """
+        if isinstance(self.test, Expr):
+            return self.test.fields
+        if self.field is None:
+            return fields_at
+        return (self.field,)
+
+    def compile(self, index_of, fields_at):
+        """
+        Returns a function that tests one row tuple, where `index_of`
+        maps a field to its position in that tuple.
+        """
+        test = self.test
+        if isinstance(test, Expr):
+            return test.compile_row(index_of)
+        datarow = datarow_constructor(fields_at)
+        indexes = [index_of[field] for field in fields_at]
+        return lambda row: test(datarow([row[i] for i in indexes]))
+
+    def mask(self, columns, positions, fields_at):
+        """
+        Tests the rows at `positions` a column at a time, returning one
+        truth value per position. `columns` maps fields to full columns.
+        """
+        test = self.test
+        if isinstance(test, Expr):
+            return test.compile()(len(positions),
+                                  *[_gather(columns[field], positions)
+                                    for field in test.fields])
+        datarow = datarow_constructor(fields_at)
+        return [test(datarow(row)) for row
+                in izip(*[_gather(columns[field], positions)
+                          for field in fields_at])]
+
+
+class _KeyFilter(_Filter):
+    """
+    Tests each row's key (the value at one field, or the tuple of values
+    at several) against the keys of another DataTable.
+    """
+
+    def __init__(self, other, on, name, negate=False, bloom=False):
+        if not isinstance(other, datatable.DataTable):
+            raise TypeError("Can only join with a DataTable, not a %s" %
+                            type(other))
+        fields = (on,) if isinstance(on, basestring) else tuple(on)
+        missing = [field for field in fields if field not in other]
+        if missing:
+            raise KeyError("DataTable does not have fields: %s" % missing)
+        self.fields = fields
+        self.__other = other
+        self.__bloom = bloom
+        if bloom:
+            keys = BloomFilter(len(other))
+            keys.update(present_keys(other[list(fields)]))
+        else:
+            keys = key_set(other[list(fields)])
+        self.__keys = keys
+        self.__negate = negate
+        super(_KeyFilter, self).__init__(None, None, name)
+
+    def describe(self):
+        return u"%s(%s%s)" % (self.name, u", ".join(self.fields),
+                              u", bloom filter" if self.__bloom else u"")
+
+    def referenced(self, fields_at):
+        return self.fields
+
+    def compile(self, index_of, fields_at):
+        contains = self.__keys.__contains__
+        if len(self.fields) == 1:
+            index = index_of[self.fields[0]]
+            if self.__negate:
+                return lambda row: not contains(row[index])
+            return lambda row: contains(row[index])
+        indexes = [index_of[field] for field in self.fields]
+
+        def found(row):
+            key = tuple([row[i] for i in indexes])
+            return None not in key and contains(key)
+        if self.__negate:
+            return lambda row: not found(row)
+        return found
+
+    def mask(self, columns, positions, fields_at):
+        contains = self.__keys.__contains__
+        key_columns = [_gather(columns[field], positions)
+                       for field in self.fields]
+        if len(self.fields) == 1:
+            found = map(contains, key_columns[0])
+        else:
+            found = [None not in key and contains(key)
+                     for key in izip(*key_columns)]
+        if self.__negate:
+            return [not key_found for key_found in found]
+        return found
+
+    def confirm(self, columns, positions):
+        """
+        Drops the rows at `positions` that only got through the Bloom
+        filter by mistake. Only the keys that are left are put in a set,
+        which the other table's keys are then checked against.
+        """
+        if not self.__bloom:
+            return positions
+        keys = list(row_keys([take(columns[field], positions)
+                              for field in self.fields]))
+        candidates = set(keys)
+        confirmed = set(key for key
+                        in present_keys(self.__other[list(self.fields)])
+                        if key in candidates)
+        return [i for i, key in izip(positions, keys) if key in confirmed]
+
+
+class _Select(object):
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+
+
+class _Sort(object):
+
+    def __init__(self, field, key, desc, nulls):
+        self.field = field
+        self.key = key
+        self.desc = desc
+        self.nulls = nulls
+        self.name = "sort"
+
+    def describe(self):
+        return u"sort(%s%s%s)" % (self.field, u", desc" if self.desc else u"",
+                                  u", nulls first" if self.nulls == 'first'
+                                  else u"")
+
+
+def _gather(column, positions):
+    """
+    The values of `column` at `positions`, an xrange over every row or a
+    list of row positions.
+    """
+    if isinstance(positions, xrange):
+        return column
+    return take(column, positions)
+
+
+def _fuse(filters, index_of):
+    """
+    Combines every filter into a single row test that short-circuits
+    on the first filter that fails, for sources read a row at a time.
+    """
+    checks = [operation.compile(index_of, fields_at)
+              for operation, fields_at in filters]
+
+    def keep(row):
+        for check in checks:
+            if not check(row):
+                return False
+        return True
+
+    return keep
+
+
+class _TableSource(object):
+
+    def __init__(self, table):
+        self.__table = table
+
+    @property
+    def fields(self):
+        return self.__table.fields
+
+    def describe(self):
+        return u"DataTable (%s rows)" % len(self.__table)
+
+    def scan(self, needed, filters):
+        columns = dict((field, self.__table[field]) for field in needed)
+        positions = xrange(len(self.__table))
+        for operation, fields_at in filters:
+            positions = list(compress(positions, operation.mask(
+                columns, positions, fields_at)))
+            if not positions:
+                break
+        return columns, list(positions)
+
+
+class _FileSource(object):
+    """
+    Subclasses implement `_rows`, an iterator over the file whose first
+    element is the header row.
+    """
+
+    def __init__(self, headers):
+        self._headers = headers
+
+    @property
+    def fields(self):
+        if self._headers is not None:
+            return list(self._headers)
+        rows = self._rows()
+        header_row = list(rows.next())
+        rows.close()
+        return header_row
+
+    def scan(self, needed, filters):
+        rows = self._rows()
+        header_row = list(rows.next())
+        positions, _ = ExcelRW.index_headers(header_row)
+        missing = [field for field in needed if field not in positions]
+        if missing:
+            raise KeyError("File does not have fields: %s" % missing)
+        index_of = dict((field, positions[field]) for field in needed)
+        keep = _fuse(filters, index_of)
+        indexes = [index_of[field] for field in needed]
+        columns = [[] for _ in needed]
+        appends = [column.append for column in columns]
+        width = len(header_row)
+        for i, row in enumerate(rows):
+            if len(row) != width:
+                raise Exception("Row %s's length (%s) does not match "
+                                "headers' length (%s)" % (i, len(row), width))
+            if keep(row):
+                for append, index in izip(appends, indexes):
+                    append(row[index])
+        num_rows = len(columns[0]) if columns else 0
+        return dict(izip(needed, columns)), range(num_rows)
+
+
+class _CSVSource(_FileSource):
+
+    def __init__(self, path, delimiter, headers, null_values):
+        super(_CSVSource, self).__init__(headers)
+        self.__path = path
+        self.__delimiter = delimiter
+        self.__null_values = frozenset(null_values)
+
+    def describe(self):
+        return u"csv %s" % self.__path
+
+    def _rows(self):
+        null_values = self.__null_values
+        with open(self.__path, 'r') as f:
+            reader = UnicodeRW.UnicodeReader(f, delimiter=self.__delimiter)
+            yield reader.next()
+            for row in reader:
+                if null_values:
+                    row = [None if cell in null_values else cell
+                           for cell in row]
+                yield row
+
+
+class _ExcelSource(_FileSource):
+
+    def __init__(self, path, sheet_name_or_num, headers):
+        super(_ExcelSource, self).__init__(headers)
+        self.__path = path
+        self.__sheet_name_or_num = sheet_name_or_num
+
+    def describe(self):
+        return u"excel %s [%s]" % (self.__path, self.__sheet_name_or_num)
+
+    def _rows(self):
+        reader = ExcelRW.UnicodeReader(self.__path, self.__sheet_name_or_num)
+        header_row = reader.read_headers()
+        yield header_row
+        for row in reader.iter_rows(min_row=2,
+                                    columns=range(len(header_row))):
+            yield row
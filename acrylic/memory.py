@@ -0,0 +1,118 @@
+# coding: utf-8
+
+"""
+Helpers for DataTable.memory_usage() and DataTable.memory_report().
+
+Every object is counted once, by identity, across the whole table: a
+string that appears in a million cells (or in several columns) is only
+paid for once, which is how CPython actually stores it. Objects inside
+tuples, lists and dicts stored in cells are counted too.
+"""
+
+from __future__ import division
+from random import Random
+
+import sys
+
+# Bytes per value if a column were stored as a typed `array`.
+_TYPED_ITEMSIZE = {int: 8, float: 8}
+
+_CONTAINERS = (tuple, list, set, frozenset)
+
+
+def _object_size(obj, seen):
+    """
+    Bytes used by `obj` and everything it contains that isn't in `seen`.
+    Adds every object it counts to `seen`.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, _CONTAINERS):
+        size += sum(_object_size(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(_object_size(key, seen) + _object_size(value, seen)
+                    for key, value in obj.iteritems())
+    return size
+
+
+def _code_width(num_distinct):
+    for width, limit in ((1, 2 ** 8), (2, 2 ** 16), (4, 2 ** 32)):
+        if num_distinct <= limit:
+            return width
+    return 8
+
+
+def measure_column(column, seen, sample=None, seed=0):
+    """
+    Returns a dict describing the memory held by `column`:
+
+    container       the list (or array) itself
+    values          the values, excluding objects already in `seen`
+    distinct        the number of distinct objects (by identity)
+    typed           bytes as a typed array, or None if the values aren't
+                    all ints or all floats
+    dictionary      bytes as dictionary-encoded storage: one small integer
+                    code per row, plus each distinct value once
+
+    If `sample` is a number smaller than the column, only that many
+    randomly chosen values are inspected and the figures are scaled up.
+    Scaling assumes that a column whose sample is mostly repeated objects
+    has already shown all of its distinct values, and that any other
+    column keeps finding new ones at the same rate.
+    """
+    num_rows = len(column)
+    container = sys.getsizeof(column)
+    if sample is not None and sample < num_rows:
+        rng = Random(seed)
+        values = [column[i] for i in rng.sample(xrange(num_rows), sample)]
+    else:
+        values = column
+    inspected = len(values)
+
+    value_bytes = 0
+    distinct_bytes = 0
+    distinct_objects = set()
+    distinct_values = {}
+    kinds = set()
+    for value in values:
+        size = _object_size(value, seen)
+        value_bytes += size
+        distinct_objects.add(id(value))
+        kinds.add(type(value))
+        if distinct_values is None:
+            continue
+        try:
+            if value not in distinct_values:
+                distinct_values[value] = size or sys.getsizeof(value)
+        except TypeError:  # unhashable values can't be dictionary-encoded
+            distinct_values = None
+    if distinct_values is not None:
+        distinct_bytes = sum(distinct_values.itervalues())
+
+    distinct = len(distinct_objects)
+    if inspected < num_rows and inspected and distinct > inspected // 2:
+        scale = num_rows / inspected
+        value_bytes = int(value_bytes * scale)
+        distinct = int(distinct * scale)
+        if distinct_values is not None:
+            distinct_bytes = int(distinct_bytes * scale)
+            num_distinct_values = int(len(distinct_values) * scale)
+    elif distinct_values is not None:
+        num_distinct_values = len(distinct_values)
+
+    typed = None
+    if len(kinds) == 1 and kinds.issubset(_TYPED_ITEMSIZE):
+        typed = 64 + num_rows * _TYPED_ITEMSIZE[kinds.pop()]
+
+    dictionary = None
+    if distinct_values is not None:
+        dictionary = (64 + num_rows * _code_width(num_distinct_values) +
+                      distinct_bytes)
+
+    return {'container': container,
+            'values': value_bytes,
+            'distinct': distinct,
+            'typed': typed,
+            'dictionary': dictionary}
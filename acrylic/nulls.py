@@ -0,0 +1,121 @@
+# coding: utf-8
+
+"""
+Validity bitmaps for missing values.
+
+Every DataTable column may have a validity bitmap alongside it: a
+bytearray with one bit per row, set when the row has a value and clear
+when it is missing (null). A column without any nulls has no bitmap at
+all (`None`), so tables without missing data pay next to nothing for this.
+
+In the column itself, a null is stored as `None`. A column's bitmap is
+worked out from its values the first time an operation needs it, and then
+carried along as rows are filtered, gathered and appended.
+"""
+
+from itertools import chain, compress, izip
+
+# _BITS[byte] is the 8 validity flags that byte holds, lowest bit first.
+_BITS = [tuple(bool(byte & (1 << bit)) for bit in range(8))
+         for byte in range(256)]
+
+_POPCOUNT = [bin(byte).count('1') for byte in range(256)]
+
+# Values that the CSV readers treat as missing, by default.
+CSV_NULL_VALUES = (u"",)
+
+
+def validity_bitmap(column):
+    """
+    Returns the validity bitmap for `column`, or None if nothing in it is
+    missing.
+    """
+    # `None in column` would compare every value to None with `==`,
+    # which is slow for strings.
+    if not any(value is None for value in column):
+        return None
+    num_rows = len(column)
+    bitmap = bytearray('\xff' * ((num_rows + 7) // 8))
+    for i, value in enumerate(column):
+        if value is None:
+            bitmap[i >> 3] &= ~(1 << (i & 7))
+    return bitmap
+
+
+def validity_mask(bitmap, num_rows):
+    """
+    Returns a list of `num_rows` bools, True where the row is valid.
+    """
+    if bitmap is None:
+        return [True] * num_rows
+    mask = list(chain.from_iterable(_BITS[byte] for byte in bitmap))
+    del mask[num_rows:]
+    return mask
+
+
+def null_count(bitmap, num_rows):
+    if bitmap is None:
+        return 0
+    padding = len(bitmap) * 8 - num_rows
+    return num_rows - (sum(_POPCOUNT[byte] for byte in bitmap) - padding)
+
+
+def append_validity(bitmap, num_rows, valid):
+    """
+    Records whether the row appended at position `num_rows` is valid.
+    Returns the (possibly new) bitmap.
+    """
+    if bitmap is None:
+        if valid:
+            return None
+        bitmap = bytearray('\xff' * ((num_rows + 7) // 8))
+    if num_rows % 8 == 0:
+        bitmap.append(0xff)
+    if not valid:
+        bitmap[num_rows >> 3] &= ~(1 << (num_rows & 7))
+    return bitmap
+
+
+def valid_values(column, bitmap):
+    """
+    Returns the values in `column` that aren't missing.
+    """
+    if bitmap is None:
+        return list(column)
+    return list(compress(column, validity_mask(bitmap, len(column))))
+
+
+def mask_nulls(mask, bitmap):
+    """
+    Returns `mask` (a list of bools, one per row) with every missing row
+    set to False.
+    """
+    if bitmap is None:
+        return mask
+    return [keep and valid for keep, valid
+            in izip(mask, validity_mask(bitmap, len(mask)))]
+
+
+def replace_nulls(column, null_values):
+    """
+    Returns `column` with every value in `null_values` replaced by None.
+    The column is only copied if it contains one of them.
+    """
+    if not any(null in column for null in null_values):
+        return column
+    null_values = frozenset(null_values)
+    return [None if value in null_values else value for value in column]
+
+
+def split_nulls(positions, bitmap, num_rows):
+    """
+    Splits `positions` into those of present values and those of missing
+    values, keeping their order.
+    """
+    if bitmap is None:
+        return positions, []
+    mask = validity_mask(bitmap, num_rows)
+    present, missing = [], []
+    for i in positions:
+        (present if mask[i] else missing).append(i)
+    return present, missing
@@ -0,0 +1,115 @@
+# coding: utf-8
+
+"""
+Helpers for fanning DataTable work out to a pool of worker processes.
+
+Workers receive plain column slices (lists of values) rather than DataRows
+or whole DataTables, so only the data a worker needs is pickled. Functions
+sent to a worker must be picklable, which means they have to be defined at
+the top level of a module: lambdas and nested functions won't work.
+"""
+
+from itertools import izip
+
+import multiprocessing
+import traceback
+
+from .datarow import datarow_constructor
+
+# Below this many rows, starting a pool costs more than it saves.
+PARALLEL_MIN_ROWS = 10000
+
+
+class ParallelApplyError(Exception):
+    """
+    Raised in the parent process when a function fails in a worker.
+    `row` is the index of the failing row in the original DataTable.
+    """
+
+    def __init__(self, row, message):
+        super(ParallelApplyError, self).__init__(
+            "Function failed on row %s:\n%s" % (row, message))
+        self.row = row
+
+
+def pool_map(func, items, workers=None):
+    """
+    Returns `[func(item) for item in items]`, computed in a pool of
+    `workers` processes and in the same order as `items`.
+
+    If `workers` is 1 (or there is at most one item) no pool is started.
+    """
+    items = list(items)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return map(func, items)
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(func, items, chunksize=1)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return results
+
+
+def parallel_apply(func, columns, rowfields=None,
+                   workers=None, chunksize=None):
+    """
+    Applies `func` to every row of `columns` in a pool of worker processes
+    and returns the results in row order.
+
+    If `rowfields` is given, `columns` holds every column of the table and
+    `func` is passed a DataRow with those fields. Otherwise, the values of
+    `columns` are passed to `func` as positional arguments.
+
+    Small tables are run serially in this process, and then an exception
+    raised by `func` propagates unchanged, as it would from a plain
+    `apply`.
+    """
+    num_rows = len(columns[0]) if columns else 0
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(1000, -(-num_rows // (workers * 4)))
+
+    if num_rows < PARALLEL_MIN_ROWS or workers <= 1 or num_rows <= chunksize:
+        if rowfields:
+            datarow = datarow_constructor(rowfields)
+            return [func(datarow(values)) for values in izip(*columns)]
+        return [func(*values) for values in izip(*columns)]
+
+    chunks = [(func, rowfields, start,
+               [column[start:start + chunksize] for column in columns])
+              for start in xrange(0, num_rows, chunksize)]
+    results = []
+    for failed, outcome in pool_map(_apply_chunk, chunks, workers):
+        if failed:
+            raise ParallelApplyError(*outcome)
+        results.extend(outcome)
+    return results
+
+
+def _apply_chunk(chunk):
+    """
+    Runs in the worker. Returns `(False, results)`, or
+    `(True, (row, formatted_traceback))` on the first failing row.
+    """
+    func, rowfields, start, columns = chunk
+    results = []
+    append = results.append
+    datarow = datarow_constructor(rowfields) if rowfields else None
+    for offset, values in enumerate(izip(*columns)):
+        try:
+            if datarow is not None:
+                append(func(datarow(values)))
+            else:
+                append(func(*values))
+        except Exception:
+            return True, (start + offset, traceback.format_exc())
+    return False, results
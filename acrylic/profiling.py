@@ -0,0 +1,202 @@
+# coding: utf-8
+
+"""
+Opt-in tracing of DataTable operations.
+
+Public operations (`where`, `sort`, `groupby`, `join`, `fromcsv`, ...) are
+wrapped with `traced`. While no callback is registered the wrapper only
+checks an empty list before calling straight through, so tracing costs
+next to nothing when it is off.
+
+The simplest way in is the `profile` context manager:
+
+    from acrylic.profiling import profile
+
+    with profile() as prof:
+        run_my_pipeline()
+    print prof.report()
+
+For custom handling (logging, metrics), register a callback. It receives
+an `Operation` record after every traced call:
+
+    add_callback(lambda op: log.debug('%s took %.3fs', op.name, op.seconds))
+
+Operations called from inside other operations (like the `mask` inside a
+`where`) are recorded too, with a greater `depth`.
+"""
+
+from __future__ import division
+from collections import namedtuple, OrderedDict
+from functools import wraps
+
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2, without the pytracemalloc backport
+    tracemalloc = None
+
+Operation = namedtuple('Operation', ['name', 'seconds', 'rows_in',
+                                     'rows_out', 'columns',
+                                     'bytes_allocated', 'depth'])
+
+_callbacks = []
+_depth = [0]
+
+
+def add_callback(callback):
+    """
+    Registers `callback`, which will be called with an `Operation`
+    after every traced call.
+    """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _callbacks.remove(callback)
+
+
+def _size(obj):
+    """
+    Rows and columns of a DataTable-like result, or None.
+    """
+    try:
+        num_rows = len(obj)
+    except TypeError:
+        return None, None
+    fields = getattr(obj, 'fields', None)
+    return num_rows, len(fields) if fields is not None else None
+
+
+def _memory():
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return None
+
+
+def _report(name, args, seconds, rows_in, memory_before, result):
+    """
+    Calls every callback with the `Operation` record of one call.
+    """
+    memory_after = _memory()
+    if memory_before is None or memory_after is None:
+        allocated = None
+    else:
+        allocated = memory_after - memory_before
+    rows_out, columns = _size(result) if result is not None \
+        else (None, None)
+    if columns is None and args and hasattr(args[0], 'fields'):
+        columns = len(args[0].fields)
+    operation = Operation(name, seconds, rows_in, rows_out, columns,
+                          allocated, _depth[0])
+    for callback in list(_callbacks):
+        callback(operation)
+
+
+def traced(func):
+    """
+    Decorates a DataTable operation so that its calls are recorded while
+    a callback is registered. If the operation raises, its exception is
+    the one that propagates, even if a callback raises too.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _callbacks:
+            return func(*args, **kwargs)
+
+        rows_in = None
+        if args and not isinstance(args[0], type):
+            rows_in = _size(args[0])[0]
+        memory_before = _memory()
+        _depth[0] += 1
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            exc_info = sys.exc_info()
+            _depth[0] -= 1
+            try:
+                _report(name, args, time.time() - start, rows_in,
+                        memory_before, None)
+            except Exception:
+                pass  # don't mask the operation's own error
+            raise exc_info[0], exc_info[1], exc_info[2]
+        _depth[0] -= 1
+        _report(name, args, time.time() - start, rows_in, memory_before,
+                result)
+        return result
+
+    return wrapper
+
+
+class profile(object):
+    """
+    Records every traced operation run inside the `with` block.
+
+    Pass `memory=True` to also measure the bytes each operation leaves
+    allocated. This needs `tracemalloc` (Python 3, or the pytracemalloc
+    backport on Python 2) and slows everything down while it runs.
+    """
+
+    def __init__(self, memory=False):
+        self.operations = []
+        self.__memory = memory
+        self.__started_tracing = False
+
+    def __enter__(self):
+        if self.__memory:
+            if tracemalloc is None:
+                raise Exception("Measuring memory requires `tracemalloc`.")
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.__started_tracing = True
+        add_callback(self.operations.append)
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        remove_callback(self.operations.append)
+        if self.__started_tracing:
+            tracemalloc.stop()
+
+    def summary(self, toplevel=False):
+        """
+        Returns a DataTable with one row per operation name: the number of
+        calls, cumulative and mean time, rows in and out, and bytes
+        allocated, sorted by cumulative time (slowest first).
+
+        With `toplevel=True`, operations called from inside other
+        operations are left out, so times add up to the total.
+        """
+        from .datatable import DataTable
+
+        totals = OrderedDict()
+        for operation in self.operations:
+            if toplevel and operation.depth > 0:
+                continue
+            if operation.name not in totals:
+                totals[operation.name] = [0, 0.0, 0, 0, None]
+            total = totals[operation.name]
+            total[0] += 1
+            total[1] += operation.seconds
+            total[2] += operation.rows_in or 0
+            total[3] += operation.rows_out or 0
+            if operation.bytes_allocated is not None:
+                total[4] = (total[4] or 0) + operation.bytes_allocated
+
+        table = DataTable(headers=['operation', 'calls', 'cumulative_s',
+                                   'mean_s', 'rows_in', 'rows_out',
+                                   'bytes_allocated'])
+        for name, (calls, seconds, rows_in, rows_out, allocated) in \
+                totals.items():
+            table.append([name, calls, seconds, seconds / calls, rows_in,
+                          rows_out, allocated])
+        return table.sort('cumulative_s', desc=True)
+
+    def report(self, toplevel=False):
+        """
+        The `summary` as a tab-separated string, ready to print.
+        """
+        return self.summary(toplevel).t
@@ -0,0 +1,136 @@
+# coding: utf-8
+
+"""
+Renders DataTables as text for DataTable.render(), and for the `t`,
+`pretty`, `jira` and `html` properties.
+
+Rows are formatted a chunk at a time, joined, and written straight to the
+output, so rendering takes time in proportion to the size of the table and
+never holds more than one chunk of text. Pass `max_rows` to render only
+the first and last rows, with a row count.
+"""
+
+from itertools import izip
+
+import io
+
+# Rows are formatted and written this many at a time.
+RENDER_CHUNK_ROWS = 1024
+
+FORMATS = ('t', 'jira', 'html')
+
+# repr() of a DataTable shows at most this many rows.
+REPR_MAX_ROWS = 20
+
+
+class _TextFormat(object):
+
+    def __init__(self, row_delim, header_delim=None, header_pad=u"",
+                 pad=u""):
+        self.row_delim = row_delim
+        self.header_delim = row_delim if header_delim is None \
+            else header_delim
+        self.header_pad = header_pad
+        self.pad = pad
+
+    def header(self, fields):
+        return (self.header_pad + self.header_delim.join(fields) +
+                self.header_pad)
+
+    def rows(self, rows):
+        delim, pad = self.row_delim, self.pad
+        return u"\n".join([pad + delim.join(map(unicode, row)) + pad
+                           for row in rows])
+
+    def start(self, fields):
+        return self.header(fields)
+
+    def separator(self):
+        return u"\n"
+
+    def ellipsis(self, num_fields):
+        return u"..."
+
+    def end(self, num_rows, num_fields, truncated):
+        if truncated:
+            return u"\n[%d rows x %d columns]" % (num_rows, num_fields)
+        return u""
+
+
+class _HTMLFormat(object):
+
+    def start(self, fields):
+        return (u"<table><tr>" + u"".join([u"<th>" + field + u"</th>"
+                                           for field in fields]) + u"</tr>")
+
+    def rows(self, rows):
+        return u"".join([u"<tr>" + u"".join([u"<td>" + unicode(value) +
+                                             u"</td>" for value in row]) +
+                         u"</tr>" for row in rows])
+
+    def separator(self):
+        return u""
+
+    def ellipsis(self, num_fields):
+        return u'<tr><td colspan="%d">...</td></tr>' % num_fields
+
+    def end(self, num_rows, num_fields, truncated):
+        if truncated:
+            return (u"</table><p>[%d rows x %d columns]</p>" %
+                    (num_rows, num_fields))
+        return u"</table>"
+
+
+_FORMATS = {
+    't': _TextFormat(u"\t"),
+    'jira': _TextFormat(u"|", header_delim=u"||", header_pad=u"||",
+                        pad=u"|"),
+    'html': _HTMLFormat(),
+}
+
+
+def render(table, out, format='t', max_rows=None):
+    """
+    Writes `table` to `out`, a file-like object, in `format`: 't'
+    (tab-separated), 'jira' or 'html'. Text is written as unicode to
+    `io` text streams (like `io.StringIO`) and as UTF-8 to anything else.
+
+    If `max_rows` is given and the table is longer, only its first and
+    last rows are written (`max_rows` in all), around a "..." row,
+    followed by the table's size.
+    """
+    if format not in _FORMATS:
+        raise ValueError("Unknown format `%s`. Use one of: %s" %
+                         (format, ", ".join(FORMATS)))
+    style = _FORMATS[format]
+    if isinstance(out, io.TextIOBase):
+        write = out.write
+    else:
+        write = lambda text: out.write(text.encode('utf-8'))
+
+    fields = table.fields
+    num_rows = len(table)
+    truncated = max_rows is not None and num_rows > max_rows
+    if truncated:
+        head = max_rows - max_rows // 2
+        spans = [(0, head), (num_rows - max_rows // 2, num_rows)]
+    else:
+        spans = [(0, num_rows)]
+
+    columns = [table[field] for field in fields]
+    write(style.start(fields))
+    for n, (start, stop) in enumerate(spans):
+        if n:
+            write(style.separator() + style.ellipsis(len(fields)))
+        for chunk_start in xrange(start, stop, RENDER_CHUNK_ROWS):
+            chunk_stop = min(chunk_start + RENDER_CHUNK_ROWS, stop)
+            rows = izip(*[column[chunk_start:chunk_stop]
+                          for column in columns])
+            write(style.separator() + style.rows(rows))
+    write(style.end(num_rows, len(fields), truncated))
+
+
+def render_string(table, format='t', max_rows=None):
+    out = io.StringIO()
+    render(table, out, format, max_rows)
+    return out.getvalue()
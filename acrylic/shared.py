@@ -0,0 +1,355 @@
+# coding: utf-8
+
+"""
+Sharing a DataTable between processes without pickling its data.
+
+`DataTable.share()` writes every column, in the layout of `columnar.py`,
+into one file in shared memory (`/dev/shm` where it exists) and returns a
+`SharedTable` handle. The handle is tiny to pickle, so it can be sent to
+worker processes, which `attach` to the file: they map it read-only and
+read the columns in place, so the table is never copied into each worker.
+(Python 2 has no `multiprocessing.shared_memory`; a memory-mapped file in
+/dev/shm is what that module uses underneath on Linux.)
+
+The process that called `share()` owns the file and removes it when the
+handle is closed, when its `with` block ends, or at the latest when the
+process exits. Attached tables keep working after that, since the
+mapping outlives the file's name.
+"""
+
+from abc import ABCMeta, abstractmethod
+from array import array
+from itertools import chain, compress, islice, izip
+
+import atexit
+import cPickle
+import mmap
+import os
+import tempfile
+import uuid
+
+from .columnar import encode_column, itemsize, unpack
+from .nulls import validity_mask
+
+import datatable
+
+SHARED_MEMORY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') \
+    else tempfile.gettempdir()
+
+# Values are decoded this many at a time when iterating over a column.
+_CHUNK_ROWS = 4096
+
+# Reading a single value costs about as much as decoding this many values
+# in bulk, so reading more than 1 / _SCATTERED_READ_RATIO of a column at
+# scattered positions is quicker done by decoding all of it.
+_SCATTERED_READ_RATIO = 32
+
+_owned_paths = set()
+
+
+@atexit.register
+def _remove_owned():
+    for path in list(_owned_paths):
+        _unlink(path)
+
+
+def _unlink(path):
+    _owned_paths.discard(path)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SharedColumn(object):
+    """
+    A read-only column that reads its values straight out of a shared
+    memory mapping. It can be indexed, sliced, iterated over and measured
+    like a list; slicing returns a list.
+
+    Subclasses decode the values of one kind of column, in `_read`.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, mapping, num_rows, validity):
+        self._mapping = mapping
+        self._num_rows = num_rows
+        self._validity = validity
+
+    def __len__(self):
+        return self._num_rows
+
+    @abstractmethod
+    def _read(self, start, stop):
+        """
+        Returns the values in rows [start, stop) as a list, without
+        applying the validity bitmap.
+        """
+
+    def _chunk(self, start, stop):
+        values = self._read(start, stop)
+        if self._validity is not None and stop > start:
+            first_byte = start >> 3
+            bits = validity_mask(self._validity[first_byte:(stop + 7) >> 3],
+                                 stop - first_byte * 8)[start & 7:]
+            for i in compress(xrange(stop - start), [not bit for bit in bits]):
+                values[i] = None
+        return values
+
+    def __iter__(self):
+        return chain.from_iterable(
+            self._chunk(start, min(start + _CHUNK_ROWS, self._num_rows))
+            for start in xrange(0, self._num_rows, _CHUNK_ROWS))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self._num_rows)
+            if step == 1:
+                return self._chunk(start, max(start, stop))
+            return self.take(xrange(start, stop, step))
+        if item < 0:
+            item += self._num_rows
+        if not 0 <= item < self._num_rows:
+            raise IndexError("column index out of range")
+        return self._chunk(item, item + 1)[0]
+
+    def __setitem__(self, item, value):
+        raise TypeError("SharedColumn is read-only; assign a new column to "
+                        "the table instead, like `table[field] = list(...)`")
+
+    def __delitem__(self, item):
+        raise TypeError("SharedColumn is read-only; assign a new column to "
+                        "the table instead, like `table[field] = list(...)`")
+
+    def __contains__(self, value):
+        return any(value == element for element in self)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'SharedColumn(%r)' % list(self)
+
+    def tolist(self):
+        return self[:]
+
+    def take(self, positions):
+        """
+        The values at `positions`, a sequence of row indexes. Unless there
+        are only a few, the whole column is decoded in one go and indexed,
+        rather than decoding each value on its own.
+        """
+        if len(positions) * _SCATTERED_READ_RATIO < self._num_rows:
+            return [self[i] for i in positions]
+        values = self.tolist()
+        return [values[i] for i in positions]
+
+
+def take(column, positions):
+    """
+    The values of any column at `positions`, a sequence of row indexes.
+    """
+    if isinstance(column, SharedColumn):
+        return column.take(positions)
+    return [column[i] for i in positions]
+
+
+def indexable(column):
+    """
+    `column` itself, or if it is a SharedColumn, its values decoded into a
+    list, for code about to read it at many scattered positions.
+    """
+    if isinstance(column, SharedColumn):
+        return column.tolist()
+    return column
+
+
+class _SharedNumbers(SharedColumn):
+
+    def __init__(self, mapping, num_rows, validity, format, offset):
+        super(_SharedNumbers, self).__init__(mapping, num_rows, validity)
+        self.__format = format
+        self.__offset = offset
+        self.__itemsize = itemsize(format)
+
+    def _read(self, start, stop):
+        offset, size = self.__offset, self.__itemsize
+        values = unpack(self.__format, self._mapping[offset + start * size:
+                                                     offset + stop * size])
+        return values.tolist() if isinstance(values, array) else values
+
+
+class _SharedStrings(SharedColumn):
+
+    def __init__(self, mapping, num_rows, validity, kind, format,
+                 offsets_offset, blob_offset):
+        super(_SharedStrings, self).__init__(mapping, num_rows, validity)
+        self.__unicode = kind == 'unicode'
+        self.__format = format
+        self.__offsets_offset = offsets_offset
+        self.__blob_offset = blob_offset
+        self.__itemsize = itemsize(format)
+
+    def _read(self, start, stop):
+        offsets = unpack(self.__format, self._mapping[
+            self.__offsets_offset + start * self.__itemsize:
+            self.__offsets_offset + (stop + 1) * self.__itemsize])
+        base, first = self.__blob_offset, offsets[0]
+        blob = self._mapping[base + first:base + offsets[-1]]
+        decode = self.__unicode
+        if decode:
+            text = blob.decode('utf-8')
+            if len(text) == len(blob):
+                # Only ASCII, so byte offsets are character offsets too.
+                blob, decode = text, False
+        values = [blob[start - first:end - first]
+                  for start, end in izip(offsets, islice(offsets, 1, None))]
+        if decode:
+            values = [value.decode('utf-8') for value in values]
+        return values
+
+
+class _SharedDictionary(_SharedNumbers):
+    """
+    A dictionary-encoded column: the codes are read from the mapping and
+    looked up in the (small) list of distinct values.
+    """
+
+    def __init__(self, mapping, num_rows, format, offset, dictionary):
+        super(_SharedDictionary, self).__init__(mapping, num_rows, None,
+                                                format, offset)
+        self.__dictionary = dictionary
+
+    def _read(self, start, stop):
+        codes = super(_SharedDictionary, self)._read(start, stop)
+        return map(self.__dictionary.__getitem__, codes)
+
+
+class SharedTable(object):
+    """
+    A handle to a DataTable in shared memory, returned by
+    `DataTable.share()`. Pickle it (or pass it to a process pool) and
+    call `attach` in the other process to get the table back.
+    """
+
+    def __init__(self, path, fields, layout, owner=False):
+        self.path = path
+        self.fields = list(fields)
+        self.__layout = layout
+        self.__owner = owner
+
+    @classmethod
+    def create(cls, table, directory=SHARED_MEMORY_DIR):
+        """
+        Writes `table` to a new file in `directory` and returns the owning
+        handle.
+        """
+        path = os.path.join(directory, 'acrylic-%s' % uuid.uuid4().hex)
+        layout = []
+        _owned_paths.add(path)
+        try:
+            with open(path, 'wb') as f:
+                for field in table.fields:
+                    kind, format, num_rows, validity, buffers = \
+                        encode_column(table[field])
+                    if kind == 'object':
+                        buffers = (_dumps(buffers[0]),)
+                    elif kind == 'dictionary':
+                        buffers = (buffers[0], _dumps(buffers[1]))
+                    spans = [_write_aligned(f, buffer) for buffer in buffers]
+                    validity_span = (None if validity is None
+                                     else _write_aligned(f, validity))
+                    layout.append((kind, format, num_rows, validity_span,
+                                   spans))
+        except BaseException:
+            _unlink(path)
+            raise
+        return cls(path, table.fields, layout, owner=True)
+
+    def attach(self):
+        """
+        Maps the shared file read-only and returns a DataTable whose
+        columns read from it in place. Columns of mixed or unusual types
+        are unpickled into ordinary lists instead.
+
+        The shared columns can't be changed in place: assigning to one of
+        their values raises TypeError. Replacing whole columns and sorting
+        work as usual, and `append` first copies the columns into lists.
+        """
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            mapping = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) \
+                if size else ''
+
+        def read(span):
+            start, length = span
+            return mapping[start:start + length]
+
+        columns = []
+        for kind, format, num_rows, validity_span, spans in self.__layout:
+            validity = None
+            if validity_span is not None:
+                validity = bytearray(read(validity_span))
+            if kind == 'object':
+                columns.append(cPickle.loads(read(spans[0])))
+            elif kind == 'dictionary':
+                columns.append(_SharedDictionary(
+                    mapping, num_rows, format, spans[0][0],
+                    cPickle.loads(read(spans[1]))))
+            elif kind in ('number', 'array'):
+                columns.append(_SharedNumbers(mapping, num_rows, validity,
+                                              format, spans[0][0]))
+            else:
+                columns.append(_SharedStrings(mapping, num_rows, validity,
+                                              kind, format, spans[0][0],
+                                              spans[1][0]))
+        return datatable.DataTable.fromcolumns(self.fields, columns)
+
+    def close(self):
+        """
+        Removes the shared file, if this handle owns it. Tables that are
+        already attached keep working.
+        """
+        if self.__owner:
+            _unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # Copies of the handle never own the file.
+        return self.path, self.fields, self.__layout
+
+    def __setstate__(self, state):
+        self.path, self.fields, self.__layout = state
+        self.__owner = False
+
+
+def _dumps(value):
+    return cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+
+
+def _write_aligned(f, buffer):
+    """
+    Writes `buffer` at the next 8-byte boundary of `f`; returns its
+    (offset, length).
+    """
+    padding = -f.tell() % 8
+    if padding:
+        f.write('\0' * padding)
+    offset = f.tell()
+    f.write(buffer)
+    return offset, len(buffer)
@@ -0,0 +1,303 @@
+# coding: utf-8
+
+"""
+Streaming column statistics for DataTable.describe() and describe().
+
+Each column is summarized by a `ColumnStats`, which is fed the column one
+chunk at a time and never holds more than a bounded amount of state, so
+tables that don't fit in memory can be described chunk by chunk.
+
+- mean and standard deviation are combined chunk by chunk with the
+  parallel form of Welford's algorithm (Chan et al.), which stays
+  accurate where summing squares would not;
+- distinct values are counted exactly up to `EXACT_DISTINCT_LIMIT`, then
+  estimated with a HyperLogLog sketch (about 1.6% standard error). A
+  table described in a single chunk is always counted exactly;
+- quantiles are estimated with a KLL sketch, which keeps a few hundred
+  values however long the column is.
+"""
+
+from __future__ import division
+from collections import OrderedDict
+from random import Random
+
+import math
+
+EXACT_DISTINCT_LIMIT = 10000
+
+DEFAULT_QUANTILES = (.25, .5, .75)
+
+_NUMERIC_TYPES = frozenset([int, long, float])
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value):
+    """
+    A well-mixed 64-bit hash of `value`. Python's own hashes of small ints
+    are the ints themselves, which HyperLogLog can't use directly.
+    (This is MurmurHash3's 64-bit finalizer.)
+    """
+    h = hash(value) & _MASK64
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & _MASK64
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & _MASK64
+    h ^= h >> 33
+    return h
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct values seen, in `2 ** precision`
+    bytes. The standard error is about `1.04 / sqrt(2 ** precision)`.
+    """
+
+    def __init__(self, precision=12):
+        self.__precision = precision
+        self.__registers = bytearray(1 << precision)
+
+    def update(self, values):
+        precision = self.__precision
+        registers = self.__registers
+        width = 64 - precision
+        low_bits = (1 << width) - 1
+        for value in values:
+            h = _mix64(value)
+            index = h >> width
+            rank = width - (h & low_bits).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def estimate(self):
+        m = len(self.__registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / math.fsum(2.0 ** -register
+                                        for register in self.__registers)
+        zeros = self.__registers.count('\x00')
+        if raw <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return raw
+
+
+class QuantileSketch(object):
+    """
+    A KLL sketch: estimates quantiles of a stream of values while keeping
+    about `3 * k` of them. Values are kept in levels; an item at level `h`
+    stands for `2 ** h` of the original values. When a level fills up it
+    is sorted and every other item (from a random offset) is promoted to
+    the level above.
+
+    Until the stream outgrows level 0, quantiles are exact.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.__k = k
+        self.__levels = [[]]
+        self.__rng = Random(seed)
+
+    def __capacity(self, level):
+        depth = len(self.__levels) - level - 1
+        return max(2, int(math.ceil(self.__k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        self.__levels[0].extend(values)
+        level = 0
+        while level < len(self.__levels):
+            items = self.__levels[level]
+            if len(items) > self.__capacity(level):
+                if level + 1 == len(self.__levels):
+                    self.__levels.append([])
+                items.sort()
+                kept = [items.pop()] if len(items) % 2 else []
+                offset = self.__rng.randint(0, 1)
+                self.__levels[level + 1].extend(items[offset::2])
+                self.__levels[level] = kept
+            level += 1
+
+    def quantiles(self, fractions):
+        """
+        Returns the estimated value at each of `fractions` (between 0 and
+        1), or Nones if nothing has been seen.
+        """
+        weighted = sorted((item, 1 << level)
+                          for level, items in enumerate(self.__levels)
+                          for item in items)
+        if not weighted:
+            return [None] * len(fractions)
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for fraction in fractions:
+            target = fraction * total
+            cumulative = 0
+            for item, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    break
+            results.append(item)
+        return results
+
+
+class ColumnStats(object):
+    """
+    Summary statistics of one column, fed a chunk at a time with `update`.
+
+    `mean`, `std` and quantiles are only computed while every value seen
+    is an int, long or float. `distinct` is None if the values aren't
+    hashable.
+    """
+
+    def __init__(self, quantiles=DEFAULT_QUANTILES):
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.__numeric = True
+        self.__mean = 0.0
+        self.__m2 = 0.0
+        self.__distinct = set()
+        self.__hll = None
+        self.__quantiles = quantiles
+        self.__sketch = QuantileSketch()
+
+    def update(self, values, num_nulls=None):
+        """
+        Adds a chunk of values. Missing values (None) are counted as nulls
+        and otherwise ignored. If the caller has already dropped them,
+        it passes how many there were as `num_nulls`.
+        """
+        if num_nulls is None:
+            present = [value for value in values if value is not None]
+            num_nulls = len(values) - len(present)
+        else:
+            present = values
+        self.nulls += num_nulls
+        if not present:
+            return
+
+        n = len(present)
+        chunk_min, chunk_max = min(present), max(present)
+        if self.count == 0:
+            self.min, self.max = chunk_min, chunk_max
+        else:
+            self.min = min(self.min, chunk_min)
+            self.max = max(self.max, chunk_max)
+
+        if self.__numeric and not _NUMERIC_TYPES.issuperset(map(type,
+                                                                present)):
+            self.__numeric = False
+            self.__sketch = None
+        if self.__numeric:
+            self.__merge_moments(n, present)
+            self.__sketch.update(present)
+
+        self.__count_distinct(present)
+        self.count += n
+
+    def __merge_moments(self, n, present):
+        """
+        Combines the chunk's mean and sum of squared deviations with the
+        running ones.
+        """
+        chunk_mean = math.fsum(present) / n
+        chunk_m2 = math.fsum([(x - chunk_mean) * (x - chunk_mean)
+                              for x in present])
+        total = self.count + n
+        delta = chunk_mean - self.__mean
+        self.__mean += delta * n / total
+        self.__m2 += chunk_m2 + delta * delta * self.count * n / total
+
+    def __count_distinct(self, present):
+        # The exact set is only swapped for a sketch once another chunk
+        # arrives, so a table described in one chunk is always exact.
+        if (self.__distinct is not None and
+                len(self.__distinct) > EXACT_DISTINCT_LIMIT):
+            self.__hll = HyperLogLog()
+            self.__hll.update(self.__distinct)
+            self.__distinct = None
+        if self.__distinct is not None:
+            try:
+                self.__distinct.update(present)
+            except TypeError:  # unhashable values
+                self.__distinct = None
+        elif self.__hll is not None:
+            self.__hll.update(present)
+
+    @property
+    def mean(self):
+        if not self.__numeric or not self.count:
+            return None
+        return self.__mean
+
+    @property
+    def std(self):
+        """
+        The sample standard deviation (dividing by n - 1).
+        """
+        if not self.__numeric or self.count < 2:
+            return None
+        return math.sqrt(self.__m2 / (self.count - 1))
+
+    @property
+    def distinct(self):
+        if self.__distinct is not None:
+            return len(self.__distinct)
+        if self.__hll is not None:
+            return int(round(self.__hll.estimate()))
+        return None
+
+    @property
+    def quantiles(self):
+        if self.__sketch is None:
+            return [None] * len(self.__quantiles)
+        return self.__sketch.quantiles(self.__quantiles)
+
+
+def quantile_name(fraction):
+    return 'q%g' % (fraction * 100)
+
+
+def describe(chunks, fields=None, quantiles=DEFAULT_QUANTILES):
+    """
+    Returns a DataTable with one row of statistics per field, computed in
+    one pass over `chunks`, an iterable (like a generator) of DataTables
+    with the same fields. Only one chunk needs to be in memory at a time.
+
+    field      the column
+    count      values present
+    nulls      missing values
+    distinct   distinct values present; estimated once there are more
+               than EXACT_DISTINCT_LIMIT of them across several chunks
+    min, max   smallest and largest values present
+    mean, std  mean and sample standard deviation, for numeric columns
+    q25, ...   estimated quantiles, one column per fraction in `quantiles`,
+               for numeric columns
+    """
+    from .datatable import DataTable
+
+    summaries = None
+    for chunk in chunks:
+        if summaries is None:
+            if fields is None:
+                fields = chunk.fields
+            missing = [field for field in fields if field not in chunk]
+            if missing:
+                raise KeyError("DataTable does not have fields: %s" % missing)
+            summaries = OrderedDict((field, ColumnStats(quantiles))
+                                    for field in fields)
+        nullcounts = chunk.nullcounts()
+        for field, summary in summaries.iteritems():
+            column = chunk[field]
+            if nullcounts[field]:
+                column = [value for value in column if value is not None]
+            summary.update(column, nullcounts[field])
+
+    headers = (['field', 'count', 'nulls', 'distinct', 'min', 'max', 'mean',
+                'std'] + [quantile_name(fraction) for fraction in quantiles])
+    table = DataTable(headers=headers)
+    for field, summary in (summaries or {}).iteritems():
+        table.append([field, summary.count, summary.nulls, summary.distinct,
+                      summary.min, summary.max, summary.mean, summary.std] +
+                     summary.quantiles)
+    return table
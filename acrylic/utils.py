@@ -1,22 +1,51 @@
 # coding: utf-8
 
 from ExcelRW import UnicodeWriter
-from itertools import ifilterfalse
+from itertools import ifilterfalse, izip
+from random import Random
 
 
-def excel(path, datatables, sheetnames=None):
-    writer = UnicodeWriter(path)
+def excel(path, datatables, sheetnames=None, number_formats=None):
+    """
+    Writes each DataTable in `datatables` to its own sheet of one .xlsx
+    file.
+
+    Instead of a DataTable, a sheet can be an iterable (like a generator)
+    of DataTable chunks with the same fields. Chunks are written one at a
+    time in openpyxl's write-only mode, so a sheet never has to fit in
+    memory all at once. (Memory use is only flat with openpyxl 2.6+ and
+    lxml installed; otherwise openpyxl buffers the sheet itself.)
+
+    `number_formats` maps field names to Excel number formats, like
+    {'price': '0.00', 'date': 'yyyy-mm-dd'}. They apply to that column
+    in every sheet.
+    """
+    from datatable import DataTable
+
     if sheetnames is None:
-        sheetnames = ["datatable_%02d" % i for i in range(1, len(datatables))]
+        sheetnames = ["datatable_%02d" % i
+                      for i in range(1, len(datatables) + 1)]
     else:
         if len(sheetnames) != len(datatables):
             raise Exception("`sheetnames` is not the same "
                             "length as `datatables`: %s vs %s" %
                             (len(sheetnames), len(datatables)))
+    writer = UnicodeWriter(path)
     for datatable, sheetname in zip(datatables, sheetnames):
         writer.set_active_sheet(sheetname)
-        writer.writerow(datatable.fields)
-        writer.writerows(datatable)
+        chunks = [datatable] if isinstance(datatable, DataTable) else datatable
+        fields = None
+        for chunk in chunks:
+            if fields is None:
+                fields = chunk.fields
+                writer.writerow(fields)
+                formats = [(number_formats or {}).get(field)
+                           for field in fields]
+            elif set(chunk.fields) != set(fields):
+                raise Exception("Chunk fields do not match the first chunk "
+                                "of sheet `%s`:\nfirst: %s\nchunk: %s" %
+                                (sheetname, fields, chunk.fields))
+            writer.writerows(izip(*chunk[fields]), number_formats=formats)
     writer.save()
 
 
@@ -39,3 +68,27 @@ def unique_everseen(iterable, key=None):
             if k not in seen:
                 seen_add(k)
                 yield element
+
+
+def reservoir_sample(iterable, num, seed=None):
+    """
+    Draws `num` items uniformly at random from `iterable` in one pass,
+    holding only `num` items in memory at a time (Vitter's Algorithm R).
+
+    The sampled items are returned in the order they were seen.
+
+    reservoir_sample(xrange(1000000), 3, seed=1) --> [33770, 863068, 881733]
+    """
+    if num < 0:
+        raise IndexError("Cannot sample a negative number of items")
+    rng = Random(seed)
+    reservoir = []
+    for i, item in enumerate(iterable):
+        if i < num:
+            reservoir.append((i, item))
+        else:
+            j = rng.randint(0, i)
+            if j < num:
+                reservoir[j] = (i, item)
+    reservoir.sort(key=lambda pair: pair[0])
+    return [item for _, item in reservoir]
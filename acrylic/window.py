@@ -0,0 +1,262 @@
+# coding: utf-8
+
+from collections import OrderedDict
+
+from .profiling import traced
+from .shared import indexable
+
+import datatable
+
+
+class Window(object):
+    """
+    A Window is returned as a result of calling `.window` on a DataTable
+    object. It splits the rows into partitions (by `partition_by`) and
+    orders each partition (by `order_by`), once. Every window function
+    then walks the same partitions and returns a new column, aligned with
+    the rows of the original table, ready to be assigned:
+
+    by_customer = orders.window('customerid', order_by='date')
+    orders['order_number'] = by_customer.row_number()
+    orders['spent_so_far'] = by_customer.cumsum('price')
+    orders['previous_date'] = by_customer.lag('date')
+    orders['avg_last_3'] = by_customer.rolling_mean('price', 3)
+
+    Without `partition_by` the whole table is one partition, and without
+    `order_by` rows keep their order in the table.
+
+    Rows missing their `order_by` value sort last; with several `order_by`
+    fields, that applies to each field in turn. In the column being
+    aggregated they are skipped: cumulative and rolling functions carry on
+    past them and return None at their rows.
+    """
+
+    def __init__(self, datatable_instance, partition_by=None, order_by=None,
+                 desc=False):
+        if not isinstance(datatable_instance, datatable.DataTable):
+            raise Exception("Must window a DataTable instance.")
+        self.__table = datatable_instance
+        self.__order_keys = None
+
+        if partition_by is None:
+            partitions = [range(len(datatable_instance))]
+        else:
+            partitions = self.__partition(datatable_instance,
+                                          _as_fields(partition_by))
+        if order_by is not None:
+            order_fields = _as_fields(order_by)
+            self.__order_keys = _keys(datatable_instance, order_fields)
+            order = self.__order if len(order_fields) == 1 \
+                else self.__order_composite
+            partitions = [order(positions, desc) for positions in partitions]
+        self.__partitions = partitions
+
+    def __len__(self):
+        return len(self.__partitions)
+
+    @staticmethod
+    def __partition(table, fields):
+        partitions = OrderedDict()
+        for i, key in enumerate(_keys(table, fields)):
+            if key in partitions:
+                partitions[key].append(i)
+            else:
+                partitions[key] = [i]
+        return partitions.values()
+
+    def __order(self, positions, desc):
+        keys = self.__order_keys
+        present = [i for i in positions if keys[i] is not None]
+        missing = [i for i in positions if keys[i] is None]
+        present.sort(key=keys.__getitem__, reverse=desc)
+        return present + missing
+
+    def __order_composite(self, positions, desc):
+        """
+        Orders by a tuple of values, putting the rows missing a value
+        after the others with the same values in the fields before it,
+        whichever the direction.
+        """
+        keys = self.__order_keys
+        return sorted(positions, reverse=desc,
+                      key=lambda i: tuple([((value is None) != desc, value)
+                                           for value in keys[i]]))
+
+    def __column(self, field):
+        return indexable(self.__table[field])
+
+    def __empty(self):
+        return [None] * len(self.__table)
+
+    @traced
+    def row_number(self):
+        """
+        1, 2, 3, ... within each partition, in order.
+        """
+        result = self.__empty()
+        for positions in self.__partitions:
+            for number, i in enumerate(positions, 1):
+                result[i] = number
+        return result
+
+    def __ranks(self, dense):
+        if self.__order_keys is None:
+            raise Exception("Ranking needs a window with `order_by`.")
+        keys = self.__order_keys
+        result = self.__empty()
+        for positions in self.__partitions:
+            rank = 0
+            previous = object()
+            for number, i in enumerate(positions, 1):
+                if keys[i] != previous:
+                    rank = rank + 1 if dense else number
+                    previous = keys[i]
+                result[i] = rank
+        return result
+
+    @traced
+    def rank(self):
+        """
+        The rank of each row within its partition by `order_by`. Ties get
+        the same rank, and leave a gap after them: 1, 2, 2, 4.
+        """
+        return self.__ranks(dense=False)
+
+    @traced
+    def dense_rank(self):
+        """
+        Like `rank`, without gaps after ties: 1, 2, 2, 3.
+        """
+        return self.__ranks(dense=True)
+
+    def __shift(self, field, offset, default):
+        column = self.__column(field)
+        result = self.__empty()
+        for positions in self.__partitions:
+            size = len(positions)
+            for n, i in enumerate(positions):
+                source = n + offset
+                if 0 <= source < size:
+                    result[i] = column[positions[source]]
+                else:
+                    result[i] = default
+        return result
+
+    @traced
+    def lag(self, field, n=1, default=None):
+        """
+        The value at `field` from `n` rows earlier in the partition, or
+        `default` for the first `n` rows.
+        """
+        return self.__shift(field, -n, default)
+
+    @traced
+    def lead(self, field, n=1, default=None):
+        """
+        The value at `field` from `n` rows later in the partition, or
+        `default` for the last `n` rows.
+        """
+        return self.__shift(field, n, default)
+
+    def __cumulative(self, field, combine):
+        column = self.__column(field)
+        result = self.__empty()
+        for positions in self.__partitions:
+            running = None
+            for i in positions:
+                value = column[i]
+                if value is None:
+                    continue
+                running = value if running is None else combine(running,
+                                                                value)
+                result[i] = running
+        return result
+
+    @traced
+    def cumsum(self, field):
+        """
+        The running total of `field` within each partition.
+        """
+        return self.__cumulative(field, lambda total, value: total + value)
+
+    @traced
+    def cummin(self, field):
+        return self.__cumulative(field, min)
+
+    @traced
+    def cummax(self, field):
+        return self.__cumulative(field, max)
+
+    @traced
+    def cumcount(self, field=None):
+        """
+        The number of rows so far within each partition, counting the
+        current one. With a `field`, only rows where it isn't missing are
+        counted.
+        """
+        if field is None:
+            return self.row_number()
+        column = self.__column(field)
+        result = self.__empty()
+        for positions in self.__partitions:
+            count = 0
+            for i in positions:
+                if column[i] is not None:
+                    count += 1
+                result[i] = count
+        return result
+
+    def __rolling(self, field, n, min_rows, mean):
+        if n < 1:
+            raise ValueError("Rolling windows need at least one row.")
+        if min_rows is None:
+            min_rows = n
+        column = self.__column(field)
+        result = self.__empty()
+        for positions in self.__partitions:
+            # Slide the window along, adding the value that enters and
+            # subtracting the value that leaves.
+            total, count = 0, 0
+            for entering, i in enumerate(positions):
+                value = column[i]
+                if value is not None:
+                    total += value
+                    count += 1
+                if entering >= n:
+                    leaving = column[positions[entering - n]]
+                    if leaving is not None:
+                        total -= leaving
+                        count -= 1
+                if value is not None and count >= min_rows:
+                    result[i] = total / float(count) if mean else total
+        return result
+
+    @traced
+    def rolling_sum(self, field, n, min_rows=None):
+        """
+        The sum of `field` over each row and the `n - 1` rows before it in
+        its partition. Missing values are skipped; the result is None
+        until the window holds `min_rows` values (by default, `n`).
+        """
+        return self.__rolling(field, n, min_rows, mean=False)
+
+    @traced
+    def rolling_mean(self, field, n, min_rows=None):
+        """
+        Like `rolling_sum`, but the mean of the values in each window.
+        """
+        return self.__rolling(field, n, min_rows, mean=True)
+
+
+def _as_fields(fields):
+    return [fields] if isinstance(fields, basestring) else list(fields)
+
+
+def _keys(table, fields):
+    """
+    The value at a single field, or the tuple of values at several, for
+    every row of `table`.
+    """
+    if len(fields) == 1:
+        return indexable(table[fields[0]])
+    return zip(*table[fields])
@@ -0,0 +1,74 @@
+# coding: utf-8
+
+"""
+Synthetic, reproducible data for the benchmarks.
+
+Columns cycle through a fixed set of kinds, so a table of any width has a
+realistic mix of ids, integers, floats, low- and high-cardinality strings:
+
+    id, quantity, price, category, name, quantity_1, price_1, ...
+"""
+
+from collections import OrderedDict
+from random import Random
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from acrylic import DataTable  # noqa: E402
+
+CATEGORIES = [u'red', u'orange', u'yellow', u'green', u'blue', u'indigo',
+              u'violet', u'black', u'white', u'grey']
+
+
+def _quantity(rng, num_rows):
+    return [rng.randrange(1000) for _ in xrange(num_rows)]
+
+
+def _price(rng, num_rows):
+    return [round(rng.random() * 100, 2) for _ in xrange(num_rows)]
+
+
+def _category(rng, num_rows):
+    return [rng.choice(CATEGORIES) for _ in xrange(num_rows)]
+
+
+def _name(rng, num_rows):
+    return [u'customer %d' % rng.randrange(num_rows) for _ in xrange(num_rows)]
+
+
+KINDS = [('quantity', _quantity), ('price', _price),
+         ('category', _category), ('name', _name)]
+
+
+def make_columns(num_rows, width=4, seed=0):
+    """
+    Returns an OrderedDict of `width` columns with `num_rows` values each.
+    The first column is always a unique integer `id`.
+    """
+    rng = Random(seed)
+    columns = OrderedDict([('id', range(num_rows))])
+    for i in range(width - 1):
+        kind, make = KINDS[i % len(KINDS)]
+        name = kind if i < len(KINDS) else '%s_%d' % (kind, i // len(KINDS))
+        columns[name] = make(rng, num_rows)
+    return columns
+
+
+def make_table(num_rows, width=4, seed=0):
+    return DataTable.fromdict(make_columns(num_rows, width, seed))
+
+
+def make_dicts(num_rows, width=4, seed=0):
+    columns = make_columns(num_rows, width, seed)
+    fields = columns.keys()
+    return [dict(zip(fields, row)) for row in zip(*columns.values())]
+
+
+def make_lists(num_rows, width=4, seed=0):
+    columns = make_columns(num_rows, width, seed)
+    return [columns.keys()] + [list(row) for row in zip(*columns.values())]
@@ -0,0 +1,86 @@
+# coding: utf-8
+
+"""
+Measures Excel reading speed in rows per second.
+
+A synthetic workbook (500,000 rows by default) is generated once and
+cached in the system temp directory. It is then read three ways:
+
+    dictreader   DataTable(ExcelRW.UnicodeDictReader(path)), one dict per row
+    fromexcel    DataTable.fromexcel(path), tuples transposed into columns
+    subset       DataTable.fromexcel(path, headers=[two columns])
+
+    python benchmarks/excel_read.py --rows 500000
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from acrylic import DataTable, ExcelRW  # noqa: E402
+
+FIELDS = ['id', 'name', 'price', 'quantity', 'category', 'notes']
+
+
+def workbook_path(num_rows):
+    path = os.path.join(tempfile.gettempdir(),
+                        'acrylic_bench_%d.xlsx' % num_rows)
+    if not os.path.exists(path):
+        print("Generating %s ..." % path)
+        rng = random.Random(0)
+        writer = ExcelRW.UnicodeWriter(path)
+        writer.set_active_sheet('data')
+        writer.writerow(FIELDS)
+        writer.writerows([i,
+                          u'item %d' % rng.randrange(10000),
+                          round(rng.random() * 100, 2),
+                          rng.randrange(100),
+                          rng.choice([u'red', u'green', u'blue']),
+                          u'note' if i % 3 else None]
+                         for i in xrange(num_rows))
+        writer.save()
+    return path
+
+
+CASES = [
+    ('dictreader', lambda path: DataTable(ExcelRW.UnicodeDictReader(path))),
+    ('fromexcel', lambda path: DataTable.fromexcel(path)),
+    ('subset', lambda path: DataTable.fromexcel(path,
+                                                headers=['id', 'price'])),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    path = workbook_path(args.rows)
+    results = {}
+    for name, read in CASES:
+        start = time.time()
+        table = read(path)
+        elapsed = time.time() - start
+        assert len(table) == args.rows
+        results[name] = {'seconds': elapsed,
+                         'rows_per_sec': args.rows / elapsed}
+        print("%-11s %8.2f s %12.0f rows/sec" %
+              (name, elapsed, args.rows / elapsed))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
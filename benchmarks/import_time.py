@@ -0,0 +1,76 @@
+# coding: utf-8
+
+"""
+Measures how long a cold `import acrylic` takes.
+
+Every run starts a fresh interpreter, so nothing is cached in
+`sys.modules`. The benchmark fails (exit status 1) if the median import
+time is above `--max-ms`, or if importing acrylic pulls in openpyxl, which
+should only be imported once an Excel file is read or written.
+
+    python benchmarks/import_time.py --runs 30 --max-ms 100
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = ("import sys, time\n"
+         "start = time.time()\n"
+         "import acrylic\n"
+         "elapsed = time.time() - start\n"
+         "sys.stdout.write('%r %r' % (elapsed, 'openpyxl' in sys.modules))\n")
+
+
+def cold_import(python):
+    output = subprocess.check_output([python, '-c', PROBE], cwd=ROOT)
+    elapsed, openpyxl_loaded = output.split()
+    return float(elapsed), openpyxl_loaded == 'True'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help="fail if the median import takes longer")
+    parser.add_argument('--python', default=sys.executable)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    timings, openpyxl_loaded = [], False
+    for _ in range(args.runs):
+        elapsed, loaded = cold_import(args.python)
+        timings.append(elapsed * 1000)
+        openpyxl_loaded = openpyxl_loaded or loaded
+    timings.sort()
+    result = {'runs': args.runs,
+              'min_ms': timings[0],
+              'median_ms': timings[len(timings) // 2],
+              'max_ms': timings[-1],
+              'openpyxl_loaded': openpyxl_loaded}
+
+    print("import acrylic: median %(median_ms).1f ms, min %(min_ms).1f ms, "
+          "max %(max_ms).1f ms over %(runs)d runs" % result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+    failed = False
+    if openpyxl_loaded:
+        print("FAIL: `import acrylic` imported openpyxl")
+        failed = True
+    if args.max_ms is not None and result['median_ms'] > args.max_ms:
+        print("FAIL: median import time is above %.1f ms" % args.max_ms)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,311 @@
+# coding: utf-8
+
+"""
+Benchmarks every DataTable hot path on synthetic data.
+
+Each case runs once per (rows, width) combination in a fresh child
+process, so memory measurements aren't polluted by earlier cases. For each
+run we record the best wall time over `--repeat` runs and the peak resident
+memory (in MB) reached while the operation ran, above what the process
+was using just before it started. Every repeat sets its case up again, on
+fresh tables, so results a table memoizes (like its sort order) are never
+reused and each repeat times the full operation.
+
+Results are written to JSON. When a baseline file exists, every result is
+compared to it, and anything slower (or hungrier) than the baseline by
+more than `--tolerance` is flagged; the exit status is then 1.
+
+No baseline is checked in: timings are only comparable on the machine
+that recorded them, so record one yourself before comparing, usually on
+the commit you want to compare against:
+
+    # record a baseline on this machine, at the reference commit
+    git checkout master
+    python benchmarks/suite.py --sizes 10000,100000 --save-baseline
+
+    # then compare a change against it
+    git checkout my-branch
+    python benchmarks/suite.py --sizes 10000,100000
+"""
+
+from __future__ import division, print_function
+from random import Random
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import datagen
+
+from acrylic import DataTable
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+
+
+# Each case takes (num_rows, width, tmpdir), does any untimed setup, and
+# returns the zero-argument function that is timed. It is called again
+# before every repeat.
+
+def constructor_dict(num_rows, width, tmpdir):
+    rows = datagen.make_dicts(num_rows, width)
+    return lambda: DataTable(rows)
+
+
+def constructor_list(num_rows, width, tmpdir):
+    rows = datagen.make_lists(num_rows, width)
+    return lambda: DataTable(rows)
+
+
+def fromcsv(num_rows, width, tmpdir):
+    path = os.path.join(tmpdir, 'table.csv')
+    datagen.make_table(num_rows, width).writecsv(path)
+    return lambda: DataTable.fromcsv(path)
+
+
+def writecsv(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    path = os.path.join(tmpdir, 'out.csv')
+    return lambda: table.writecsv(path)
+
+
+def fromexcel(num_rows, width, tmpdir):
+    path = os.path.join(tmpdir, 'table.xlsx')
+    datagen.make_table(num_rows, width).writexlsx(path)
+    return lambda: DataTable.fromexcel(path)
+
+
+def where(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    return lambda: table.where('category', u'red')
+
+
+def wheregreater(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    return lambda: table.wheregreater('price', 50)
+
+
+def wherein(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    return lambda: table.wherein('category', set([u'red', u'blue']))
+
+
+def mask(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    rng = Random(0)
+    masklist = [rng.random() < .5 for _ in xrange(num_rows)]
+    return lambda: table.mask(masklist)
+
+
+def sort(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    return lambda: table.sort('price')
+
+
+def groupby_agg(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    return lambda: (table.groupby('category')
+                         .agg(sum, 'price')
+                         .agg(len)
+                         .collect())
+
+
+def join(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    labels = DataTable.fromcolumns(
+        ['category', 'label'],
+        [datagen.CATEGORIES, [c.upper() for c in datagen.CATEGORIES]])
+    return lambda: table.join(labels, 'category')
+
+
+def concat(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    other = datagen.make_table(num_rows, width, seed=1)
+    return lambda: table.concat(other)
+
+
+def sample(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+    return lambda: table.sample(num_rows // 10, seed=0)
+
+
+def iterate(num_rows, width, tmpdir):
+    table = datagen.make_table(num_rows, width)
+
+    def run():
+        for _ in table:
+            pass
+    return run
+
+
+CASES = [constructor_dict, constructor_list, fromcsv, writecsv, fromexcel,
+         where, wheregreater, wherein, mask, sort, groupby_agg, join,
+         concat, sample, iterate]
+
+# openpyxl is slow enough that big Excel files would dominate the run.
+MAX_ROWS = {'fromexcel': 100000}
+
+
+def _status_mb(key):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1]) / 1024
+    except IOError:
+        pass
+    return None
+
+
+def _reset_peak():
+    """
+    Resets the kernel's peak-RSS counter (VmHWM), on Linux 4.0+.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        pass
+
+
+def _peak_mb():
+    peak = _status_mb('VmHWM')
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+
+def _measure(case, num_rows, width, repeat, queue):
+    tmpdir = tempfile.mkdtemp(prefix='acrylic_bench_')
+    try:
+        timings = []
+        peak = 0.0
+        for _ in range(repeat):
+            run = case(num_rows, width, tmpdir)
+            before = _status_mb('VmRSS') or _peak_mb()
+            _reset_peak()
+            start = time.time()
+            run()
+            timings.append(time.time() - start)
+            peak = max(peak, _peak_mb() - before)
+            del run
+        queue.put({'seconds': min(timings), 'peak_mb': peak})
+    except Exception as e:
+        queue.put({'error': '%s: %s' % (type(e).__name__, e)})
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def run_case(case, num_rows, width, repeat):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure,
+                                      args=(case, num_rows, width, repeat,
+                                            queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of human-readable regressions against `baseline`.
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        old = baseline.get(key)
+        if old is None or 'error' in result or 'error' in old:
+            continue
+        if result['seconds'] > old['seconds'] * (1 + tolerance):
+            regressions.append("%s: %.3fs -> %.3fs" %
+                               (key, old['seconds'], result['seconds']))
+        # Allow a megabyte of noise for operations that barely allocate.
+        if result['peak_mb'] > old['peak_mb'] * (1 + tolerance) + 1:
+            regressions.append("%s: %.1f MB -> %.1f MB" %
+                               (key, old['peak_mb'], result['peak_mb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="comma-separated row counts")
+    parser.add_argument('--widths', default='4,16',
+                        help="comma-separated column counts")
+    parser.add_argument('--cases', default=None,
+                        help="comma-separated case names (default: all)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None,
+                        help="write the results to this JSON file")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown before flagging, as a "
+                             "fraction of the baseline")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    widths = [int(width) for width in args.widths.split(',')]
+    cases = CASES
+    if args.cases:
+        names = args.cases.split(',')
+        unknown = set(names) - set(case.__name__ for case in CASES)
+        if unknown:
+            parser.error("unknown cases: %s" % ', '.join(sorted(unknown)))
+        cases = [case for case in CASES if case.__name__ in names]
+
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        print("No baseline at %s, so these results won't be compared to "
+              "anything. Baselines are machine-specific and aren't checked "
+              "in: record one first by running the suite with "
+              "--save-baseline (at the commit to compare against).\n" %
+              args.baseline)
+        sys.stdout.flush()
+
+    results = {}
+    for case in cases:
+        for num_rows in sizes:
+            if num_rows > MAX_ROWS.get(case.__name__, num_rows):
+                continue
+            for width in widths:
+                key = '%s/%d/%d' % (case.__name__, num_rows, width)
+                result = run_case(case, num_rows, width, args.repeat)
+                results[key] = result
+                if 'error' in result:
+                    print("%-32s ERROR %s" % (key, result['error']))
+                else:
+                    print("%-32s %9.4f s %9.1f MB" %
+                          (key, result['seconds'], result['peak_mb']))
+                sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Saved baseline to %s" % args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Not compared: no baseline at %s. Run with --save-baseline "
+              "to record one." % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
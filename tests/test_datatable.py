@@ -1,5 +1,15 @@
 # coding: utf-8
+from array import array
+from itertools import chain
 from collections import OrderedDict
+import cStringIO
+import io
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
 from nose.tools import (assert_equal,
                         assert_not_equal,
                         assert_raises,
@@ -7,9 +17,25 @@ from nose.tools import (assert_equal,
 
 from acrylic import DataTable
 from acrylic import ExcelRW
+from acrylic import LazyTable
+from acrylic import ParseCache
+from acrylic import col
+from acrylic import describe
+from acrylic import datarow
+from acrylic import excel
+from acrylic import keysets
+from acrylic.columnar import decode_column, encode_column
+from acrylic.datarow import CONSTRUCTOR_CACHE_SIZE, datarow_constructor
+from acrylic.datatable import MEMO_MAX_ENTRIES
+from acrylic.keysets import BloomFilter
+from acrylic.parallel import ParallelApplyError, pool_map
+from acrylic.profiling import add_callback, profile, remove_callback
+from acrylic.shared import SharedColumn
 
 TEST_DATA_LOCATION = './rename/testdata.xlsx'
+TEST_CSV_LOCATION = './rename/testdata.csv'
 TEST_OUT_LOCATION = './rename/testout.xlsx'
+TEST_OUT_CSV_LOCATION = './rename/testout.csv'
 
 excel_reader = ExcelRW.UnicodeDictReader(TEST_DATA_LOCATION)
 data = DataTable(excel_reader)
@@ -408,3 +434,1004 @@ def test_35wherenot():
     green = data.wherenot('colors', {'red', 'yellow', 'black'})
     assert_equal(green['apostle'], ['simon the less'])
     assert_raises(Exception, data.wherenot, 'colors', {'a': 5})
+
+
+def test_36lazymatcheseager():
+    global data
+
+    bigfunc = lambda x: x['randnum2'] > .5
+    eager = (data.wherein('colors', {'red', 'black'})
+                 .wheregreater('regular numbers', 2)
+                 .wherefunc(bigfunc)
+                 .sort('apostle'))
+    lazy = (data.lazy()
+                .wherein('colors', {'red', 'black'})
+                .sort('apostle')
+                .wheregreater('regular numbers', 2)
+                .wherefunc(bigfunc)
+                .collect())
+    assert_equal(eager, lazy)
+    assert_equal(lazy.fields, data.fields)
+
+
+def test_37lazypushdown():
+    plan = (LazyTable.fromcsv(TEST_CSV_LOCATION)
+                     .where('colors', 'red')
+                     .select('apostle', 'randnum')
+                     .sort('randnum', desc=True))
+    assert_equal(plan.explain().splitlines()[1],
+                 u"  read columns: apostle, randnum, colors")
+
+    result = plan.collect()
+    eager = (DataTable.fromcsv(TEST_CSV_LOCATION)
+                      .where('colors', 'red')
+                      .sort('randnum', desc=True))
+    assert_equal(result.fields, ['apostle', 'randnum'])
+    assert_equal(result['apostle'], eager['apostle'])
+    assert_raises(KeyError, LazyTable.fromcsv(TEST_CSV_LOCATION)
+                                     .select('apostle')
+                                     .where('colors', 'red').collect)
+
+
+def test_38exprwherefunc():
+    global data
+
+    bigredfunc = lambda x: (x['colors'] == 'red') and x['randnum2'] > .5
+    bigredexpr = (col('colors') == 'red') & (col('randnum2') > .5)
+    assert_equal(data.wherefunc(bigredexpr), data.wherefunc(bigredfunc))
+    assert_equal(data.wherenotfunc(bigredexpr),
+                 data.wherenotfunc(bigredfunc))
+
+    notyellow = ~col('colors').isin(['yellow', 'green'])
+    assert_equal(data.wherefunc(notyellow)['apostle'],
+                 data.wherenotin('colors', ('yellow', 'green'))['apostle'])
+    assert_equal(data.lazy().wherefunc(bigredexpr).collect(),
+                 data.wherefunc(bigredfunc))
+
+
+def test_39exprapply():
+    global data
+
+    assert_equal(data.apply(col('regular numbers') * 2 + 1),
+                 data.apply(lambda x: x * 2 + 1, 'regular numbers'))
+    assert_equal(data.apply(col('randnum') / col('regular numbers')),
+                 data.apply(lambda a, b: a / b, 'randnum', 'regular numbers'))
+    assert_raises(KeyError, data.apply, col('notacolumn') + 1)
+    assert_raises(TypeError, bool, col('randnum') > 1)
+
+
+def _square(value):
+    return value ** 2
+
+
+def _fail_on_12345(value):
+    if value == 12345:
+        raise ValueError("bad value")
+    return value
+
+
+def _row_total(row):
+    return row['a'] + row['b']
+
+
+def test_40parallelapply():
+    table = DataTable.fromdict(OrderedDict([('a', range(30000)),
+                                            ('b', range(30000, 0, -1))]))
+    serial = table.apply(_square, 'b')
+    assert_equal(table.apply(_square, 'b', workers=2, chunksize=4000),
+                 serial)
+    assert_equal(table.apply(_row_total, workers=3),
+                 table.apply(_row_total))
+    assert_raises(TypeError, table.apply, _row_total, worker=2)
+
+    table.mutapply(_square, 'b', workers=2)
+    assert_equal(table['b'], serial)
+
+    try:
+        table.apply(_fail_on_12345, 'a', workers=2)
+    except ParallelApplyError as e:
+        assert_equal(e.row, 12345)
+    else:
+        raise AssertionError("ParallelApplyError was not raised")
+
+    small = DataTable.fromdict({'a': [1, 12345, 3]})
+    assert_raises(ValueError, small.apply, _fail_on_12345, 'a', workers=2)
+    assert_raises(ValueError, small.mutapply, _fail_on_12345, 'a',
+                  workers=2)
+
+
+def test_41sample():
+    global data
+
+    sampled = data.sample(5, seed=3)
+    assert_equal(len(sampled), 5)
+    assert_equal(sampled, data.sample(5, seed=3))
+    assert_equal(len(set(sampled['apostle'])), 5)
+    assert_equal(len(data.sample(50)), len(data))
+    everything = data.sample(50, seed=3)
+    assert_equal(sorted(everything['randnum']), sorted(data['randnum']))
+    assert everything['randnum'] != data['randnum']
+
+    by_color = data.sample(2, seed=1, by='colors')
+    counts = {}
+    for color in by_color['colors']:
+        counts[color] = counts.get(color, 0) + 1
+    assert_equal(counts, {'red': 2, 'black': 2, 'yellow': 2, 'green': 1})
+
+
+def test_42reservoirsample():
+    sampled = DataTable.samplecsv(TEST_CSV_LOCATION, 4, seed=7,
+                                  headers=['randnum', 'colors'])
+    assert_equal(sampled.fields, ['randnum', 'colors'])
+    assert_equal(len(sampled), 4)
+    full = DataTable.fromcsv(TEST_CSV_LOCATION)
+    positions = [full['randnum'].index(randnum)
+                 for randnum in sampled['randnum']]
+    assert_equal(positions, sorted(positions))
+
+    assert_equal(len(DataTable.sampleexcel(TEST_DATA_LOCATION, 0)), 0)
+    assert_equal(DataTable.sampleexcel(TEST_DATA_LOCATION, 100),
+                 DataTable.fromexcel(TEST_DATA_LOCATION))
+
+
+def test_43noopenpyxlonimport():
+    probe = ("import sys, acrylic\n"
+             "sys.stdout.write(str('openpyxl' in sys.modules))")
+    output = subprocess.check_output([sys.executable, '-c', probe])
+    assert_equal(output, 'False')
+
+    import openpyxl
+    major = int(openpyxl.__version__.split(".")[0])
+    assert_equal(ExcelRW.openpyxl_version, major)
+    assert ExcelRW.openpyxl_version >= 2
+    assert_equal(int(ExcelRW.openpyxl_version), major)
+    assert_equal(str(ExcelRW.openpyxl_version), str(major))
+
+
+def test_44excelrangeandsubset():
+    full = DataTable.fromexcel(TEST_DATA_LOCATION)
+    assert_equal(full, DataTable(ExcelRW.UnicodeDictReader(TEST_DATA_LOCATION)))
+    assert_equal(len(full), 12)
+
+    part = DataTable.fromexcel(TEST_DATA_LOCATION,
+                               headers=['colors', 'apostle'],
+                               start=2, stop=5)
+    assert_equal(part.fields, ['colors', 'apostle'])
+    assert_equal(part['apostle'], full['apostle'][2:5])
+    assert_equal(part['colors'], full['colors'][2:5])
+    assert_equal(len(DataTable.fromexcel(TEST_DATA_LOCATION, stop=0)), 0)
+    assert_raises(KeyError, DataTable.fromexcel, TEST_DATA_LOCATION,
+                  headers=['notacolumn'])
+
+
+def test_45excelduplicateheaders():
+    writer = ExcelRW.UnicodeWriter(TEST_OUT_LOCATION)
+    writer.writerows([['a', 'b', 'a'], [1, 2, 3]])
+    writer.save()
+    assert_raises(Exception, ExcelRW.UnicodeDictReader, TEST_OUT_LOCATION)
+    assert_raises(Exception, DataTable.fromexcel, TEST_OUT_LOCATION)
+    assert_equal(DataTable.fromexcel(TEST_OUT_LOCATION, headers=['b'])['b'],
+                 [2])
+
+
+def test_46excelallsheets():
+    writer = ExcelRW.UnicodeWriter(TEST_OUT_LOCATION)
+    for sheetname, rows in [('zeta', [['a', 'b'], [1, 2], [3, 4]]),
+                            ('broken', [['a', 'a'], [1, 2]]),
+                            ('alpha', [['c'], [5], [6], [7]])]:
+        writer.set_active_sheet(sheetname)
+        writer.writerows(rows)
+    writer.save()
+
+    for workers in (1, 2):
+        errors = {}
+        tables = DataTable.fromexcel_all(TEST_OUT_LOCATION, workers=workers,
+                                         errors=errors)
+        assert_equal(tables.keys(), ['zeta', 'alpha'])
+        assert_equal(tables['zeta']['b'], [2, 4])
+        assert_equal(tables['alpha']['c'], [5, 6, 7])
+        assert_equal(errors.keys(), ['broken'])
+        assert 'Duplicate headers' in errors['broken']
+
+    errors = {}
+    missing = './rename/notafile.xlsx'
+    tables = DataTable.fromexcel_many([TEST_DATA_LOCATION, missing,
+                                       TEST_OUT_LOCATION],
+                                      workers=2, errors=errors)
+    assert_equal(tables.keys(), [TEST_DATA_LOCATION, TEST_OUT_LOCATION])
+    assert_equal(tables[TEST_DATA_LOCATION],
+                 DataTable.fromexcel(TEST_DATA_LOCATION))
+    assert_equal(errors.keys(), [missing])
+
+
+def test_47excelchunks():
+    def chunks():
+        for start in range(0, 2500, 1000):
+            stop = min(start + 1000, 2500)
+            yield DataTable.fromdict(OrderedDict([
+                ('price', [i / 4.0 for i in range(start, stop)]),
+                ('id', range(start, stop))]))
+
+    expected = DataTable()
+    for chunk in chunks():
+        expected = expected.concat(chunk)
+    excel(TEST_OUT_LOCATION, [chunks(), data], ['prices', 'apostles'],
+          number_formats={'price': '0.00'})
+
+    assert_equal(DataTable.fromexcel(TEST_OUT_LOCATION, 'prices'), expected)
+    assert_equal(DataTable.fromexcel(TEST_OUT_LOCATION, 'apostles'), data)
+
+    from openpyxl import load_workbook
+    sheet = load_workbook(TEST_OUT_LOCATION)['prices']
+    assert_equal(sheet['A2'].number_format, '0.00')
+    assert_equal(sheet['B2'].number_format, 'General')
+
+
+def test_48groupbyagg():
+    global data
+
+    by_color = (data.groupby('colors')
+                    .agg(sum, 'regular numbers')
+                    .agg(len, name='count')
+                    .collect())
+    assert_equal(by_color.fields, ['colors', 'sum(regular numbers)',
+                                   'count()'])
+    reds = by_color.where('colors', 'red')
+    assert_equal(reds['sum(regular numbers)'], [29])
+    assert_equal(reds['count()'], [5])
+
+
+def test_49profiling():
+    global data
+
+    with profile() as prof:
+        reds = data.where('colors', 'red').sort('apostle')
+        data.groupby('colors').agg(len).collect()
+
+    names = [operation.name for operation in prof.operations]
+    assert_equal(names[:4], ['mask', 'where', 'take', 'sort'])
+    where = prof.operations[1]
+    assert_equal((where.rows_in, where.rows_out, where.depth),
+                 (len(data), len(reds), 0))
+    assert_equal(where.columns, len(data.fields))
+    assert_equal(prof.operations[0].depth, 1)
+
+    summary = prof.summary(toplevel=True)
+    assert 'mask' not in summary['operation']
+    assert_equal(sorted(summary['operation']),
+                 ['agg', 'collect', 'groupby', 'sort', 'where'])
+    assert_equal(summary['cumulative_s'],
+                 sorted(summary['cumulative_s'], reverse=True))
+
+    seen = []
+    add_callback(seen.append)
+    data.wherenot('colors', 'red')
+    remove_callback(seen.append)
+    data.wherenot('colors', 'red')
+    assert_equal([operation.name for operation in seen],
+                 ['mask', 'where', 'wherenot'])
+
+    with profile() as prof:
+        data.partition('colors', 2)
+        data.pivot('colors', 'apostle', 'randnum')
+    toplevel = [operation.name for operation in prof.operations
+                if operation.depth == 0]
+    assert_equal(toplevel, ['partition', 'pivot'])
+
+    # A failing callback doesn't hide the operation's own error.
+    def broken(operation):
+        raise RuntimeError("callback failed")
+    add_callback(broken)
+    try:
+        assert_raises(ValueError, data.sort, 'no such field')
+        assert_raises(RuntimeError, data.wherenot, 'colors', 'red')
+    finally:
+        remove_callback(broken)
+    with profile() as prof:
+        data.wherenot('colors', 'red')
+    assert_equal(prof.operations[-1].depth, 0)
+
+
+def test_50memoryusage():
+    shared = u'a fairly long string value' * 10
+    table = DataTable.fromdict(OrderedDict([
+        ('ints', range(1000, 2000)),
+        ('shared', [shared] * 1000),
+        ('again', [shared] * 1000)]))
+
+    shallow = table.memory_usage(deep=False)
+    deep = table.memory_usage()
+    assert_equal(shallow.keys(), ['ints', 'shared', 'again'])
+    assert deep['ints'] > shallow['ints'] + 1000 * sys.getsizeof(1000) - 1
+    assert_equal(deep['shared'], shallow['shared'] + sys.getsizeof(shared))
+    assert_equal(deep['again'], shallow['again'])
+
+    estimate = table.memory_usage(sample=100)
+    assert 0.8 < estimate['ints'] / float(deep['ints']) < 1.2
+    assert_equal(estimate['shared'], deep['shared'])
+
+    report = table.memory_report()
+    assert_equal(report['field'], ['ints', 'shared', 'again', u'(total)'])
+    assert_equal(report['total_bytes'][:3], deep.values())
+    assert_equal(report['distinct_objects'][:3], [1000, 1, 1])
+    assert report['typed_bytes'][0] < report['total_bytes'][0]
+    assert_equal(report['typed_bytes'][1], None)
+    assert report['dictionary_bytes'][1] < report['container_bytes'][1]
+
+
+def test_51nulls():
+    table = DataTable.fromcsvstring(u"name,score,team\n"
+                                    u"ann,3,red\n"
+                                    u"bob,,blue\n"
+                                    u"cat,1,\n"
+                                    u"dan,,red\n"
+                                    u"eve,2,blue")
+    assert_equal(table['score'], [3, None, 1, None, 2])
+    assert_equal(table.nullcounts().values(), [0, 2, 1])
+    assert_equal(table.isnull('score'), [False, True, False, True, False])
+
+    assert_equal(table.wherenull('score')['name'], [u'bob', u'dan'])
+    assert_equal(table.where('score', None)['name'], [u'bob', u'dan'])
+    assert_equal(table.wherenotnull('score')['name'], [u'ann', u'cat', u'eve'])
+    assert_equal(table.whereless('score', 3)['name'], [u'cat', u'eve'])
+    assert_equal(table.wherenot('team', u'red')['name'], [u'bob', u'eve'])
+    assert_equal(table.lazy().whereless('score', 3).collect()['name'],
+                 [u'cat', u'eve'])
+
+    assert_equal(table.sort('score')['name'],
+                 [u'cat', u'eve', u'ann', u'bob', u'dan'])
+    assert_equal(table.sort('score', desc=True, nulls='first')['name'],
+                 [u'bob', u'dan', u'ann', u'eve', u'cat'])
+    assert_equal(table.sort('score', key=lambda score: -score)['score'],
+                 [3, 2, 1, None, None])
+    assert_equal(table.lazy().sort('score').collect()['name'],
+                 [u'cat', u'eve', u'ann', u'bob', u'dan'])
+
+    # bitmaps follow the rows through gathers, appends and renames
+    sliced = table[1:4]
+    assert_equal(sliced.nullcounts().values(), [0, 2, 1])
+    sliced.append([u'fay', None, u'red'])
+    sliced.rename('score', 'points')
+    assert_equal(sliced.isnull('points'), [True, False, True, True])
+    sliced.rename('points', 'score')
+    assert_equal(table.concat(sliced).nullcounts()['score'], 5)
+
+    grouped = (table.groupby('team')
+                    .agg(len, 'score', name='scores')
+                    .agg(sum, 'score', name='total')
+                    .agg(len, name='rows')
+                    .collect())
+    assert_equal(grouped['team'], [u'red', u'blue', None])
+    assert_equal(grouped['scores(score)'], [1, 1, 1])
+    assert_equal(grouped['total(score)'], [3, 2, 1])
+    assert_equal(grouped['rows()'], [2, 2, 1])
+
+    labels = DataTable.fromcolumns(['team', 'label'],
+                                   [[u'red', None], [u'Red', u'None']])
+    assert_equal(table.join(labels, 'team')['name'], [u'ann', u'dan'])
+
+    table.writecsv(TEST_OUT_CSV_LOCATION)
+    reread = DataTable.fromcsv(TEST_OUT_CSV_LOCATION)
+    assert_equal(reread['score'], [u'3', None, u'1', None, u'2'])
+    assert_equal(reread['team'], table['team'])
+    assert_equal(DataTable.fromcsv(TEST_OUT_CSV_LOCATION,
+                                   null_values=())['team'][2], u'')
+
+
+def test_52describe():
+    from acrylic.stats import EXACT_DISTINCT_LIMIT
+    table = DataTable.fromdict(OrderedDict([
+        ('n', range(20000) + [None] * 5),
+        ('word', [u'ab', u'cd'] * 10000 + [u'ef'] * 5)]))
+    summary = table.describe()
+    assert_equal(summary.fields, ['field', 'count', 'nulls', 'distinct', 'min',
+                                  'max', 'mean', 'std', 'q25', 'q50', 'q75'])
+    n, word = list(summary)
+    assert_equal(n[['count', 'nulls', 'distinct', 'min', 'max', 'mean']],
+                 [20000, 5, 20000, 0, 19999, 9999.5])
+    assert abs(n['std'] - 5773.647) < .001
+    for fraction, value in [(.25, n['q25']), (.5, n['q50']), (.75, n['q75'])]:
+        assert abs(value - fraction * 20000) < 20000 * .02
+    assert_equal(word[['count', 'distinct', 'min', 'max', 'mean', 'q50']],
+                 [20005, 3, u'ab', u'ef', None, None])
+
+    # streamed chunks give the same answers, estimating big distinct counts
+    chunks = (table[i:i + 1000] for i in range(0, len(table), 1000))
+    streamed = describe(chunks, ['n'], quantiles=[.5])
+    assert_equal(streamed.fields[-1], 'q50')
+    assert_equal(streamed['mean'], [9999.5])
+    assert abs(streamed['std'][0] - n['std']) < 1e-6
+    assert EXACT_DISTINCT_LIMIT < 20000
+    assert abs(streamed['distinct'][0] - 20000) < 20000 * .05
+
+
+def test_53dropduplicates():
+    table = DataTable.fromcolumns(['color', 'size', 'n'],
+                                  [[u'red', u'blue', u'red', u'red', u'blue'],
+                                   [u'S', u'M', u'S', u'L', u'M'],
+                                   [1, 2, 3, 4, 5]])
+    assert_equal(table.distinct('color'), (u'red', u'blue'))
+    assert_equal(table.distinct('color', count='rows')['rows'], [3, 2])
+
+    pairs = table.distinct('color', 'size', count='rows')
+    assert_equal(pairs.fields, ['color', 'size', 'rows'])
+    assert_equal(list(pairs), [(u'red', u'S', 2), (u'blue', u'M', 2),
+                               (u'red', u'L', 1)])
+    assert_raises(Exception, table.distinct, 'color', 'size', key=len)
+
+    assert_equal(table.drop_duplicates(['color', 'size'])['n'], [1, 2, 4])
+    assert_equal(table.drop_duplicates(['color', 'size'], keep='last')['n'],
+                 [3, 4, 5])
+    assert_equal(table.drop_duplicates('color', count='rows')['rows'], [3, 2])
+    assert_equal(len(table.drop_duplicates()), 5)
+    assert_equal(len(table.concat(table).drop_duplicates()), 5)
+    assert_raises(ValueError, table.drop_duplicates, keep='middle')
+
+
+def test_54pivot():
+    sales = DataTable.fromcolumns(
+        ['region', 'year', 'rep', 'revenue'],
+        [[u'west', u'east', u'west', u'east', u'west', None],
+         [2016, 2015, 2015, 2015, 2016, 2016],
+         [u'al', u'bo', u'al', u'cy', u'di', u'al'],
+         [10, 5, 7, 1, None, 100]])
+
+    pivoted = sales.pivot('region', 'year', 'revenue', 'sum', fill=0)
+    assert_equal(pivoted.fields, ['region', '2015', '2016'])
+    assert_equal(list(pivoted), [(u'west', 7, 10), (u'east', 6, 0)])
+    assert_equal(sales.pivot('region', 'year', 'revenue', 'mean')['2015'],
+                 [7.0, 3.0])
+    assert_equal(sales.pivot('region', 'year', 'revenue', max)['2015'],
+                 [7, 5])
+    assert_equal(sales.pivot(['region', 'rep'], 'year', 'revenue',
+                             'first').fields,
+                 ['region', 'rep', '2015', '2016'])
+    assert_equal(list(sales.pivot(['region', 'rep'], 'year', 'revenue',
+                                  'last')),
+                 [(u'west', u'al', 7, 10), (u'east', u'bo', 5, None),
+                  (u'east', u'cy', 1, None)])
+
+    counts = sales.crosstab('region', 'year')
+    assert_equal(list(counts), [(u'west', 1, 2), (u'east', 2, 0)])
+    assert_raises(ValueError, sales.pivot, 'region', 'year', 'revenue',
+                  'median')
+    assert_raises(Exception, sales.pivot, 'region', 'year')
+
+
+def test_55window():
+    table = DataTable.fromcolumns(
+        ['team', 'day', 'points'],
+        [[u'a', u'b', u'a', u'a', u'b', u'a'],
+         [3, 1, 1, 2, 2, 4],
+         [10, 5, 30, None, 5, 20]])
+    by_team = table.window('team', order_by='day')
+    assert_equal(len(by_team), 2)
+    assert_equal(by_team.row_number(), [3, 1, 1, 2, 2, 4])
+    assert_equal(by_team.cumsum('points'), [40, 5, 30, None, 10, 60])
+    assert_equal(by_team.cumcount('points'), [2, 1, 1, 1, 2, 3])
+    assert_equal(by_team.cummax('points'), [30, 5, 30, None, 5, 30])
+    assert_equal(by_team.lag('points'), [None, None, None, 30, 5, 10])
+    assert_equal(by_team.lead('day', default=0), [4, 2, 2, 3, 0, 0])
+    assert_equal(by_team.rolling_sum('points', 2, min_rows=1),
+                 [10, 5, 30, None, 10, 30])
+    assert_equal(by_team.rolling_mean('points', 2), [None, None, None, None,
+                                                     5.0, 15.0])
+
+    by_points = table.window(order_by='points', desc=True)
+    assert_equal(by_points.rank(), [3, 4, 1, 6, 4, 2])
+    assert_equal(by_points.dense_rank(), [3, 4, 1, 5, 4, 2])
+    assert_raises(Exception, table.window('team').rank)
+
+    by_team_points = table.window(order_by=['team', 'points'])
+    assert_equal(by_team_points.row_number(), [1, 5, 3, 4, 6, 2])
+    assert_equal(by_team_points.rank(), [1, 5, 3, 4, 5, 2])
+    by_team_points = table.window(order_by=['team', 'points'], desc=True)
+    assert_equal(by_team_points.row_number(), [5, 1, 3, 6, 2, 4])
+
+
+def _shared_total(job):
+    handle, color = job
+    table = handle.attach()
+    return sum(table.where('colors', color)['regular numbers'])
+
+
+def test_56share():
+    global data
+    table = data.copy()
+    table['gaps'] = [None if i % 3 else u'caf\xe9 %d' % i
+                     for i in range(len(table))]
+    table['mixed'] = [1, u'a'] * (len(table) // 2) + [None] * (len(table) % 2)
+
+    with table.share() as handle:
+        assert os.path.exists(handle.path)
+        copied = pickle.loads(pickle.dumps(handle, pickle.HIGHEST_PROTOCOL))
+        attached = copied.attach()
+        assert_equal(attached, table)
+        assert_equal(attached.fields, table.fields)
+        assert_equal(attached['gaps'][:4], table['gaps'][:4])
+        assert_equal(attached['randnum'][-1], table['randnum'][-1])
+        assert_equal(attached.nullcounts(), table.nullcounts())
+        column = attached['randnum']
+
+        def write():
+            column[0] = 1
+        assert_raises(TypeError, write)
+        changed = handle.attach()
+        changed.sort('randnum', inplace=True)
+        changed['randnum'] = range(len(table))
+        assert_equal(changed['randnum'], range(len(table)))
+        assert_equal(changed['gaps'], table.sort('randnum')['gaps'])
+
+        colors = list(table.distinct('colors'))
+        totals = pool_map(_shared_total, [(handle, color) for color in colors],
+                          workers=2)
+        assert_equal(totals, [sum(table.where('colors', color)
+                                  ['regular numbers']) for color in colors])
+        copied.close()
+        assert os.path.exists(handle.path)
+    assert not os.path.exists(handle.path)
+    assert_equal(attached.sort('randnum'), table.sort('randnum'))
+    assert_equal(attached.sort('gaps'), table.sort('gaps'))
+    positions = [3, 0, 3, len(table) - 1]
+    assert_equal(attached.take(positions), table.take(positions))
+    assert_equal(attached.take(positions * 10), table.take(positions * 10))
+    assert_equal(attached['gaps'][::-2], table['gaps'][::-2])
+    assert_equal(attached.groupby('colors').agg(len, 'gaps').collect(),
+                 table.groupby('colors').agg(len, 'gaps').collect())
+    assert_equal(attached.window('colors', order_by='randnum').lag('gaps'),
+                 table.window('colors', order_by='randnum').lag('gaps'))
+    assert_raises(TypeError, SharedColumn, None, 0, None)
+
+    # Attached tables copy their shared columns before changing them.
+    last = table.row(len(table) - 1)
+    attached.append(last)
+    table.append(last)
+    assert_equal(attached, table)
+    assert not any(isinstance(attached[field], SharedColumn)
+                   for field in attached.fields)
+    assert_equal(attached.nullcounts(), table.nullcounts())
+
+
+def test_57pickle():
+    global data
+    table = data.copy()
+    table['gaps'] = [None if i % 3 else u'caf\xe9 %d' % i
+                     for i in range(len(table))]
+    table['repeats'] = [None if i % 5 == 0 else ['x', 'y'][i % 2]
+                        for i in range(len(table))]
+    table['mixed'] = [1, u'a'] * (len(table) // 2) + [None] * (len(table) % 2)
+    table['big'] = [i * 10 ** 12 for i in range(len(table))]
+    table['typed'] = array('d', range(len(table)))
+
+    pickled = pickle.dumps(table, pickle.HIGHEST_PROTOCOL)
+    restored = pickle.loads(pickled)
+    assert_equal(restored, table)
+    assert_equal(restored.fields, table.fields)
+    assert_equal(restored.nullcounts(), table.nullcounts())
+    assert isinstance(restored['typed'], array)
+    assert_equal(pickle.loads(pickle.dumps(DataTable())), DataTable())
+
+    rows = [dict(zip(table.fields, row)) for row in table]
+    assert len(pickled) < len(pickle.dumps(rows, pickle.HIGHEST_PROTOCOL))
+
+    row = table.row(3)
+    restored_row = pickle.loads(pickle.dumps(row, pickle.HIGHEST_PROTOCOL))
+    assert_equal(restored_row, row)
+    assert_equal(restored_row['gaps'], row['gaps'])
+    assert type(restored_row) is type(table.row(4))
+
+
+def _color_totals(table):
+    return (table.groupby('colors')
+                 .agg(sum, 'regular numbers', name='total')
+                 .collect())
+
+
+def test_58partition():
+    global data
+    partitions = data.partition('colors', 3)
+    assert_equal(len(partitions), 3)
+    assert_equal(sum(len(partition) for partition in partitions), len(data))
+    for partition in partitions:
+        assert_equal(partition.fields, data.fields)
+    for color in data.distinct('colors'):
+        assert_equal(len([partition for partition in partitions
+                          if color in partition['colors']]), 1)
+    assert_equal(sorted(chain.from_iterable(
+                     partition['randnum'] for partition in
+                     data.partition(['colors', 'apostle'], 4))),
+                 sorted(data['randnum']))
+    assert_raises(ValueError, data.partition, 'colors', 0)
+
+    totals = data.map_partitions(_color_totals, 'colors', n=3, workers=2)
+    assert_equal(totals.sort('colors'), _color_totals(data).sort('colors'))
+    assert_raises(TypeError, data.map_partitions, len, 'colors', workers=1)
+
+
+def test_59groupbyspill():
+    global data
+    table = DataTable.fromcolumns(
+        ['key', 'other', 'value'],
+        [[None if i % 11 == 0 else (i * 7) % 23 for i in range(3000)],
+         [u'k%d' % (i % 3) for i in range(3000)],
+         [None if i % 13 == 0 else i for i in range(3000)]])
+
+    def grouped(memory_budget=None):
+        return (table.groupby('key', 'other', memory_budget=memory_budget)
+                     .agg(sum, 'value')
+                     .agg(len, name='rows')
+                     .agg(lambda rows: rows[0]['value']))
+
+    in_memory = grouped()
+    spilled = grouped(memory_budget=1000)
+    assert_equal(len(spilled), len(in_memory))
+    assert_equal(spilled.collect(), in_memory.collect())
+    collected = grouped(memory_budget=1000)
+    assert_equal(len(collected.collect()), len(in_memory))
+    assert_equal(len(collected), len(in_memory))
+    assert_equal(table.groupby('key', memory_budget=1000).collect(),
+                 table.groupby('key').collect())
+    assert_equal(grouped(memory_budget=10 ** 9).collect().fields,
+                 ['key', 'other', 'sum(value)', 'rows()', 'lambda0000()'])
+    assert_raises(KeyError, grouped(memory_budget=1000).agg, sum, 'missing')
+    assert_raises(TypeError, table.groupby, 'key', budget=1000)
+
+
+def test_60parsecache():
+    directory = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(directory, 'data.csv')
+        shutil.copy(TEST_CSV_LOCATION, csv_path)
+        cache = ParseCache(os.path.join(directory, 'cache'))
+
+        parsed = DataTable.fromcsv(csv_path)
+        assert_equal(DataTable.fromcsv(csv_path, cache=cache), parsed)
+        cached = DataTable.fromcsv(csv_path, cache=cache)
+        assert_equal(cached, parsed)
+        assert_equal(cached.fields, parsed.fields)
+        assert_equal((cache.hits, cache.misses), (1, 1))
+
+        DataTable.fromcsv(csv_path, headers=['apostle'], cache=cache)
+        assert_equal((cache.hits, cache.misses), (1, 2))
+        modified = os.stat(csv_path).st_mtime + 10
+        os.utime(csv_path, (modified, modified))
+        DataTable.fromcsv(csv_path, cache=cache)
+        assert_equal((cache.hits, cache.misses), (1, 3))
+
+        assert_equal(DataTable.fromexcel(TEST_DATA_LOCATION, cache=cache),
+                     DataTable.fromexcel(TEST_DATA_LOCATION, cache=cache))
+        assert_equal((cache.hits, cache.misses), (2, 4))
+
+        entry_size = cache.size() // 4
+        small = ParseCache(cache.directory, max_bytes=entry_size * 2)
+        DataTable.fromexcel(TEST_DATA_LOCATION, stop=3, cache=small)
+        assert small.size() <= small.max_bytes
+        assert_equal(DataTable.fromexcel(TEST_DATA_LOCATION, cache=small),
+                     DataTable.fromexcel(TEST_DATA_LOCATION))
+        assert_equal(small.hits, 1)
+        cache.clear()
+        assert_equal(cache.size(), 0)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_61memo():
+    global data
+    table = data.copy()
+    version = table.version
+    colors = table.distinct('colors')
+    assert table.distinct('colors') is colors
+    assert (table.groupby('colors').groups is
+            table.groupby('colors').groups)
+    assert_equal(table.sort('randnum'), data.sort('randnum'))
+
+    table['new'] = 1
+    assert table.version > version
+    assert table.distinct('colors') is not colors
+    for change in (lambda: table.append(table.row(0)),
+                   lambda: table.rename('new', 'newer'),
+                   lambda: table.reorder(list(reversed(table.fields))),
+                   lambda: table.sort('randnum', inplace=True),
+                   lambda: table.concat(table[:1], inplace=True),
+                   lambda: table.__delitem__('newer')):
+        version = table.version
+        change()
+        assert table.version > version
+
+    table.distinct('colors')
+    table['colors'][0] = u'ultraviolet'
+    assert u'ultraviolet' not in table.distinct('colors')
+    table.invalidate_cache()
+    assert u'ultraviolet' in table.distinct('colors')
+
+    first = table.distinct('colors', key=len)
+    for i in range(MEMO_MAX_ENTRIES):
+        table.distinct('colors', key=lambda color, i=i: (color, i))
+    assert table.distinct('colors', key=len) is not first
+
+    right = DataTable.fromcolumns(['colors', 'hex'],
+                                  [[u'red', u'blue'], [u'#f00', u'#00f']])
+    joined = table.join(right, 'colors')
+    assert_equal(table.join(right, 'colors'), joined)
+    right['hex'] = [u'#ff0000', u'#0000ff']
+    assert u'#ff0000' in table.join(right, 'colors')['hex']
+
+
+def test_62semijoin():
+    global data
+    wanted = [u'red', u'blue', None]
+    reds_and_blues = data.wherein('colors', wanted)
+    assert_equal(reds_and_blues, data.wherefunc(
+        lambda row: row['colors'] in (u'red', u'blue')))
+    assert_equal(data.wherein('colors', DataTable.fromcolumns(
+        ['colors'], [wanted])), reds_and_blues)
+    assert_equal(data.wherein('colors', iter(wanted)), reds_and_blues)
+    assert_equal(data.wherenotin('colors', set(wanted)),
+                 data.wherefunc(lambda row: row['colors'] not in wanted))
+    assert_equal(len(data.wherein('colors', [[u'red']])), 0)
+
+    table = data.copy()
+    table['colors'] = [None] + table['colors'][1:]
+    keys = DataTable.fromcolumns(['colors', 'apostle', 'other'],
+                                 [[u'red', u'blue', None],
+                                  [table['apostle'][1], u'nobody', u'judas'],
+                                  [1, 2, 3]])
+    assert_equal(table.semijoin(keys, 'colors'),
+                 table.wherein('colors', [u'red', u'blue']))
+    assert_equal(table.antijoin(keys, 'colors'),
+                 table.wherefunc(lambda row: row['colors'] not in
+                                 (u'red', u'blue')))
+    pairs = table.semijoin(keys, ['colors', 'apostle'])
+    assert_equal(len(pairs), 1 if table['colors'][1] == u'red' else 0)
+    assert_equal(len(pairs) + len(table.antijoin(keys, ['colors', 'apostle'])),
+                 len(table))
+    assert_raises(KeyError, table.semijoin, keys, 'randnum')
+
+    matched = table.semijoin(keys, 'colors')
+    for bloom in (False, True):
+        lazy = (table.lazy().semijoin(keys, 'colors', bloom=bloom)
+                            .select('apostle', 'randnum').collect())
+        assert_equal(lazy.fields, ['apostle', 'randnum'])
+        assert_equal(lazy['randnum'], matched['randnum'])
+    assert_equal(table.lazy().antijoin(keys, ['colors', 'apostle']).collect(),
+                 table.antijoin(keys, ['colors', 'apostle']))
+    assert_equal(
+        LazyTable.fromcsv(TEST_CSV_LOCATION)
+                 .semijoin(keys, 'colors', bloom=True).collect(),
+        LazyTable.fromcsv(TEST_CSV_LOCATION)
+                 .wherein('colors', [u'red', u'blue']).collect())
+
+    bloom = BloomFilter(1000)
+    bloom.update(range(1000))
+    assert all(i in bloom for i in range(1000))
+    assert sum(i in bloom for i in range(1000, 11000)) < 300
+    assert bloom.nbytes < 2000
+
+
+def test_63render():
+    data = DataTable.fromcsv(TEST_CSV_LOCATION)
+    data['price'] = [None, 1.5] * (len(data) // 2) + [2] * (len(data) % 2)
+    rows = [u"\t".join(data.fields)]
+    rows.extend(u"\t".join(map(unicode, row)) for row in data)
+    assert_equal(data.t, u"\n".join(rows))
+    assert_equal(data.jira.split(u"\n")[0],
+                 u"||" + u"||".join(data.fields) + u"||")
+    assert data.html.startswith(u"<table><tr><th>apostle</th>")
+    assert data.html.endswith(u"</td></tr></table>")
+    assert_equal(DataTable(headers=['a', 'b']).t, u"a\tb")
+
+    out = io.StringIO()
+    data.render(out, format='jira')
+    assert_equal(out.getvalue(), data.jira)
+
+    big = DataTable.fromcolumns(['a', 'b'], [range(100), [u'é'] * 100])
+    text = repr(big).decode('utf-8').split(u"\n")
+    assert_equal(len(text), 1 + 20 + 1 + 1)
+    assert_equal(text[1], u"0\té")
+    assert_equal(text[10], u"9\té")
+    assert_equal(text[11], u"...")
+    assert_equal(text[12], u"90\té")
+    assert_equal(text[-1], u"[100 rows x 2 columns]")
+    assert_equal(str(big), big.t.encode('utf-8'))
+
+    out = cStringIO.StringIO()
+    big.render(out, format='html', max_rows=3)
+    html = out.getvalue().decode('utf-8')
+    assert_equal(html.count(u"<tr>"), 1 + 3 + 1)
+    assert u'<td colspan="2">...</td>' in html
+    assert html.endswith(u"</table><p>[100 rows x 2 columns]</p>")
+    assert_raises(ValueError, big.render, out, format='pretty2')
+
+
+def test_64compare():
+    data = DataTable.fromcsv(TEST_CSV_LOCATION)
+    copied = DataTable.fromcolumns(
+        data.fields, [list(data[field]) for field in data.fields])
+    assert_equal(data, copied)
+    assert not data != copied
+    assert_equal(data, DataTable.fromcolumns(
+        data.fields, [data[field][:] for field in data.fields]))
+    assert data != data[:-1]
+    changed = copied.copy()
+    changed['randnum'] = changed['randnum'][:-1] + [-1]
+    assert data != changed
+    assert_raises(TypeError, lambda: data == [])
+
+    numbers = DataTable.fromcolumns(['a'], [array('l', range(1000))])
+    assert_equal(numbers, DataTable.fromcolumns(['a'], [range(1000)]))
+    assert_equal(numbers,
+                 DataTable.fromcolumns(['a'], [array('d', range(1000))]))
+    with numbers.share() as handle:
+        shared = handle.attach()
+        assert_equal(shared, numbers)
+        assert_equal(shared.fingerprint(), numbers.fingerprint())
+
+    assert_equal(data.fingerprint(), copied.fingerprint())
+    assert_equal(len(data.fingerprint()), 40)
+    assert data.fingerprint() != changed.fingerprint()
+    renamed = copied.copy()
+    renamed.rename('randnum', 'number')
+    assert data.fingerprint() != renamed.fingerprint()
+    assert_equal(pickle.loads(pickle.dumps(data)).fingerprint(),
+                 data.fingerprint())
+    script = ("from acrylic import DataTable; "
+              "print DataTable.fromcsv(%r).fingerprint()" % TEST_CSV_LOCATION)
+    assert_equal(subprocess.check_output([sys.executable, '-c', script],
+                                         env=dict(os.environ,
+                                                  PYTHONHASHSEED='123'))
+                 .strip(), data.fingerprint())
+
+    old = DataTable.fromcolumns(['id', 'name', 'price'],
+                                [[1, 2, 3, None], [u'a', u'b', u'c', u'd'],
+                                 [1.0, 2.0, 3.0, 4.0]])
+    new = DataTable.fromcolumns(['price', 'id', 'name'],
+                                [[2.0, 3.5, 5.0, 4.0], [2, 3, 5, None],
+                                 [u'b', u'c', u'e', u'd']])
+    diff = old.diff(new, 'id')
+    assert_equal(diff.added['id'], [5])
+    assert_equal(diff.removed['id'], [1])
+    assert_equal(diff.changed['id'], [3])
+    assert_equal(diff.changed['price'], [3.5])
+    assert_equal(len(old.diff(old, 'id').changed), 0)
+    assert_equal(old.diff(new, ['id', 'name']).changed['id'], [3])
+    assert_raises(ValueError, old.diff, old + old, 'id')
+    assert_raises(ValueError, old.diff,
+                  DataTable.fromcolumns(['id'], [[1]]), 'id')
+    assert_raises(KeyError, old.diff, old, 'nope')
+
+
+def test_65lazynulls():
+    table = DataTable.fromcolumns(['a', 'b'], [[1, None, 3, 4, None],
+                                               [u'x', u'y', None, u'x', u'z']])
+    chains = [lambda t: t.where('b', u'x'), lambda t: t.wherenot('b', u'x'),
+              lambda t: t.where('a', None), lambda t: t.wherenot('a', None),
+              lambda t: t.wheregreater('a', 1), lambda t: t.whereless('a', 4),
+              lambda t: t.wherein('b', [u'x', u'y']),
+              lambda t: t.wherenotin('b', [u'x']),
+              lambda t: t.wherefunc(col('a').isnull() | (col('a') > 3)),
+              lambda t: t.wherenotfunc(col('b').notnull()),
+              lambda t: t.wherenot('b', u'y').whereless('a', 4)]
+    for chain in chains:
+        assert_equal(chain(table.lazy()).collect(), chain(table))
+    empty = table.lazy().where('a', 7).wheregreater('a', 1).collect()
+    assert_equal(len(empty), 0)
+    assert_equal(empty.fields, ['a', 'b'])
+
+
+
+def test_66nullsafteredits():
+    table = DataTable.fromcolumns(['a'], [[1, 3, 2]])
+    assert_equal(table.nullcounts()['a'], 0)
+    assert_equal(table.sort('a')['a'], [1, 2, 3])
+    table['a'][1] = None
+    table.invalidate_cache()
+    assert_equal(table.nullcounts()['a'], 1)
+    assert_equal(table.wherenull('a')['a'], [None])
+    assert_equal(table.sort('a')['a'], [1, 2, None])
+    assert_equal(table.sort('a', nulls='first')['a'], [None, 1, 2])
+    assert_equal(table.where('a', 2)['a'], [2])
+
+    # A column resized through another table sharing it is rescanned.
+    shared = DataTable.fromcolumns(['a'], [table['a']])
+    assert_equal(shared.nullcounts()['a'], 1)
+    table.append([None])
+    assert_equal(shared.nullcounts()['a'], 2)
+    table.append([5])
+    assert_equal(table.nullcounts()['a'], 2)
+    assert_equal(table.wherenotnull('a')['a'], [1, 2, 5])
+
+
+def test_67sharedcolumns():
+    table = DataTable.fromcolumns(['a', 'b'], [[2, 1], [3, 4]])
+    assert_equal(table.distinct('a'), (2, 1))
+    assert_equal(len(table.sort('a')), 2)
+    copied = table.copy()
+    copied.append([9, 9])
+    copied['a'][0] = 7
+    assert_equal(table['a'], [2, 1])
+    assert_equal(table.distinct('a'), (2, 1))
+    assert_equal(copied, DataTable.fromcolumns(['a', 'b'],
+                                               [[7, 1, 9], [3, 4, 9]]))
+
+    # Tables built from the same column lists see each other's appends.
+    shared = DataTable.fromcolumns(['a', 'b'], table[['a', 'b']])
+    shared.append([9, None])
+    assert_equal(len(table), 3)
+    assert_equal(table.distinct('a'), (2, 1, 9))
+    assert_equal(table.sort('a')['a'], [1, 2, 9])
+    assert_equal(table.nullcounts()['b'], 1)
+    assert_equal(table.wherenull('b')['a'], [9])
+
+
+def test_68portablepickle():
+    # Numbers are encoded little-endian at a fixed width, whatever this
+    # machine's native types are.
+    kind, format, _, _, buffers = encode_column([1, -2, 300])
+    assert_equal((kind, format), ('number', 'i2'))
+    assert_equal(buffers[0], '\x01\x00\xfe\xff\x2c\x01')
+    assert_equal(encode_column([0.5])[:2], ('number', 'f8'))
+    assert_equal(decode_column(*encode_column([1, -2, 300])), [1, -2, 300])
+
+    # An array written by a machine whose 'L' is 4 bytes wide still loads.
+    foreign = ('array', 'L4', 2, None, ('\x01\x00\x00\x00\xff\xff\xff\xff',))
+    assert_equal(list(decode_column(*foreign)), [1, 2 ** 32 - 1])
+
+    # Tables pickled with native typecodes still load.
+    legacy = ('number', 'b', 3, None, (array('b', [1, 2, 3]).tostring(),))
+    assert_equal(decode_column(*legacy), [1, 2, 3])
+
+    # The constructor cache stays bounded, and evicted rows keep working.
+    row = DataTable.fromcolumns(['a'], [[1]]).row(0)
+    for i in range(CONSTRUCTOR_CACHE_SIZE + 1):
+        datarow_constructor(['f%d' % i])
+    assert len(datarow._constructors) <= CONSTRUCTOR_CACHE_SIZE
+    assert_equal(row['a'], 1)
+    assert_equal(pickle.loads(pickle.dumps(row))['a'], 1)
+
+
+def test_69wherestring():
+    # A string collection is searched for substrings, as `in` does, not
+    # turned into a set of its characters.
+    table = DataTable.fromcolumns(
+        ['colors'], [[u'red', u'blue', u'dbl', u'r', None, u'green']])
+    assert_equal(table.wherein('colors', u'redblue')['colors'],
+                 [u'red', u'blue', u'dbl', u'r'])
+    assert_equal(table.wherein('colors', u'redblue', negate=True)['colors'],
+                 [u'green'])
+    assert_equal(table.lazy().wherein('colors', u'redblue').collect(),
+                 table.wherein('colors', u'redblue'))
+    assert_equal(table.lazy().wherenotin('colors', u'redblue').collect(),
+                 table.wherenotin('colors', u'redblue'))
+
+
+def test_70memoryunhashable():
+    # Unhashable cells can't be dictionary-encoded, but are still measured
+    # in full.
+    cells = [[i * 1000] for i in range(1000)]
+    records = [{'id': i * 1000} for i in range(1000)]
+    table = DataTable.fromdict(OrderedDict([('lists', cells),
+                                            ('dicts', records)]))
+    report = table.memory_report()
+    assert_equal(report['value_bytes'][0],
+                 sum(sys.getsizeof(cell) + sys.getsizeof(cell[0])
+                     for cell in cells))
+    assert_equal(report['distinct_objects'][:2], [1000, 1000])
+    assert_equal(report['dictionary_bytes'][:2], [None, None])
+    assert report['value_bytes'][1] > 1000 * sys.getsizeof({})
+
+
+def test_71bloomwordsize():
+    # Where an unsigned long is 32 bits, the masks must fit in 32 bits.
+    saved = keysets._BLOCK_BITS, dict(keysets._mask_tables)
+    keysets._BLOCK_BITS = 32
+    keysets._mask_tables.clear()
+    try:
+        assert max(keysets._masks(7)) < 2 ** 32
+        bloom = BloomFilter(1000)
+        bloom.update(range(1000))
+        assert all(i in bloom for i in range(1000))
+        assert sum(i in bloom for i in range(1000, 11000)) < 300
+    finally:
+        keysets._BLOCK_BITS = saved[0]
+        keysets._mask_tables.clear()
+        keysets._mask_tables.update(saved[1])